@@ -0,0 +1,101 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from crawl.crawler.crawler import Crawler
+
+
+# Keeps several page requests of a `Crawler` in flight at once.
+#
+# Index crawls fetch up to `concurrency` consecutive pages in parallel; by-ID crawls
+# cannot know the next cursor before a page arrives, so they request the next page
+# as soon as the cursor is known and write the current page while it downloads.
+# Requests still go through the crawler's (shared) rate limiter, and records are
+# always written -- and recovery positions saved -- in page order.
+class AsyncCrawler:
+    def __init__(self, crawler: Crawler, concurrency: int = 4):
+        self.crawler = crawler
+        self.concurrency = max(1, concurrency)
+
+    def crawl(self, agent: str, recover: bool = False):
+        if recover:
+            self.crawler.recover_position()
+
+        self.crawler.open_output()
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        finished = False
+
+        try:
+            if self.crawler.page_type == 'index':
+                asyncio.run(self.crawl_index(agent, executor))
+            else:
+                asyncio.run(self.crawl_by_id(agent, executor))
+
+            self.crawler.save_high_water_mark()
+            finished = True
+        finally:
+            executor.shutdown(wait=True)
+            self.crawler.close_output(finished)
+
+    async def crawl_index(self, agent: str, executor: ThreadPoolExecutor):
+        loop = asyncio.get_running_loop()
+        c = self.crawler
+        pending = {}
+        next_page = c.cur_index
+
+        try:
+            while True:
+                while len(pending) < self.concurrency:
+                    url = c.get_page_url(next_page, c.next_id)
+                    pending[next_page] = loop.run_in_executor(executor, c.fetch_url, url, agent, next_page)
+                    next_page += 1
+
+                result = await pending.pop(c.cur_index)
+                records = c.get_records(result) if result is not None else []
+
+                if len(records) == 0:
+                    break
+
+                prev_id = c.next_id
+
+                c.last_response = result
+                c.save_page(records)
+                c.cur_index += 1
+                c.save_position()
+
+                if c.next_id == prev_id or c.exhausted:
+                    break
+        finally:
+            # pages past the end of the crawl are discarded
+            for future in pending.values():
+                future.cancel()
+
+            await asyncio.gather(*pending.values(), return_exceptions=True)
+
+    async def crawl_by_id(self, agent: str, executor: ThreadPoolExecutor):
+        loop = asyncio.get_running_loop()
+        c = self.crawler
+
+        url = c.get_page_url(c.cur_index, c.next_id)
+        future = loop.run_in_executor(executor, c.fetch_url, url, agent, c.cur_index)
+
+        while future is not None:
+            result = await future
+            future = None
+
+            records = c.get_records(result) if result is not None else []
+
+            if len(records) == 0:
+                break
+
+            next_id = c.get_next_id(records)
+
+            # prefetch the next cursor before writing this page
+            if next_id != c.next_id and not c.exhausted:
+                url = c.get_page_url(c.cur_index + 1, next_id)
+                future = loop.run_in_executor(executor, c.fetch_url, url, agent, c.cur_index + 1)
+
+            c.last_response = result
+            c.save_page(records)
+            c.cur_index += 1
+            c.save_position()
@@ -0,0 +1,71 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Callable, List, Optional
+
+from crawl.crawler.async_crawler import AsyncCrawler
+from crawl.crawler.crawler import Crawler
+from utils.rate_limiter import PriorityRateLimiter
+
+# crawl types of a bundle, smallest first; posts take the longest and get the lowest priority
+bundle_types = ['aliases', 'implications', 'tags', 'posts']
+
+
+def get_bundle_filename(output_dir: str, crawl_type: str) -> str:
+    return os.path.join(output_dir, f'{crawl_type}.jsonl')
+
+
+# Crawls all metadata endpoints of a source (tags, aliases, implications, posts) at the same time,
+# each into its own `<output_dir>/<type>.jsonl` file.
+#
+# The crawls share the per-host rate limit. The small endpoints get priority on it, so the tag data is
+# complete early on, while the post crawl uses whatever request budget the others leave unused.
+class BundleCrawler:
+    def __init__(self, create_crawler: Callable[[str, str], Optional[Crawler]], output_dir: str, concurrency: int = 1):
+        self.output_dir = output_dir
+        self.concurrency = max(1, concurrency)
+        self.crawlers: Dict[str, Crawler] = {}
+
+        shared_limiters: Dict[int, PriorityRateLimiter] = {}
+
+        for (priority, crawl_type) in enumerate(bundle_types):
+            c = create_crawler(crawl_type, get_bundle_filename(output_dir, crawl_type))
+
+            # not every source has every endpoint
+            if c is None:
+                continue
+
+            if id(c.rate_limiter) not in shared_limiters:
+                shared_limiters[id(c.rate_limiter)] = PriorityRateLimiter(c.rate_limiter)
+
+            c.rate_limiter = shared_limiters[id(c.rate_limiter)].get_limiter(priority)
+            self.crawlers[crawl_type] = c
+
+    def crawl(self, agent: str, recover: bool = False):
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        started_at = time.time()
+        print(f'Crawling {", ".join(self.crawlers.keys())} into {self.output_dir}')
+
+        with ThreadPoolExecutor(max_workers=len(self.crawlers)) as executor:
+            futures = {crawl_type: executor.submit(self.crawl_type, crawl_type, agent, recover, started_at) for crawl_type in self.crawlers.keys()}
+            errors: List[str] = []
+
+            for (crawl_type, future) in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(f'{crawl_type}: {e}')
+
+        if len(errors) > 0:
+            raise Exception(f'Failed to crawl {", ".join(errors)}')
+
+    def crawl_type(self, crawl_type: str, agent: str, recover: bool, started_at: float):
+        c = self.crawlers[crawl_type]
+
+        if self.concurrency > 1:
+            AsyncCrawler(c, concurrency=self.concurrency).crawl(agent, recover=recover)
+        else:
+            c.crawl(agent, recover=recover)
+
+        print(f'Finished crawling {crawl_type} ({c.record_count} record(s)) after {round(time.time() - started_at, 1)}s')
@@ -1,31 +1,41 @@
 import os
-from typing import Optional
-from datetime import timedelta
+import time
+from typing import Optional, List, Callable
 
 from furl import furl
-import ndjson
 from urllib3.util import Retry
 import requests
 from requests.adapters import HTTPAdapter
-from call_throttle import throttle
 import json
 
+from crawl.crawler.metrics import CrawlMetrics
+from crawl.crawler.projection import Projection, project
+from crawl.crawler.raw_records import RawRecords, extract_records
+from crawl.crawler.response_cache import ResponseCache
+from utils.jsonl_segments import SegmentedJsonlWriter, open_jsonl_writer, expand_inputs, get_jsonl_size, truncate_jsonl
+from utils.rate_limiter import AdaptiveRateLimiter, get_rate_limiter
+
 
 class Crawler:
-    fp = None
     writer = None
     last_response = None
     cur_index = 0
     record_count = 0
+    exhausted = False
+    high_water_mark = None
 
     session = requests.Session()
 
+    # 429 and 503 responses are left to the adaptive rate limiter
     retries = Retry(
         total=5,
         backoff_factor=0.5,
-        status_forcelist=[104, 500, 502, 503, 504],
+        status_forcelist=[104, 500, 502, 504],
+        respect_retry_after_header=False
     )
 
+    max_rejections = 10
+
     def __init__(self,
         output_file: str,
         base_url: str,
@@ -35,7 +45,18 @@ class Crawler:
         result_id_field: str = 'id',
         json_field: Optional[str] = 'posts',
         next_id: Optional[str] = None,
-        page_field_prefix: str = ''
+        page_field_prefix: str = '',
+        rate_limiter: Optional[AdaptiveRateLimiter] = None,
+        min_id: Optional[int] = None,
+        cache: Optional[ResponseCache] = None,
+        save_jsonl: bool = True,
+        metrics: Optional[CrawlMetrics] = None,
+        shard_index: int = 0,
+        shard_count: int = 1,
+        save_index: bool = True,
+        projection: Optional[Projection] = None,
+        sync_interval: int = 10,
+        segment_size: Optional[int] = None
     ):
         self.output_file = output_file
         self.base_url = base_url
@@ -46,55 +67,196 @@ class Crawler:
         self.result_id_field = result_id_field
         self.json_field = json_field
         self.page_field_prefix = page_field_prefix
+        self.min_id = min_id
+        self.cache = cache
+        self.save_jsonl = save_jsonl
+        self.save_index = save_index
+
+        # write segments of about `segment_size` bytes instead of a single output file (see `jsonl_segments.py`)
+        self.segment_size = segment_size
+        self.metrics = metrics or CrawlMetrics()
+
+        # index crawls only visit every `shard_count`th page, starting at page `shard_index`
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+
+        # the output and the recovery position are fsynced every `sync_interval` pages (and when the crawl ends)
+        self.sync_interval = max(1, sync_interval)
+
+        # fields kept in the output file (see `projection.py`); None keeps the records as crawled
+        self.projection = projection
+
+        # called with the records of every crawled page, in page order
+        self.page_handlers: List[Callable[[List[dict]], None]] = []
+
+        # max 3 requests/s, shared by all crawlers (and image downloads) talking to the same site
+        self.rate_limiter = rate_limiter or get_rate_limiter(furl(base_url).host, calls=9, period=3)
 
         self.adapter = HTTPAdapter(max_retries=self.retries)
         self.session.mount('http://', self.adapter)
         self.session.mount('https://', self.adapter)
 
     def crawl(self, agent: str, recover: bool = False):
-        os.makedirs(os.path.dirname(self.output_file), exist_ok=True)
+        # recovery may cut the output back to the last saved position, so it comes before opening it
+        if recover:
+            self.recover_position()
 
-        self.fp = open(self.output_file, 'a')
-        self.writer = ndjson.writer(self.fp)
+        self.open_output()
         result = True
 
-        if recover:
-            self.recover_position()
+        finished = False
+
+        try:
+            while result is not None:
+                result = self.fetch(agent)
+                prev_id = self.next_id
+
+                if result is not None:
+                    records = self.get_records(result)
 
-        while result is not None:
-            result = self.fetch(agent)
-            prev_id = self.next_id
+                    if len(records) == 0:
+                        break
 
-            if result is not None:
-                records = result.get(self.json_field, []) if self.json_field is not None else result
+                    self.last_response = result
+                    self.save_page(records)
 
-                if len(records) == 0:
+                self.cur_index += 1
+                self.save_position()
+
+                if self.next_id == prev_id or self.exhausted:
                     break
 
-                self.last_response = result
-                self.save_json(records)
-                self.next_id = records[-1][self.result_id_field]
-                self.record_count += len(records)
+            self.save_high_water_mark()
+            finished = True
+        finally:
+            self.close_output(finished)
 
-            self.cur_index += 1
-            self.save_position()
+    def open_output(self):
+        os.makedirs(os.path.dirname(self.output_file), exist_ok=True)
 
-            if self.next_id == prev_id:
-                break
+        if self.save_jsonl:
+            self.writer = open_jsonl_writer(self.output_file, self.result_id_field, segment_size=self.segment_size, save_index=self.save_index)
+
+        self.high_water_mark = self.load_high_water_mark(scan=False)
+
+    def close_output(self, finished: bool = True):
+        if isinstance(self.writer, SegmentedJsonlWriter):
+            # the last segment of an interrupted crawl is continued on recovery
+            self.writer.close(finish=finished)
+        elif self.writer is not None:
+            self.writer.sync()
+            self.writer.close()
+
+        self.writer = None
 
-        self.fp.close()
         print(f'Crawled {self.cur_index} page(s) and found {self.record_count} record(s)')
 
-    # max 3 requests/s
-    @throttle(calls=9, period=timedelta(seconds=3))
+        self.metrics.save(force=True)
+        print(self.metrics.get_summary())
+
+    def get_records(self, result) -> list:
+        records = None
+
+        # raw responses are split into records without encoding them again when they are written
+        if isinstance(result, bytes):
+            try:
+                records = extract_records(result, self.json_field)
+            except (ValueError, IndexError, StopIteration):
+                result = json.loads(result)
+
+        if records is None:
+            records = result.get(self.json_field, []) if self.json_field is not None else result
+
+        # by-ID crawls walk downwards; stop once the walk crosses the lower bound
+        if self.min_id is not None:
+            def in_bounds(record: dict) -> bool:
+                return int(record[self.result_id_field]) >= self.min_id
+
+            in_range = records.filter(in_bounds) if isinstance(records, RawRecords) else [record for record in records if in_bounds(record)]
+
+            if len(in_range) < len(records):
+                self.exhausted = True
+
+            records = in_range
+
+        return records
+
+    def save_page(self, records):
+        started_at = time.time()
+
+        if self.save_jsonl:
+            self.save_json(records)
+
+        written_at = time.time()
+
+        for handler in self.page_handlers:
+            handler(records)
+
+        self.metrics.record_page(len(records), written_at - started_at, time.time() - written_at)
+
+        self.next_id = self.get_next_id(records)
+        self.record_count += len(records)
+
+        max_id = max([int(record[self.result_id_field]) for record in records])
+
+        if self.high_water_mark is None or max_id > self.high_water_mark:
+            self.high_water_mark = max_id
+
+    def get_next_id(self, records):
+        # 'a<id>' cursors walk upwards, regardless of the order of the records within a page
+        if self.page_type == 'by_id' and self.page_field_prefix == 'a':
+            return max([record[self.result_id_field] for record in records], key=int)
+
+        return records[-1][self.result_id_field]
+
+    def since(self, max_id: int):
+        """
+        Only crawl records newer than `max_id`: `b<id>` crawls walk upwards from `a<max_id>`, other
+        crawls stop at the first record that is not newer than `max_id`.
+        """
+        if self.page_type == 'by_id' and self.page_field_prefix == 'b':
+            self.page_field_prefix = 'a'
+            self.next_id = str(max_id)
+        else:
+            self.min_id = max_id + 1
+
     def fetch(self, agent: str):
-        url = self.get_url()
+        return self.fetch_url(self.get_url(), agent, self.cur_index)
+
+    def fetch_url(self, url: str, agent: str, page_index: int):
+        cached = self.cache.load(url) if self.cache is not None else None
 
-        print(f'[#{self.cur_index + 1}] Fetching {url}')
+        if cached is not None and self.cache.trust:
+            print(f'[#{page_index + 1}] Using cached {url}')
+            self.metrics.record_cache_hit()
+            return cached.body
 
-        r = requests.get(url, headers={
+        headers = {
             'user-agent': agent  ## 'e621-crawler/1.0 (by @hearmeneigh)'
-        })
+        }
+
+        if cached is not None:
+            headers.update(cached.get_conditional_headers())
+
+        for attempt in range(self.max_rejections):
+            self.metrics.record_throttle(self.rate_limiter.acquire())
+
+            print(f'[#{page_index + 1}] Fetching {url}')
+
+            started_at = time.time()
+            r = self.session.get(url, headers=headers)
+            self.metrics.record_request(time.time() - started_at, len(r.content), r.status_code)
+
+            if not self.rate_limiter.feedback(r.status_code, r.headers):
+                break
+
+            self.metrics.record_retry()
+
+            print(f'[#{page_index + 1}] Rate limited with status code {r.status_code}, slowing down to {round(self.rate_limiter.rate, 2)} requests/s')
+
+        if r.status_code == 304 and cached is not None:
+            self.metrics.record_cache_hit()
+            return cached.body
 
         if r.status_code != 200:
             if r.status_code == 404:
@@ -102,31 +264,119 @@ class Crawler:
 
             raise Exception(f'Failed to crawl {url} with status code {r.status_code}')
 
-        return r.json()
+        if self.cache is not None:
+            self.cache.save(url, r.content, r.headers)
+
+        # decoded by `get_records`
+        return r.content
 
     def get_url(self):
-        index = self.cur_index if self.page_type == 'index' else self.next_id
+        return self.get_page_url(self.cur_index, self.next_id)
+
+    def get_page_url(self, cur_index: int, next_id: Optional[str]):
+        index = cur_index * self.shard_count + self.shard_index if self.page_type == 'index' else next_id
 
-        if self.index_type == 'one' and index is not None:
+        # one-based page numbers; by-ID cursors are used as-is
+        if self.index_type == 'one' and self.page_type == 'index' and index is not None:
             index = int(index) + 1
 
         url = furl(self.base_url)
 
         if index is not None:
-            url.add({f'{self.page_field}': f'{self.page_field_prefix}{str(index)}'})
+            value = f'{self.page_field_prefix}{str(index)}'
+
+            # cursors in the search query are appended to it (e.g. `tags=some_tag id:<1234`)
+            if url.args.get(self.page_field, '') != '':
+                value = f'{url.args[self.page_field]} {value}'
+
+            url.args[self.page_field] = value
 
         return str(url)
 
     def save_json(self, records):
-        for row in records:
-            self.writer.writerow(row)
+        # projected records have to be encoded again; page handlers still get the full records
+        if self.projection is not None:
+            for row in records:
+                self.writer.writerow(project(row, self.projection))
+        elif isinstance(records, RawRecords):
+            for (row, raw) in zip(records, records.raw):
+                self.writer.write_line(raw + b'\n', row)
+        else:
+            for row in records:
+                self.writer.writerow(row)
 
     def get_recover_filename(self):
         return self.output_file + '.recovery'
 
     def save_position(self):
-        with open(self.get_recover_filename(), 'w') as fp:
-            json.dump({'cur_index': self.cur_index, 'next_id': self.next_id}, fp)
+        sync = self.cur_index % self.sync_interval == 0
+        offset = None
+
+        # the records of the saved pages have to be on disk before the position that points past them
+        if self.writer is not None:
+            if sync:
+                self.writer.sync()
+            else:
+                self.writer.flush()
+
+            offset = self.writer.offset
+
+        self.write_atomic(self.get_recover_filename(), json.dumps({'cur_index': self.cur_index, 'next_id': self.next_id, 'offset': offset}), sync)
+
+        # segments end at a saved position, so that recovery never has to reopen a finished segment
+        if isinstance(self.writer, SegmentedJsonlWriter):
+            self.writer.rotate_if_full()
+
+        # upward walks never revisit lower IDs, so an interrupted crawl can continue from here
+        if self.page_type == 'by_id' and self.page_field_prefix == 'a':
+            self.save_high_water_mark()
+
+    def write_atomic(self, filename: str, data: str, sync: bool = False):
+        tmp_filename = f'{filename}.tmp'
+
+        with open(tmp_filename, 'w') as fp:
+            fp.write(data)
+
+            if sync:
+                fp.flush()
+                os.fsync(fp.fileno())
+
+        os.replace(tmp_filename, filename)
+
+    def get_high_water_mark_filename(self):
+        return self.output_file + '.hwm'
+
+    def save_high_water_mark(self):
+        if self.high_water_mark is None:
+            return
+
+        self.write_atomic(self.get_high_water_mark_filename(), json.dumps({'max_id': self.high_water_mark}))
+
+    def load_high_water_mark(self, scan: bool = True) -> Optional[int]:
+        fn = self.get_high_water_mark_filename()
+
+        if os.path.isfile(fn):
+            with open(fn, 'r') as fp:
+                return int(json.load(fp)['max_id'])
+
+        if not scan or get_jsonl_size(self.output_file) is None:
+            return None
+
+        # no sidecar file (e.g. output from an older version); find the highest ID the slow way
+        max_id = None
+
+        for fn in expand_inputs([self.output_file]):
+            with open(fn, 'rt', encoding='utf-8') as fp:
+                for line in fp:
+                    if line.strip() == '':
+                        continue
+
+                    record_id = int(json.loads(line)[self.result_id_field])
+
+                    if max_id is None or record_id > max_id:
+                        max_id = record_id
+
+        return max_id
 
     def recover_position(self):
         fn = self.get_recover_filename()
@@ -138,3 +388,15 @@ class Crawler:
             data = json.load(fp)
             self.cur_index = int(data.get('cur_index', '0'))
             self.next_id = data.get('next_id', None)
+
+        offset = data.get('offset')
+
+        # records written after the last saved position are crawled again, so they are cut off rather than duplicated
+        size = get_jsonl_size(self.output_file)
+
+        if offset is not None and size is not None:
+            if size > offset:
+                print(f'Removing {size - offset} byte(s) written after the last saved position from {self.output_file}')
+                truncate_jsonl(self.output_file, offset)
+            elif size < offset:
+                print(f'{self.output_file} is shorter than at the last saved position ({size} < {offset} bytes); records of the last pages may be missing')
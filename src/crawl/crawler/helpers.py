@@ -1,6 +1,7 @@
 from typing import Optional
 
 from crawl.crawler.crawler import Crawler
+from crawl.crawler.projection import e621_post_projection, danbooru_post_projection, gelbooru_post_projection, rule34_post_projection
 import urllib.parse
 
 
@@ -10,7 +11,8 @@ def get_e926_index_crawler(output_file: str):
         base_url='https://e926.net/posts.json?limit=320',
         page_type='by_id',
         page_field='page',
-        page_field_prefix='b'
+        page_field_prefix='b',
+        projection=e621_post_projection
     )
 
 
@@ -18,8 +20,10 @@ def get_e926_search_crawler(output_file: str, search_query: str):
     return Crawler(
         output_file=output_file,
         base_url='https://e926.net/posts.json?limit=320&tags=' + urllib.parse.quote(search_query, ''),
-        page_type='index',
-        page_field='page'
+        page_type='by_id',
+        page_field='page',
+        page_field_prefix='b',
+        projection=e621_post_projection
     )
 
 
@@ -49,8 +53,9 @@ def get_e926_implications_crawler(output_file: str):
     return Crawler(
         output_file=output_file,
         base_url='https://e926.net/tag_implications.json?limit=320',
-        page_type='index',
+        page_type='by_id',
         page_field='page',
+        page_field_prefix='b',
         json_field=None
     )
 
@@ -61,7 +66,8 @@ def get_e621_index_crawler(output_file: str):
         base_url='https://e621.net/posts.json?limit=320',
         page_type='by_id',
         page_field='page',
-        page_field_prefix='b'
+        page_field_prefix='b',
+        projection=e621_post_projection
     )
 
 
@@ -69,8 +75,10 @@ def get_e621_search_crawler(output_file: str, search_query: str):
     return Crawler(
         output_file=output_file,
         base_url='https://e621.net/posts.json?limit=320&tags=' + urllib.parse.quote(search_query, ''),
-        page_type='index',
-        page_field='page'
+        page_type='by_id',
+        page_field='page',
+        page_field_prefix='b',
+        projection=e621_post_projection
     )
 
 
@@ -100,8 +108,9 @@ def get_e621_implications_crawler(output_file: str):
     return Crawler(
         output_file=output_file,
         base_url='https://e621.net/tag_implications.json?limit=320',
-        page_type='index',
+        page_type='by_id',
         page_field='page',
+        page_field_prefix='b',
         json_field=None
     )
 
@@ -110,9 +119,11 @@ def get_gelbooru_search_crawler(output_file: str, search_query: str):
     return Crawler(
         output_file=output_file,
         base_url='https://gelbooru.com/index.php?page=dapi&s=post&q=index&json=1&limit=100&tags=' + urllib.parse.quote(search_query),
-        page_type='index',
-        page_field='pid',
-        json_field='post'
+        page_type='by_id',
+        page_field='tags',
+        page_field_prefix='id:<',
+        json_field='post',
+        projection=gelbooru_post_projection
     )
 
 
@@ -120,9 +131,11 @@ def get_gelbooru_index_crawler(output_file: str):
     return Crawler(
         output_file=output_file,
         base_url='https://gelbooru.com/index.php?page=dapi&s=post&q=index&json=1&limit=100',
-        page_type='index',
-        page_field='pid',
-        json_field='post'
+        page_type='by_id',
+        page_field='tags',
+        page_field_prefix='id:<',
+        json_field='post',
+        projection=gelbooru_post_projection
     )
 
 
@@ -131,6 +144,7 @@ def get_gelbooru_tag_crawler(output_file: str):
         output_file=output_file,
         base_url='https://gelbooru.com/index.php?page=dapi&s=tag&q=index&json=1&limit=100',
         page_type='index',
+        index_type='zero',
         page_field='pid',
         json_field='tag'
     )
@@ -140,9 +154,11 @@ def get_danbooru_search_crawler(output_file: str, search_query: str):
     return Crawler(
         output_file=output_file,
         base_url='https://danbooru.donmai.us/posts.json?limit=200&tags=' + urllib.parse.quote(search_query),
-        page_type='index',
+        page_type='by_id',
         page_field='page',
-        json_field=None
+        page_field_prefix='b',
+        json_field=None,
+        projection=danbooru_post_projection
     )
 
 
@@ -153,7 +169,8 @@ def get_danbooru_index_crawler(output_file: str):
         page_type='by_id',
         page_field='page',
         page_field_prefix='b',
-        json_field=None
+        json_field=None,
+        projection=danbooru_post_projection
     )
 
 
@@ -161,8 +178,9 @@ def get_danbooru_tag_crawler(output_file: str):
     return Crawler(
         output_file=output_file,
         base_url='https://danbooru.donmai.us/tags.json?limit=200',
-        page_type='index',
+        page_type='by_id',
         page_field='page',
+        page_field_prefix='b',
         json_field=None
     )
 
@@ -171,9 +189,11 @@ def get_rule34_search_crawler(output_file: str, search_query: str):
     return Crawler(
         output_file=output_file,
         base_url='https://api.rule34.xxx/index.php?page=dapi&s=post&q=index&limit=1000&json=1&tags=' + urllib.parse.quote(search_query),
-        page_type='index',
-        page_field='pid',
-        json_field=None
+        page_type='by_id',
+        page_field='tags',
+        page_field_prefix='id:<',
+        json_field=None,
+        projection=rule34_post_projection
     )
 
 
@@ -181,9 +201,11 @@ def get_rule34_index_crawler(output_file: str):
     return Crawler(
         output_file=output_file,
         base_url='https://api.rule34.xxx/index.php?page=dapi&s=post&q=index&limit=1000&json=1',
-        page_type='index',
-        page_field='pid',
-        json_field=None
+        page_type='by_id',
+        page_field='tags',
+        page_field_prefix='id:<',
+        json_field=None,
+        projection=rule34_post_projection
     )
 
 
@@ -192,6 +214,7 @@ def get_rule34_tag_crawler(output_file: str):
         output_file=output_file,
         base_url='https://api.rule34.xxx/index.php?page=dapi&s=tag&q=index&limit=100&json=1',
         page_type='index',
+        index_type='zero',
         page_field='pid',
         json_field=None
     )
@@ -228,14 +251,14 @@ def get_crawler(source: str, type: str, output_file: str, search_query: Optional
         elif type == 'tags':
             return get_gelbooru_tag_crawler(output_file)
     elif source == 'danbooru':
-        if type == 'index':
+        if type == 'posts':
             return get_danbooru_index_crawler(output_file)
         elif type == 'search':
             return get_danbooru_search_crawler(output_file, search_query)
         elif type == 'tags':
             return get_danbooru_tag_crawler(output_file)
     elif source == 'rule34':
-        if type == 'index':
+        if type == 'posts':
             return get_rule34_index_crawler(output_file)
         elif type == 'search':
             return get_rule34_search_crawler(output_file, search_query)
@@ -0,0 +1,84 @@
+import heapq
+import json
+import os
+import tempfile
+from typing import List, Tuple, Iterator
+
+from utils.jsonl_index import get_index_filename, update_index
+
+
+def merge_jsonl(input_files: List[str], output_file: str, id_field: str = 'id', descending: bool = True, run_size: int = 250000) -> Tuple[int, int]:
+    """
+    Merge JSONL crawl outputs into one ID-ordered file without duplicates (external merge sort,
+    so the inputs do not need to fit into memory). If several inputs contain the same ID, the
+    record from the first input is kept. Returns the number of records written and duplicates skipped.
+    """
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    os.makedirs(output_dir, exist_ok=True)
+
+    with tempfile.TemporaryDirectory(dir=output_dir, prefix='.merge-') as tmp_dir:
+        runs = []
+        run = []
+
+        for input_file in input_files:
+            with open(input_file, 'rt', encoding='utf-8') as fp:
+                for line in fp:
+                    if line.strip() == '':
+                        continue
+
+                    line = line.rstrip('\n')
+                    run.append((int(json.loads(line)[id_field]), line))
+
+                    if len(run) >= run_size:
+                        runs.append(write_run(run, tmp_dir, len(runs), descending))
+                        run = []
+
+        if len(run) > 0:
+            runs.append(write_run(run, tmp_dir, len(runs), descending))
+
+        record_count = 0
+        duplicate_count = 0
+        last_id = None
+        tmp_file = output_file + '.merging'
+
+        # heapq.merge is stable, so records from earlier inputs come first among equal IDs
+        run_iterators = [read_run(fn) for fn in runs]
+        merged = heapq.merge(*run_iterators, key=lambda item: -item[0] if descending else item[0])
+
+        with open(tmp_file, 'wt', encoding='utf-8') as out_fp:
+            for (record_id, line) in merged:
+                if record_id == last_id:
+                    duplicate_count += 1
+                    continue
+
+                out_fp.write(line + '\n')
+                record_count += 1
+                last_id = record_id
+
+        os.replace(tmp_file, output_file)
+
+    # the old index (if any) describes the replaced file
+    if os.path.exists(get_index_filename(output_file)):
+        os.remove(get_index_filename(output_file))
+
+    update_index(output_file, id_field)
+
+    return record_count, duplicate_count
+
+
+def write_run(run: List[Tuple[int, str]], tmp_dir: str, index: int, descending: bool) -> str:
+    fn = os.path.join(tmp_dir, f'run-{index:05d}')
+    run.sort(key=lambda item: item[0], reverse=descending)
+
+    with open(fn, 'wt', encoding='utf-8') as fp:
+        for (record_id, line) in run:
+            fp.write(f'{record_id}\t{line}\n')
+
+    return fn
+
+
+def read_run(filename: str) -> Iterator[Tuple[int, str]]:
+    with open(filename, 'rt', encoding='utf-8') as fp:
+        for line in fp:
+            (record_id, record) = line.rstrip('\n').split('\t', 1)
+            yield int(record_id), record
@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+latency_buckets = [0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0]
+
+
+# Collects crawl throughput and latency numbers: request latency, response sizes,
+# records per page, retries, and the time spent waiting for the rate limiter, writing
+# the output and running page handlers. If `output_file` is set, the numbers are
+# periodically written to `<output_file>.metrics.json` and `<output_file>.prom`
+# (Prometheus text format).
+class CrawlMetrics:
+    def __init__(self, output_file: Optional[str] = None, interval: float = 10.0):
+        self.output_file = output_file
+        self.interval = interval
+        self.lock = threading.Lock()
+
+        self.started_at = time.time()
+        self.saved_at = 0.0
+
+        self.requests = 0
+        self.request_seconds = 0.0
+        self.max_request_seconds = 0.0
+        self.latency_counts = [0 for _ in latency_buckets]
+        self.response_bytes = 0
+        self.status_codes = {}
+        self.retries = 0
+        self.cache_hits = 0
+
+        self.pages = 0
+        self.records = 0
+        self.max_page_records = 0
+
+        self.throttle_seconds = 0.0
+        self.write_seconds = 0.0
+        self.handler_seconds = 0.0
+
+    def record_request(self, seconds: float, size: int, status_code: int):
+        with self.lock:
+            self.requests += 1
+            self.request_seconds += seconds
+            self.max_request_seconds = max(self.max_request_seconds, seconds)
+            self.response_bytes += size
+            self.status_codes[str(status_code)] = self.status_codes.get(str(status_code), 0) + 1
+
+            for (index, bucket) in enumerate(latency_buckets):
+                if seconds <= bucket:
+                    self.latency_counts[index] += 1
+
+    def record_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    def record_cache_hit(self):
+        with self.lock:
+            self.cache_hits += 1
+
+    def record_throttle(self, seconds: float):
+        with self.lock:
+            self.throttle_seconds += seconds
+
+    def record_page(self, records: int, write_seconds: float, handler_seconds: float):
+        with self.lock:
+            self.pages += 1
+            self.records += records
+            self.max_page_records = max(self.max_page_records, records)
+            self.write_seconds += write_seconds
+            self.handler_seconds += handler_seconds
+
+        self.save()
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            elapsed = max(time.time() - self.started_at, 0.001)
+
+            return {
+                'elapsed_seconds': round(elapsed, 3),
+                'requests': self.requests,
+                'requests_per_second': round(self.requests / elapsed, 3),
+                'request_seconds': round(self.request_seconds, 3),
+                'mean_request_seconds': round(self.request_seconds / self.requests, 3) if self.requests > 0 else None,
+                'max_request_seconds': round(self.max_request_seconds, 3),
+                'response_bytes': self.response_bytes,
+                'status_codes': dict(self.status_codes),
+                'retries': self.retries,
+                'cache_hits': self.cache_hits,
+                'pages': self.pages,
+                'records': self.records,
+                'records_per_second': round(self.records / elapsed, 3),
+                'mean_page_records': round(self.records / self.pages, 1) if self.pages > 0 else None,
+                'max_page_records': self.max_page_records,
+                'throttle_seconds': round(self.throttle_seconds, 3),
+                'write_seconds': round(self.write_seconds, 3),
+                'handler_seconds': round(self.handler_seconds, 3)
+            }
+
+    def to_prometheus(self) -> str:
+        data = self.to_dict()
+
+        with self.lock:
+            latency_counts = list(self.latency_counts)
+
+        lines = [
+            '# TYPE dr_crawl_requests_total counter',
+            f'dr_crawl_requests_total {data["requests"]}',
+            '# TYPE dr_crawl_request_seconds histogram'
+        ]
+
+        for (bucket, count) in zip(latency_buckets, latency_counts):
+            lines.append(f'dr_crawl_request_seconds_bucket{{le="{bucket}"}} {count}')
+
+        lines += [
+            f'dr_crawl_request_seconds_bucket{{le="+Inf"}} {data["requests"]}',
+            f'dr_crawl_request_seconds_sum {data["request_seconds"]}',
+            f'dr_crawl_request_seconds_count {data["requests"]}',
+            '# TYPE dr_crawl_responses_total counter'
+        ]
+
+        for (status_code, count) in sorted(data['status_codes'].items()):
+            lines.append(f'dr_crawl_responses_total{{code="{status_code}"}} {count}')
+
+        for name in ['response_bytes', 'retries', 'cache_hits', 'pages', 'records']:
+            lines += [f'# TYPE dr_crawl_{name}_total counter', f'dr_crawl_{name}_total {data[name]}']
+
+        for name in ['throttle_seconds', 'write_seconds', 'handler_seconds']:
+            lines += [f'# TYPE dr_crawl_{name}_total counter', f'dr_crawl_{name}_total {data[name]}']
+
+        return '\n'.join(lines) + '\n'
+
+    def save(self, force: bool = False):
+        if self.output_file is None:
+            return
+
+        now = time.time()
+
+        if not force and now - self.saved_at < self.interval:
+            return
+
+        self.saved_at = now
+
+        self.write_atomic(self.output_file + '.metrics.json', json.dumps(self.to_dict(), indent=2))
+        self.write_atomic(self.output_file + '.prom', self.to_prometheus())
+
+    def write_atomic(self, filename: str, data: str):
+        tmp_filename = f'{filename}.{threading.get_ident()}.tmp'
+
+        with open(tmp_filename, 'w') as fp:
+            fp.write(data)
+
+        os.replace(tmp_filename, filename)
+
+    def get_summary(self) -> str:
+        data = self.to_dict()
+        elapsed = data['elapsed_seconds']
+
+        return '\n'.join([
+            f'{data["requests"]} request(s), {data["pages"]} page(s), {data["records"]} record(s) in {elapsed}s '
+            f'({data["requests_per_second"]} requests/s, {data["records_per_second"]} records/s)',
+            f'Latency: mean {data["mean_request_seconds"]}s, max {data["max_request_seconds"]}s; '
+            f'{round(data["response_bytes"] / 1024 / 1024, 1)} MB received; {data["retries"]} retries; {data["cache_hits"]} cache hits',
+            f'Time spent: {data["request_seconds"]}s in requests, {data["throttle_seconds"]}s in the rate limiter, '
+            f'{data["write_seconds"]}s writing output, {data["handler_seconds"]}s in page handlers'
+        ])
@@ -0,0 +1,403 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, List, Tuple, Dict, Mapping
+from urllib.parse import urlparse, parse_qs
+
+from furl import furl
+
+from utils.rate_limiter import TokenBucket
+
+epoch = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+ratings = ['s', 'q', 'e']
+gelbooru_ratings = {'s': 'general', 'q': 'questionable', 'e': 'explicit'}
+
+
+class MockPost:
+    def __init__(self, id: int, tags: List[int], rating: str, score: int, width: int, height: int):
+        self.id = id
+        self.tags = tags
+        self.rating = rating
+        self.score = score
+        self.width = width
+        self.height = height
+
+
+class MockBooruCorpus:
+    """
+    Synthetic, deterministic set of posts, tags, aliases and implications (IDs with gaps, newest first)
+    """
+    def __init__(self, post_count: int = 10000, tag_count: int = 500, seed: int = 0):
+        rng = random.Random(seed)
+
+        self.tag_names = [f'tag_{index:04d}' for index in range(tag_count)]
+        self.tag_categories = [rng.choice([0, 0, 0, 1, 4, 5]) for _ in range(tag_count)]
+
+        # a few tags are very common, most are rare
+        tag_weights = [1 / (index + 1) for index in range(tag_count)]
+
+        self.posts: List[MockPost] = []
+        post_id = 0
+
+        for _ in range(post_count):
+            post_id += rng.choice([1, 1, 1, 2, 3, 7])
+            tags = sorted(set(rng.choices(range(tag_count), weights=tag_weights, k=rng.randint(3, 30))))
+            width = rng.randint(400, 4000)
+
+            self.posts.append(MockPost(post_id, tags, rng.choice(ratings), rng.randint(-5, 500), width, int(width * rng.uniform(0.5, 2))))
+
+        self.posts.reverse()
+
+        self.tag_post_counts = [0 for _ in range(tag_count)]
+
+        for post in self.posts:
+            for tag in post.tags:
+                self.tag_post_counts[tag] += 1
+
+        # the IDs of tags, aliases and implications equal their position in `tag_names` plus one
+        self.tag_ids = list(range(tag_count, 0, -1))
+        self.alias_ids = list(range(tag_count // 4, 0, -1))
+        self.implication_ids = list(range(tag_count // 5, 0, -1))
+
+    def get_post_record(self, post: MockPost, style: str) -> dict:
+        md5 = hashlib.md5(str(post.id).encode('utf-8')).hexdigest()
+        created_at = epoch + timedelta(minutes=post.id)
+        tag_names = [self.tag_names[tag] for tag in post.tags]
+
+        if style == 'e621':
+            file_url = f'https://static1.e621.net/data/{md5[0:2]}/{md5[2:4]}/{md5}.png'
+            categories = {'general': [], 'artist': [], 'character': [], 'species': [], 'copyright': [], 'invalid': [], 'meta': [], 'lore': []}
+            names = {0: 'general', 1: 'artist', 4: 'character', 5: 'species'}
+
+            for tag in post.tags:
+                categories[names[self.tag_categories[tag]]].append(self.tag_names[tag])
+
+            return {
+                'id': post.id,
+                'created_at': created_at.strftime('%Y-%m-%dT%H:%M:%S.000%z'),
+                'updated_at': created_at.strftime('%Y-%m-%dT%H:%M:%S.000%z'),
+                'file': {'width': post.width, 'height': post.height, 'ext': 'png', 'size': post.width * post.height, 'md5': md5, 'url': file_url},
+                'preview': {'width': 150, 'height': 150, 'url': file_url},
+                'sample': {'has': True, 'width': 850, 'height': 850, 'url': file_url},
+                'score': {'up': max(post.score, 0), 'down': min(post.score, 0), 'total': post.score},
+                'tags': categories,
+                'rating': post.rating,
+                'fav_count': post.score * 2 if post.score > 0 else 0,
+                'comment_count': post.id % 13,
+                'sources': [f'https://example.com/{post.id}'],
+                'description': '',
+                'flags': {'deleted': False, 'pending': False, 'flagged': False}
+            }
+
+        if style == 'danbooru':
+            return {
+                'id': post.id,
+                'created_at': created_at.strftime('%Y-%m-%dT%H:%M:%S.000%z'),
+                'md5': md5,
+                'file_ext': 'png',
+                'file_url': f'https://cdn.donmai.us/original/{md5[0:2]}/{md5[2:4]}/{md5}.png',
+                'image_width': post.width,
+                'image_height': post.height,
+                'tag_string': ' '.join(tag_names),
+                'rating': post.rating,
+                'score': post.score,
+                'fav_count': post.score * 2 if post.score > 0 else 0,
+                'source': f'https://example.com/{post.id}'
+            }
+
+        # gelbooru and rule34
+        return {
+            'id': post.id,
+            'created_at': created_at.strftime('%a %b %d %H:%M:%S %z %Y'),
+            'change': int(created_at.timestamp()),
+            'md5': md5,
+            'hash': md5,
+            'file_url': f'https://img3.gelbooru.com/images/{md5[0:2]}/{md5[2:4]}/{md5}.png',
+            'width': post.width,
+            'height': post.height,
+            'tags': ' '.join(tag_names),
+            'rating': gelbooru_ratings[post.rating],
+            'score': post.score,
+            'comment_count': post.id % 13,
+            'source': f'https://example.com/{post.id}'
+        }
+
+    def get_tag_record(self, tag_id: int, style: str) -> dict:
+        index = tag_id - 1
+
+        if style == 'gelbooru':
+            return {'id': tag_id, 'name': self.tag_names[index], 'count': self.tag_post_counts[index], 'type': self.tag_categories[index], 'ambiguous': 0}
+
+        return {'id': tag_id, 'name': self.tag_names[index], 'post_count': self.tag_post_counts[index], 'category': self.tag_categories[index]}
+
+    def get_relation_record(self, relation_id: int) -> dict:
+        # alias/implication N points from the Nth-last tag to the Nth tag
+        return {
+            'id': relation_id,
+            'antecedent_name': self.tag_names[-relation_id],
+            'consequent_name': self.tag_names[relation_id - 1],
+            'status': 'active'
+        }
+
+
+# Emulates the pagination of the image board endpoints used in `crawl.crawler.helpers`, so that crawlers
+# can be tested and benchmarked offline. Requests are routed by the original host name as the first path
+# segment (see `get_url`): `http://127.0.0.1:PORT/e621.net/posts.json?limit=320&page=b1234`.
+#
+# - e621/e926 and danbooru: `page=N` (one-based), `page=b<id>` and `page=a<id>` cursors
+# - gelbooru and rule34: `pid=N` (zero-based, gelbooru stops after 20000 records) and `id:<N` in `tags`
+# - e621 wraps posts in `{"posts": [...]}`, gelbooru in `{"post": [...]}`/`{"tag": [...]}`, the others return lists
+# - responses carry an `ETag`; requests with a matching `If-None-Match` get `304 Not Modified`
+#
+# Every response can be delayed (`latency` seconds on average) or replaced by an error
+# (`error_rate`: share of 500/502/503/429 responses). With `max_rate`, requests above that
+# rate are answered with `429 Too Many Requests`.
+class MockBooruServer:
+    page_limits = {'e621': 750, 'danbooru': 1000}
+    offset_limits = {'gelbooru': 20000}
+    max_limits = {'e621': 320, 'danbooru': 200, 'gelbooru': 100, 'rule34': 1000}
+
+    def __init__(self,
+        corpus: Optional[MockBooruCorpus] = None,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        max_rate: Optional[float] = None,
+        seed: int = 0,
+        host: str = '127.0.0.1',
+        port: int = 0
+    ):
+        self.corpus = corpus or MockBooruCorpus()
+        self.posts_by_id = {post.id: post for post in self.corpus.posts}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limiter = TokenBucket(calls=max_rate, period=1) if max_rate is not None else None
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+        self.request_count = 0
+        self.error_count = 0
+
+        self.httpd = ThreadingHTTPServer((host, port), MockBooruRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.thread = None
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def get_url(self, url: str) -> str:
+        """
+        Rewrite an image board URL (e.g. a crawler's `base_url`) to point to this server
+        """
+        original = furl(url)
+        rewritten = furl(url)
+
+        rewritten.scheme = 'http'
+        rewritten.host = self.httpd.server_address[0]
+        rewritten.port = self.port
+        rewritten.path = f'/{original.host}{original.path}'
+
+        return str(rewritten)
+
+    def get_expected_ids(self, url: str) -> List[int]:
+        """
+        All record IDs a complete crawl of `url` (without paging parameters) should find, newest first
+        """
+        parsed = urlparse(url)
+        (source, kind, ids) = self.select(parsed.path, parse_qs(parsed.query))
+        return ids
+
+    def handle(self, path: str, request_headers: Optional[Mapping[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+        with self.lock:
+            self.request_count += 1
+            delay = self.latency * self.random.uniform(0.5, 1.5) if self.latency > 0 else 0
+            error = self.random.choice([500, 502, 503, 429]) if self.random.random() < self.error_rate else None
+
+        if delay > 0:
+            time.sleep(delay)
+
+        if self.rate_limiter is not None and not self.rate_limiter.try_acquire():
+            error = 429
+
+        if error is not None:
+            with self.lock:
+                self.error_count += 1
+
+            return error, {'retry-after': '1'} if error == 429 else {}, b'{"success":false,"reason":"injected error"}'
+
+        parsed = urlparse(path)
+        query = parse_qs(parsed.query)
+
+        try:
+            (source, kind, ids) = self.select(parsed.path, query)
+        except KeyError:
+            return 404, {}, b'{"success":false,"reason":"not found"}'
+
+        style = 'gelbooru' if source == 'rule34' else source
+        limit = min(int(query.get('limit', ['75'])[0]), self.max_limits[source])
+
+        if source in ['gelbooru', 'rule34']:
+            offset = int(query.get('pid', ['0'])[0]) * limit
+
+            # gelbooru doesn't return anything beyond its deep paging limit
+            if source == 'gelbooru' and offset > self.offset_limits[source]:
+                offset = len(ids)
+
+            ids = ids[offset:offset + limit]
+        else:
+            page = query.get('page', ['1'])[0]
+
+            if page.startswith('b'):
+                ids = [record_id for record_id in ids if record_id < int(page[1:])][0:limit]
+            elif page.startswith('a'):
+                ids = [record_id for record_id in ids if record_id > int(page[1:])][-limit:]
+            elif int(page) > self.page_limits[source]:
+                return 410, {}, json.dumps({'success': False, 'reason': f'You cannot go beyond page {self.page_limits[source]}.'}).encode('utf-8')
+            else:
+                ids = ids[(int(page) - 1) * limit:int(page) * limit]
+
+        if kind == 'posts':
+            records = [self.corpus.get_post_record(self.posts_by_id[record_id], style) for record_id in ids]
+        elif kind == 'tags':
+            records = [self.corpus.get_tag_record(record_id, style) for record_id in ids]
+        else:
+            records = [self.corpus.get_relation_record(record_id) for record_id in ids]
+
+        if source == 'e621' and kind == 'posts':
+            body = {'posts': records}
+        elif source == 'gelbooru':
+            body = {'@attributes': {'limit': limit, 'offset': 0, 'count': len(records)}}
+
+            # gelbooru leaves out the record list altogether on empty pages
+            if len(records) > 0:
+                body['post' if kind == 'posts' else 'tag'] = records
+        else:
+            body = records
+
+        body = json.dumps(body).encode('utf-8')
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+
+        # conditional requests for unchanged pages get an empty `304 Not Modified`
+        if request_headers is not None and request_headers.get('if-none-match') == etag:
+            return 304, {'etag': etag}, b''
+
+        return 200, {'content-type': 'application/json', 'etag': etag}, body
+
+    def select(self, path: str, query: Dict[str, List[str]]) -> Tuple[str, str, List[int]]:
+        """
+        Find the source, the record kind, and the IDs of all records matching `path` and `query`
+        """
+        (host, endpoint) = path.lstrip('/').split('/', 1)
+
+        if host in ['e621.net', 'e926.net']:
+            source = 'e621'
+        elif host == 'danbooru.donmai.us':
+            source = 'danbooru'
+        elif host == 'gelbooru.com':
+            source = 'gelbooru'
+        elif host == 'api.rule34.xxx':
+            source = 'rule34'
+        else:
+            raise KeyError(host)
+
+        if source in ['gelbooru', 'rule34']:
+            if endpoint != 'index.php':
+                raise KeyError(endpoint)
+
+            kind = {'post': 'posts', 'tag': 'tags'}[query.get('s', [''])[0]]
+        else:
+            kind = {'posts.json': 'posts', 'tags.json': 'tags', 'tag_aliases.json': 'aliases', 'tag_implications.json': 'implications'}[endpoint]
+
+            if source == 'danbooru' and kind not in ['posts', 'tags']:
+                raise KeyError(endpoint)
+
+        if kind == 'tags':
+            return source, kind, self.corpus.tag_ids
+        elif kind == 'aliases':
+            return source, kind, self.corpus.alias_ids
+        elif kind == 'implications':
+            return source, kind, self.corpus.implication_ids
+
+        posts = self.corpus.posts
+
+        # e926 is the safe-only mirror of e621
+        if host == 'e926.net':
+            posts = [post for post in posts if post.rating == 's']
+
+        for term in query.get('tags', [''])[0].split():
+            posts = self.filter_posts(posts, term)
+
+        return source, kind, [post.id for post in posts]
+
+    def filter_posts(self, posts: List[MockPost], term: str) -> List[MockPost]:
+        id_match = re.match(r'^id:(<=|>=|<|>)?(\d+)$', term)
+
+        if id_match is not None:
+            (operator, value) = (id_match.group(1) or '=', int(id_match.group(2)))
+            compare = {
+                '<': lambda post_id: post_id < value,
+                '>': lambda post_id: post_id > value,
+                '<=': lambda post_id: post_id <= value,
+                '>=': lambda post_id: post_id >= value,
+                '=': lambda post_id: post_id == value
+            }[operator]
+
+            return [post for post in posts if compare(post.id)]
+
+        # lists of IDs, e.g. `id:1,2,3` (e621, danbooru)
+        if re.match(r'^id:\d+(,\d+)+$', term):
+            ids = set([int(value) for value in term[3:].split(',')])
+            return [post for post in posts if post.id in ids]
+
+        if term.startswith('rating:'):
+            return [post for post in posts if post.rating == term[7:8]]
+
+        # other meta tags (order:..., etc.) are ignored
+        if ':' in term:
+            return posts
+
+        negate = term.startswith('-')
+        name = term.lstrip('-')
+
+        if name not in self.corpus.tag_names:
+            return posts if negate else []
+
+        tag = self.corpus.tag_names.index(name)
+
+        return [post for post in posts if (tag in post.tags) != negate]
+
+
+class MockBooruRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        (status_code, headers, body) = self.server.mock.handle(self.path, self.headers)
+
+        self.send_response(status_code)
+
+        for (name, value) in headers.items():
+            self.send_header(name, value)
+
+        self.send_header('content-length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
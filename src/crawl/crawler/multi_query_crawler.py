@@ -0,0 +1,173 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Callable, Iterable, Optional
+
+from crawl.crawler.crawler import Crawler
+from crawl.crawler.projection import Projection, project
+from crawl.crawler.raw_records import RawRecords
+from utils.jsonl_segments import SegmentedJsonlWriter, open_jsonl_writer
+
+
+class SeenIdSet:
+    """
+    On-disk set of record IDs (SQLite), used to write each record only once across many crawls
+    """
+    def __init__(self, filename: str):
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY)')
+        self.connection.commit()
+        self.lock = threading.Lock()
+
+    def filter_unseen(self, ids: Iterable[str]) -> List[str]:
+        ids = list(dict.fromkeys(ids))
+
+        with self.lock:
+            seen = set()
+
+            # stay below SQLite's bound parameter limit
+            for offset in range(0, len(ids), 500):
+                chunk = ids[offset:offset + 500]
+                rows = self.connection.execute(f'SELECT id FROM seen WHERE id IN ({",".join("?" * len(chunk))})', chunk)
+                seen.update([row[0] for row in rows])
+
+        return [record_id for record_id in ids if record_id not in seen]
+
+    def add(self, ids: Iterable[str]):
+        with self.lock:
+            self.connection.executemany('INSERT OR IGNORE INTO seen (id) VALUES (?)', [(record_id,) for record_id in ids])
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def load_queries(filename: str) -> List[str]:
+    queries = []
+
+    with open(filename, 'r') as fp:
+        for line in fp:
+            query = line.strip()
+
+            if query == '' or query.startswith('#'):
+                continue
+
+            queries.append(query)
+
+    return queries
+
+
+# Runs many search queries concurrently and writes their results into a single output file.
+#
+# Queries share the per-source rate limit. Posts found by several queries are written only
+# once: the IDs of written posts are kept in an on-disk set next to the output file. Every query
+# keeps its own recovery file in `<output>.queries/`, so an interrupted batch resumes each query
+# from its own position and skips the queries that had already finished.
+class MultiQueryCrawler:
+    def __init__(self,
+        create_crawler: Callable[[str, str], Crawler],
+        queries: List[str],
+        output_file: str,
+        concurrency: int = 4,
+        save_jsonl: bool = True,
+        page_handlers: List[Callable[[List[dict]], None]] = None,
+        segment_size: Optional[int] = None
+    ):
+        self.create_crawler = create_crawler
+        self.queries = queries
+        self.output_file = output_file
+        self.concurrency = max(1, concurrency)
+        self.save_jsonl = save_jsonl
+        self.page_handlers = page_handlers or []
+        self.segment_size = segment_size
+
+        self.writer = None
+        self.seen = None
+        self.lock = threading.Lock()
+        self.record_count = 0
+        self.duplicate_count = 0
+
+    def get_query_filename(self, query: str) -> str:
+        key = hashlib.sha1(query.encode('utf-8')).hexdigest()[0:16]
+        return os.path.join(self.output_file + '.queries', f'{key}.jsonl')
+
+    def crawl(self, agent: str, recover: bool = False):
+        os.makedirs(self.output_file + '.queries', exist_ok=True)
+
+        self.seen = SeenIdSet(self.output_file + '.seen.sqlite')
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                for future in [executor.submit(self.crawl_query, query, agent, recover) for query in self.queries]:
+                    future.result()
+
+            # nothing was found; still leave an (empty) output behind
+            if self.save_jsonl and self.writer is None:
+                self.writer = open_jsonl_writer(self.output_file, segment_size=self.segment_size)
+        finally:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+
+            self.seen.close()
+
+        print(f'Crawled {len(self.queries)} queries, found {self.record_count} unique record(s) and skipped {self.duplicate_count} duplicate(s)')
+
+    def crawl_query(self, query: str, agent: str, recover: bool):
+        query_file = self.get_query_filename(query)
+        done_file = query_file + '.done'
+
+        if recover and os.path.exists(done_file):
+            return
+
+        with open(query_file + '.query', 'w') as fp:
+            fp.write(query)
+
+        c = self.create_crawler(query_file, query)
+        c.save_jsonl = False
+        c.page_handlers.append(partial(self.save_unique, projection=c.projection, id_field=c.result_id_field))
+        c.crawl(agent, recover=recover)
+
+        with open(done_file, 'w') as fp:
+            fp.write(query)
+
+    def save_unique(self, records: List[dict], projection: Optional[Projection] = None, id_field: str = 'id'):
+        with self.lock:
+            by_id = {str(record[id_field]): index for (index, record) in enumerate(records)}
+            unseen = self.seen.filter_unseen(by_id.keys())
+            unique_records = [records[by_id[record_id]] for record_id in unseen]
+
+            # opened with the first page, once the ID field of the query crawlers is known
+            if self.save_jsonl and self.writer is None:
+                self.writer = open_jsonl_writer(self.output_file, id_field, segment_size=self.segment_size)
+
+            # write first, then remember: a crash in between causes a duplicate rather than a lost record
+            if self.writer is not None:
+                for record_id in unseen:
+                    record = records[by_id[record_id]]
+
+                    if projection is not None:
+                        self.writer.writerow(project(record, projection))
+                    elif isinstance(records, RawRecords):
+                        self.writer.write_line(records.raw[by_id[record_id]] + b'\n', record)
+                    else:
+                        self.writer.writerow(record)
+
+                self.writer.flush()
+
+            self.seen.add(unseen)
+
+            # seen records are never written again, so a full segment can be finished right away
+            if isinstance(self.writer, SegmentedJsonlWriter):
+                self.writer.rotate_if_full()
+
+            self.record_count += len(unique_records)
+            self.duplicate_count += len(records) - len(unique_records)
+
+        if len(unique_records) > 0:
+            for handler in self.page_handlers:
+                handler(unique_records)
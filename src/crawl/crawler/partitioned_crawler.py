@@ -0,0 +1,189 @@
+import copy
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Optional
+
+from furl import furl
+
+from crawl.crawler.async_crawler import AsyncCrawler
+from crawl.crawler.crawler import Crawler
+from utils.jsonl_index import JsonlIndex, JsonlIndexWriter, get_index_filename, update_index
+
+
+def plan_partitions(min_id: int, max_id: int, count: int) -> List[Tuple[int, int]]:
+    """
+    Split the ID space [min_id, max_id] into `count` contiguous [lower, upper) ranges,
+    highest range first (the order in which a by-ID crawl visits the records).
+    """
+    count = max(1, min(count, max_id - min_id + 1))
+    size = (max_id - min_id + 1) / count
+    bounds = [min_id + round(size * i) for i in range(count)] + [max_id + 1]
+
+    return [(bounds[i], bounds[i + 1]) for i in reversed(range(count))]
+
+
+# Splits a by-ID crawl (`page_field_prefix='b'`) into several ID ranges and crawls them in parallel.
+#
+# Each range walks downwards from `b<upper>` and stops at its lower bound, writing to its own
+# segment file with its own `.recovery` file. The plan is stored next to the output, so an interrupted
+# crawl resumes every unfinished range from its own cursor. Once all ranges have finished, the
+# segments are concatenated (highest range first) into a single ID-ordered output file.
+#
+# For multi-node crawls, every node plans the same partitions from the same `id_range` and only
+# crawls the partitions where `index % shard_count == shard_index`.
+class PartitionedCrawler:
+    def __init__(self, crawler: Crawler, partitions: int, concurrency: int = 1, id_range: Optional[Tuple[int, int]] = None, shard_index: int = 0, shard_count: int = 1):
+        if crawler.page_type != 'by_id' or crawler.page_field_prefix != 'b':
+            raise ValueError('Partitioned crawls are only supported for by-ID crawls')
+
+        self.crawler = crawler
+        self.partitions = partitions
+        self.concurrency = concurrency
+        self.id_range = id_range
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.output_file = crawler.output_file
+        self.lock = threading.Lock()
+        self.plan = None
+
+    def get_plan_filename(self) -> str:
+        return self.output_file + '.partitions.json'
+
+    def get_segment_filename(self, index: int) -> str:
+        return f'{self.output_file}.part-{index:05d}'
+
+    def crawl(self, agent: str, recover: bool = False):
+        os.makedirs(os.path.dirname(self.output_file), exist_ok=True)
+
+        if recover and os.path.isfile(self.get_plan_filename()):
+            with open(self.get_plan_filename(), 'r') as fp:
+                self.plan = json.load(fp)
+        else:
+            (min_id, max_id) = self.id_range if self.id_range is not None else self.find_id_range(agent)
+
+            self.plan = {
+                'partitions': [
+                    {'index': index, 'lower': lower, 'upper': upper, 'finished': False}
+                    for (index, (lower, upper)) in enumerate(plan_partitions(min_id, max_id, self.partitions))
+                    if index % self.shard_count == self.shard_index
+                ]
+            }
+
+            for partition in self.plan['partitions']:
+                for fn in [self.get_segment_filename(partition['index']), self.get_segment_filename(partition['index']) + '.recovery']:
+                    if os.path.exists(fn):
+                        os.remove(fn)
+
+            self.save_plan()
+
+        pending = [partition for partition in self.plan['partitions'] if not partition['finished']]
+        print(f'Crawling {len(pending)} of {len(self.plan["partitions"])} partition(s)')
+
+        with ThreadPoolExecutor(max_workers=max(1, len(pending))) as executor:
+            for future in [executor.submit(self.crawl_partition, partition, agent) for partition in pending]:
+                future.result()
+
+        self.merge()
+
+    def crawl_partition(self, partition: dict, agent: str):
+        c = copy.copy(self.crawler)
+
+        c.output_file = self.get_segment_filename(partition['index'])
+        c.next_id = str(partition['upper'])
+        c.min_id = partition['lower']
+        c.cur_index = 0
+        c.record_count = 0
+        c.exhausted = False
+
+        if self.concurrency > 1:
+            AsyncCrawler(c, concurrency=self.concurrency).crawl(agent, recover=True)
+        else:
+            c.crawl(agent, recover=True)
+
+        with self.lock:
+            partition['finished'] = True
+            self.save_plan()
+
+    def find_id_range(self, agent: str) -> Tuple[int, int]:
+        c = self.crawler
+
+        # newest record: first page without a cursor; oldest record: first record after ID 0
+        newest = c.fetch_url(c.get_page_url(0, None), agent, 0)
+        # `add` keeps the other arguments, e.g. the tags of a search
+        oldest = c.fetch_url(str(furl(c.base_url).remove([c.page_field, 'limit']).add({c.page_field: 'a0', 'limit': 1})), agent, 0)
+
+        newest = c.get_records(newest) if newest is not None else []
+        oldest = c.get_records(oldest) if oldest is not None else []
+
+        if len(newest) == 0:
+            raise ValueError(f'Could not determine the ID range of {c.base_url}')
+
+        max_id = max([int(record[c.result_id_field]) for record in newest])
+        min_id = min([int(record[c.result_id_field]) for record in oldest]) if len(oldest) > 0 else 0
+
+        return min_id, max_id
+
+    def save_plan(self):
+        tmp_filename = self.get_plan_filename() + '.tmp'
+
+        with open(tmp_filename, 'w') as fp:
+            json.dump(self.plan, fp)
+
+        os.replace(tmp_filename, self.get_plan_filename())
+
+    def merge(self):
+        partitions = sorted(self.plan['partitions'], key=lambda p: p['upper'], reverse=True)
+        tmp_file = self.output_file + '.merging'
+
+        # nothing to concatenate if the records only went to the page handlers
+        if self.crawler.save_jsonl:
+            if os.path.exists(get_index_filename(tmp_file)):
+                os.remove(get_index_filename(tmp_file))
+
+            index_writer = JsonlIndexWriter(tmp_file) if self.crawler.save_index else None
+
+            with open(tmp_file, 'wb') as out_fp:
+                for partition in partitions:
+                    fn = self.get_segment_filename(partition['index'])
+
+                    if os.path.exists(fn):
+                        # the segment indexes only need their offsets shifted
+                        if index_writer is not None:
+                            update_index(fn, self.crawler.result_id_field)
+                            index = JsonlIndex(fn)
+                            index_writer.add_index(index, out_fp.tell())
+                            index.close()
+
+                        with open(fn, 'rb') as in_fp:
+                            shutil.copyfileobj(in_fp, out_fp)
+
+            if index_writer is not None:
+                index_writer.close()
+                os.replace(get_index_filename(tmp_file), get_index_filename(self.output_file))
+            elif os.path.exists(get_index_filename(self.output_file)):
+                os.remove(get_index_filename(self.output_file))
+
+            os.replace(tmp_file, self.output_file)
+
+        high_water_marks = []
+
+        for partition in partitions:
+            fn = self.get_segment_filename(partition['index'])
+
+            if os.path.exists(fn + '.hwm'):
+                with open(fn + '.hwm', 'r') as fp:
+                    high_water_marks.append(int(json.load(fp)['max_id']))
+
+            for f in [fn, fn + '.recovery', fn + '.hwm', get_index_filename(fn)]:
+                if os.path.exists(f):
+                    os.remove(f)
+
+        if len(high_water_marks) > 0:
+            with open(self.output_file + '.hwm', 'w') as fp:
+                json.dump({'max_id': max(high_water_marks)}, fp)
+
+        os.remove(self.get_plan_filename())
+        print(f'Merged {len(partitions)} partition(s) into {self.output_file}')
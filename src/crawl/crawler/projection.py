@@ -0,0 +1,90 @@
+from typing import Dict, Optional
+
+# Fields of a crawled post that the post translators (`database/translator/*_translator.py`) read; everything
+# else is dropped before a post is written. `None` keeps a field as it is, a nested dict keeps only some of its
+# fields. Keep these in sync with the translators, or crawl with `--raw`.
+Projection = Dict[str, Optional[dict]]
+
+image_fields: Projection = {'url': None, 'width': None, 'height': None}
+
+e621_post_projection: Projection = {
+    'id': None,
+    'created_at': None,
+    'rating': None,
+    'tags': None,
+    'description': None,
+    'sources': None,
+    'score': {'total': None},
+    'fav_count': None,
+    'comment_count': None,
+    'file': {'url': None, 'md5': None, 'ext': None, 'size': None, 'width': None, 'height': None},
+    'sample': image_fields,
+    'preview': image_fields
+}
+
+danbooru_post_projection: Projection = {
+    'id': None,
+    'created_at': None,
+    'rating': None,
+    'tag_string': None,
+    'source': None,
+    'md5': None,
+    'score': None,
+    'fav_count': None,
+    'comment_count': None,
+    'image': None,
+    'file_url': None,
+    'image_width': None,
+    'image_height': None,
+    'large_file_url': None,
+    'preview_file_url': None,
+    'preview_width': None,
+    'preview_height': None,
+    'sample_url': None,
+    'sample_width': None,
+    'sample_height': None
+}
+
+gelbooru_post_projection: Projection = {
+    'id': None,
+    'created_at': None,
+    'rating': None,
+    'tags': None,
+    'source': None,
+    'md5': None,
+    'score': None,
+    'comment_count': None,
+    'image': None,
+    'file_url': None,
+    'width': None,
+    'height': None,
+    'preview_url': None,
+    'preview_width': None,
+    'preview_height': None,
+    'sample_url': None,
+    'sample_width': None,
+    'sample_height': None
+}
+
+rule34_post_projection: Projection = {
+    **{key: value for (key, value) in gelbooru_post_projection.items() if key not in ['created_at', 'md5', 'source']},
+    'change': None,
+    'hash': None
+}
+
+
+def project(record: dict, projection: Projection) -> dict:
+    projected = {}
+
+    for (key, fields) in projection.items():
+        if key not in record:
+            continue
+
+        value = record[key]
+
+        if fields is not None and isinstance(value, dict):
+            value = project(value, fields)
+
+        projected[key] = value
+
+    return projected
@@ -0,0 +1,111 @@
+import json
+from json.decoder import WHITESPACE
+from json.scanner import make_scanner
+from typing import List, Optional
+
+scan_once = make_scanner(json.JSONDecoder())
+
+
+class RawRecords(list):
+    """
+    Decoded records of a page, together with the raw JSON of each record as it appeared in the response
+    (`raw[i]` belongs to `self[i]`), so that they can be written without encoding them again.
+    """
+    def __init__(self):
+        super().__init__()
+        self.raw: List[bytes] = []
+
+    def add(self, record, raw: bytes):
+        self.append(record)
+        self.raw.append(raw)
+
+    def filter(self, keep) -> 'RawRecords':
+        filtered = RawRecords()
+
+        for (record, raw) in zip(self, self.raw):
+            if keep(record):
+                filtered.add(record, raw)
+
+        return filtered
+
+
+def skip_whitespace(text: str, pos: int) -> int:
+    return WHITESPACE.match(text, pos).end()
+
+
+def find_field(text: str, pos: int, field: str) -> Optional[int]:
+    """
+    Position of the value of `field` in the JSON object starting at `pos`; the other values are skipped
+    """
+    if text[pos] != '{':
+        raise ValueError(f'Expected an object at position {pos}')
+
+    pos = skip_whitespace(text, pos + 1)
+
+    if text[pos] == '}':
+        return None
+
+    while True:
+        (key, pos) = scan_once(text, pos)
+        pos = skip_whitespace(text, pos)
+
+        if text[pos] != ':':
+            raise ValueError(f'Expected ":" at position {pos}')
+
+        pos = skip_whitespace(text, pos + 1)
+
+        if key == field:
+            return pos
+
+        (_, pos) = scan_once(text, pos)
+        pos = skip_whitespace(text, pos)
+
+        if text[pos] != ',':
+            return None
+
+        pos = skip_whitespace(text, pos + 1)
+
+
+def extract_records(body: bytes, json_field: Optional[str]) -> RawRecords:
+    """
+    Split the record list of a page response (the top-level list, or the list in `json_field`) into records
+    and their raw JSON. Raises ValueError (or StopIteration) if the response doesn't have the expected shape.
+    """
+    text = body.decode('utf-8')
+    records = RawRecords()
+    pos = skip_whitespace(text, 0)
+
+    if json_field is not None:
+        pos = find_field(text, pos, json_field)
+
+        # e.g. gelbooru leaves out the list on empty pages
+        if pos is None:
+            return records
+
+    if text[pos] != '[':
+        raise ValueError(f'Expected a list at position {pos}')
+
+    pos = skip_whitespace(text, pos + 1)
+
+    if text[pos] == ']':
+        return records
+
+    while True:
+        (record, end) = scan_once(text, pos)
+        raw = text[pos:end]
+
+        # every record has to fit on one output line
+        if '\n' in raw or '\r' in raw:
+            records.add(record, json.dumps(record).encode('utf-8'))
+        else:
+            records.add(record, raw.encode('utf-8'))
+
+        pos = skip_whitespace(text, end)
+
+        if text[pos] == ']':
+            return records
+
+        if text[pos] != ',':
+            raise ValueError(f'Expected "," or "]" at position {pos}')
+
+        pos = skip_whitespace(text, pos + 1)
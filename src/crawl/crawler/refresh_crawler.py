@@ -0,0 +1,96 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from furl import furl
+from pymongo.database import Database
+
+from crawl.crawler.crawler import Crawler
+from database.utils.enums import Source
+
+
+def load_stale_ids(db: Database, source: Source, older_than: datetime, limit: Optional[int] = None) -> List[str]:
+    """
+    Source IDs of imported posts that were last imported before `older_than`, oldest first; posts that a refresh
+    did not find (e.g. deleted posts) are skipped until `refreshed_at` is older than `older_than` as well
+    """
+    cursor = db['posts'].find({
+        'source': source,
+        'timestamp': {'$lt': older_than},
+        '$or': [{'refreshed_at': {'$exists': False}}, {'refreshed_at': {'$lt': older_than}}]
+    }, {'source_id': 1}).sort('timestamp', 1)
+
+    if limit is not None:
+        cursor = cursor.limit(limit)
+
+    return [post['source_id'] for post in cursor]
+
+
+def mark_refreshed(db: Database, source: Source, ids: List[str]):
+    """
+    Record a refresh attempt for posts that were not found, so that the next refresh continues with other posts
+    """
+    db['posts'].update_many({'source': source, 'source_id': {'$in': ids}}, {'$set': {'refreshed_at': datetime.now()}})
+
+
+# Re-fetches known posts by ID, up to `batch_size` of them per request (e.g. `tags=id:1,2,3` on e621 and danbooru),
+# instead of crawling the whole index again. `crawler` is a search crawler; its base URL gets the ID query, and its
+# page handlers (e.g. the importer) and output file get the refreshed records.
+#
+# A refresh is not resumed from a recovery file: the importer updates the timestamp of every refreshed post, and
+# `missing_handler` (e.g. `mark_refreshed`) gets the IDs of posts that were not found, so running it again simply
+# continues with the posts that are still stale.
+class RefreshCrawler:
+    def __init__(self, crawler: Crawler, ids: List[str], batch_size: int = 100, query_field: str = 'tags', concurrency: int = 1, missing_handler: Optional[Callable[[List[str]], None]] = None):
+        self.crawler = crawler
+        self.ids = ids
+        self.batch_size = batch_size
+        self.query_field = query_field
+        self.concurrency = max(1, concurrency)
+        self.missing_handler = missing_handler
+        self.missing_count = 0
+
+    def get_batches(self) -> List[List[str]]:
+        return [self.ids[offset:offset + self.batch_size] for offset in range(0, len(self.ids), self.batch_size)]
+
+    def get_batch_url(self, batch: List[str]) -> str:
+        url = furl(self.crawler.base_url)
+        url.args[self.query_field] = 'id:' + ','.join(batch)
+        return str(url)
+
+    def crawl(self, agent: str):
+        c = self.crawler
+        batches = self.get_batches()
+        started_at = time.time()
+
+        print(f'Refreshing {len(self.ids)} post(s) in {len(batches)} request(s)')
+
+        c.open_output()
+        finished = False
+
+        try:
+            # requests run concurrently, but the batches are written in order
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                results = executor.map(lambda args: c.fetch_url(self.get_batch_url(args[1]), agent, args[0]), enumerate(batches))
+
+                for (batch, result) in zip(batches, results):
+                    records = c.get_records(result) if result is not None else []
+
+                    if len(records) > 0:
+                        c.save_page(records)
+
+                    # e.g. deleted posts
+                    found_ids = set([str(record[c.result_id_field]) for record in records])
+                    missing_ids = [post_id for post_id in batch if post_id not in found_ids]
+                    self.missing_count += len(missing_ids)
+
+                    if len(missing_ids) > 0 and self.missing_handler is not None:
+                        self.missing_handler(missing_ids)
+                    c.cur_index += 1
+
+            finished = True
+        finally:
+            c.close_output(finished)
+
+        print(f'Refreshed {c.record_count} post(s) after {round(time.time() - started_at, 1)}s; {self.missing_count} post(s) were not found')
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import Optional, Mapping, Dict
+
+
+class CachedResponse:
+    def __init__(self, url: str, body: bytes, etag: Optional[str], last_modified: Optional[str], fetched_at: float):
+        self.url = url
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+    def get_conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+
+        if self.etag is not None:
+            headers['if-none-match'] = self.etag
+
+        if self.last_modified is not None:
+            headers['if-modified-since'] = self.last_modified
+
+        return headers
+
+
+# Stores raw page responses on disk, keyed by the SHA-256 of the page URL.
+#
+# By default, cached pages are revalidated with `If-None-Match`/`If-Modified-Since`
+# requests, so unchanged pages are not downloaded again. With `trust=True`, cached pages
+# are reused without asking the server at all (e.g. when restarting a crawl with --recover).
+class ResponseCache:
+    def __init__(self, directory: str, trust: bool = False):
+        self.directory = directory
+        self.trust = trust
+
+    def get_key(self, url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def get_filename(self, url: str) -> str:
+        key = self.get_key(url)
+        return os.path.join(self.directory, key[0:2], key)
+
+    def load(self, url: str) -> Optional[CachedResponse]:
+        fn = self.get_filename(url)
+
+        if not os.path.isfile(fn + '.meta.json') or not os.path.isfile(fn + '.body'):
+            return None
+
+        with open(fn + '.meta.json', 'r') as fp:
+            meta = json.load(fp)
+
+        # hash collision or a damaged entry
+        if meta.get('url') != url:
+            return None
+
+        with open(fn + '.body', 'rb') as fp:
+            body = fp.read()
+
+        return CachedResponse(
+            url=url,
+            body=body,
+            etag=meta.get('etag'),
+            last_modified=meta.get('last_modified'),
+            fetched_at=meta.get('fetched_at', 0)
+        )
+
+    def save(self, url: str, body: bytes, headers: Mapping[str, str]):
+        fn = self.get_filename(url)
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+
+        meta = {
+            'url': url,
+            'etag': headers.get('etag'),
+            'last_modified': headers.get('last-modified'),
+            'fetched_at': time.time()
+        }
+
+        # body first, so that a metadata file always points to a complete body
+        self.write_atomic(fn + '.body', body)
+        self.write_atomic(fn + '.meta.json', json.dumps(meta).encode('utf-8'))
+
+    def write_atomic(self, filename: str, data: bytes):
+        tmp_filename = f'{filename}.{uuid.uuid4().hex}.tmp'
+
+        with open(tmp_filename, 'wb') as fp:
+            fp.write(data)
+
+        os.replace(tmp_filename, filename)
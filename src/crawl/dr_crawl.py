@@ -1,26 +1,105 @@
-# crawl --output some.jsonl --type search|index|tags|implications --source e926|e621|gelbooru|danbooru [--query "some tags"] [--recover]
+# crawl --output some.jsonl --type search|posts|tags|implications|aliases|bundle --source e926|e621|gelbooru|danbooru|rule34 [--query "some tags" | --query-file queries.txt] [--recover | --since-existing] [--concurrency 4] [--partitions 8] [--cache DIR] [--import [--skip-jsonl]] [--metrics] [--raw] [--segment-size 1024] [--shard-index 0 --shard-count 4 [--max-id 5000000]]
+# crawl --output refreshed.jsonl --type refresh --source e621|e926|danbooru [--refresh-age 30] [--refresh-limit 100000] [--concurrency 4]
+# crawl merge --input shard-0.jsonl --input shard-1.jsonl --output merged.jsonl
 
 import argparse
 import re
 import os
+import sys
+from datetime import datetime, timedelta
+from functools import partial
+from typing import List, Callable, Optional
 
+from crawl.crawler.async_crawler import AsyncCrawler
+from crawl.crawler.bundle_crawler import BundleCrawler
+from crawl.crawler.crawler import Crawler
 from crawl.crawler.helpers import get_crawler
+from crawl.crawler.merge import merge_jsonl
+from crawl.crawler.metrics import CrawlMetrics
+from crawl.crawler.multi_query_crawler import MultiQueryCrawler, load_queries
+from crawl.crawler.partitioned_crawler import PartitionedCrawler
+from crawl.crawler.refresh_crawler import RefreshCrawler, load_stale_ids, mark_refreshed
+from crawl.crawler.response_cache import ResponseCache
+from database.importer.importer import Importer
+from database.tag_normalizer.util import load_normalizer_from_database
+from database.translator.helpers import get_post_translator
+from database.utils.db_utils import connect_to_db
+from database.utils.enums import to_source
+from utils.jsonl_segments import expand_inputs
 
 
 def get_args():
     parser = argparse.ArgumentParser(prog='Crawl', description='Download metadata from e926, e621, gelbooru, rule34, and danbooru')
 
-    parser.add_argument('-o', '--output', metavar='FILE', type=str, help='Output JSONL file', required=True)
+    parser.add_argument('-o', '--output', metavar='FILE', type=str, help='Output JSONL file (output directory for --type bundle)', required=True)
     parser.add_argument('-a', '--agent', metavar='AGENT', type=str, help='Unique user agent string (e.g. "mycrawler/1.0 (by myusername)")', required=True)
-    parser.add_argument('-t', '--type', metavar='TYPE', type=str, help='Crawl type [search, index, tags, implications, aliases]', required=True, choices=['search', 'posts', 'tags', 'implications', 'aliases'])
+    parser.add_argument('-t', '--type', metavar='TYPE', type=str, help='Crawl type [search, posts, tags, implications, aliases, bundle, refresh]; bundle crawls posts, tags, aliases, and implications at once; refresh re-fetches and imports posts already in the database', required=True, choices=['search', 'posts', 'tags', 'implications', 'aliases', 'bundle', 'refresh'])
     parser.add_argument('-s', '--source', metavar='SOURCE', type=str, help='Crawl source [e926, e621, gelbooru, danbooru, rule34]', required=True, choices=['e926', 'e621', 'gelbooru', 'danbooru', 'rule34'])
     parser.add_argument('-q', '--query', metavar='KEYWORD', type=str, help='Crawl query', required=False)
+    parser.add_argument('--query-file', metavar='FILE', type=str, help='File with one search query per line; the queries are crawled concurrently (see --concurrency) into one de-duplicated output', required=False, default=None)
     parser.add_argument('-r', '--recover', default=False, action='store_true', help='Recover from last crawl position')
+    parser.add_argument('--since-existing', default=False, action='store_true', help='Only crawl records newer than the newest record in the existing output file, and append them to it')
+    parser.add_argument('-p', '--partitions', metavar='COUNT', type=int, help='Split a by-ID crawl (posts, tags, aliases) into COUNT ID ranges and crawl them in parallel', required=False, default=None)
+    parser.add_argument('-c', '--concurrency', metavar='COUNT', type=int, help='Number of page requests kept in flight (index crawls) or queries crawled at once (--query-file); values above 1 also prefetch the next cursor in by-ID crawls', required=False, default=1)
+    parser.add_argument('--cache', metavar='DIR', type=str, help='Cache page responses in DIR and revalidate them with conditional requests', required=False, default=None)
+    parser.add_argument('--cache-trust', default=False, action='store_true', help='Reuse cached page responses without revalidating them')
+    parser.add_argument('--import', dest='import_posts', default=False, action='store_true', help='Import crawled posts into the database while crawling (requires tags in the database)')
+    parser.add_argument('--skip-jsonl', default=False, action='store_true', help='Do not write the crawled records to the output file (recovery files are still written next to it)')
+    parser.add_argument('--metrics', default=False, action='store_true', help='Periodically write crawl metrics to OUTPUT.metrics.json and OUTPUT.prom (Prometheus)')
+    parser.add_argument('--raw', default=False, action='store_true', help='Write posts as returned by the API, instead of only the fields used by the importer')
+    parser.add_argument('--segment-size', metavar='MB', type=int, help='Write the output as numbered segment files (OUTPUT-00001.jsonl, ...) of about MB megabytes each, listed in OUTPUT.manifest.json', required=False, default=None)
+    parser.add_argument('--refresh-age', metavar='DAYS', type=float, help='Refresh posts that were last imported more than DAYS ago (--type refresh)', required=False, default=30)
+    parser.add_argument('--refresh-limit', metavar='COUNT', type=int, help='Refresh at most COUNT posts, the stalest first (--type refresh)', required=False, default=None)
+    parser.add_argument('--shard-index', metavar='INDEX', type=int, help='Index of this node in a multi-node crawl (0 ... shard count - 1)', required=False, default=0)
+    parser.add_argument('--shard-count', metavar='COUNT', type=int, help='Number of nodes in a multi-node crawl; combine the outputs with "dr-crawl merge"', required=False, default=1)
+    parser.add_argument('--max-id', metavar='ID', type=int, help='Highest record ID of a partitioned or sharded by-ID crawl (must be the same on every node)', required=False, default=None)
+    parser.add_argument('--min-id', metavar='ID', type=int, help='Lowest record ID of a partitioned or sharded by-ID crawl', required=False, default=0)
 
     return parser.parse_args()
 
 
+def get_merge_args(argv: List[str]):
+    parser = argparse.ArgumentParser(prog='Crawl merge', description='Merge crawl outputs (e.g. from several shards) into one de-duplicated, ID-ordered JSONL file')
+
+    parser.add_argument('-i', '--input', metavar='FILE', type=str, action='append', help='Crawl output JSONL file(s)', required=True)
+    parser.add_argument('-o', '--output', metavar='FILE', type=str, help='Merged output JSONL file', required=True)
+    parser.add_argument('--id-field', metavar='FIELD', type=str, help='Record ID field', required=False, default='id')
+    parser.add_argument('--ascending', default=False, action='store_true', help='Order by ascending ID (default: descending, like a by-ID crawl)')
+
+    return parser.parse_args(argv)
+
+
+def merge_main(argv: List[str]):
+    args = get_merge_args(argv)
+
+    (record_count, duplicate_count) = merge_jsonl(expand_inputs(args.input), args.output, id_field=args.id_field, descending=not args.ascending)
+    print(f'Merged {len(args.input)} file(s) into {args.output}: {record_count} record(s), {duplicate_count} duplicate(s) removed')
+
+
+def get_page_handlers(args) -> List[Callable[[List[dict]], None]]:
+    # refreshed posts are always imported
+    if not args.import_posts and args.type != 'refresh':
+        return []
+
+    if args.type not in ['posts', 'search', 'refresh']:
+        print('--import is only supported for post crawls (--type posts or --type search)')
+        exit(1)
+
+    (db, client) = connect_to_db()
+    tag_normalizer = load_normalizer_from_database(db)
+
+    # e926 is the SFW subset of e621 and shares its data format
+    post_translator = get_post_translator('e621' if args.source == 'e926' else args.source, tag_normalizer, deep_tag_search=True)
+    post_importer = Importer(db, 'posts', post_translator, tag_normalizer)
+
+    return [post_importer.import_records]
+
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'merge':
+        merge_main(sys.argv[2:])
+        return
+
     args = get_args()
 
     if re.match(r'(rising|hearmeneigh|mrstallion)', args.agent, flags=re.IGNORECASE):
@@ -28,7 +107,156 @@ def main():
         print(f'The user agent string must not contain words "rising", "hearmeneigh", or "mrstallion". Try --agent "dr-{username}/1.0 (by {username})" instead?')
         exit(1)
 
+    if args.skip_jsonl and not args.import_posts and args.type != 'refresh':
+        print('--skip-jsonl requires --import')
+        exit(1)
+
+    segment_size = args.segment_size * 1024 * 1024 if args.segment_size is not None else None
+    metrics = CrawlMetrics(args.output if args.metrics else None)
+    cache = ResponseCache(args.cache, trust=args.cache_trust) if args.cache is not None else None
+    page_handlers = get_page_handlers(args)
+
+    if args.type == 'bundle':
+        if args.query is not None or args.query_file is not None or args.partitions is not None or args.shard_count > 1:
+            print('--type bundle cannot be combined with --query, --query-file, --partitions, or sharding')
+            exit(1)
+
+        if args.since_existing and args.recover:
+            print('--since-existing cannot be combined with --recover')
+            exit(1)
+
+        def create_bundle_crawler(crawl_type: str, output_file: str) -> Optional[Crawler]:
+            try:
+                bc = get_crawler(args.source, crawl_type, output_file, None)
+            except NotImplementedError:
+                return None
+
+            bc.metrics = CrawlMetrics(output_file if args.metrics else None)
+            bc.cache = cache
+            bc.segment_size = segment_size
+
+            if args.raw:
+                bc.projection = None
+
+            if args.since_existing:
+                max_id = bc.load_high_water_mark()
+
+                if max_id is not None:
+                    print(f'Crawling {crawl_type} newer than #{max_id}')
+                    bc.since(max_id)
+
+            return bc
+
+        c = BundleCrawler(create_bundle_crawler, args.output, concurrency=args.concurrency)
+        c.crawl(recover=args.recover, agent=args.agent)
+        return
+
+    if args.type == 'refresh':
+        if args.source not in ['e621', 'e926', 'danbooru']:
+            print('--type refresh is only supported for e621, e926, and danbooru, which can search for lists of post IDs')
+            exit(1)
+
+        if args.query is not None or args.query_file is not None or args.recover or args.since_existing or args.partitions is not None or args.shard_count > 1:
+            print('--type refresh cannot be combined with --query, --query-file, --recover, --since-existing, --partitions, or sharding; run it again to continue with the posts that are still stale')
+            exit(1)
+
+        (db, client) = connect_to_db()
+        source = to_source('e621' if args.source == 'e926' else args.source)
+        ids = load_stale_ids(db, source, datetime.now() - timedelta(days=args.refresh_age), args.refresh_limit)
+
+        c = get_crawler(args.source, 'search', args.output, '')
+        c.metrics = metrics
+        c.cache = cache
+        c.save_jsonl = not args.skip_jsonl
+        c.segment_size = segment_size
+        c.page_handlers.extend(page_handlers)
+
+        if args.raw:
+            c.projection = None
+
+        RefreshCrawler(c, ids, concurrency=args.concurrency, missing_handler=partial(mark_refreshed, db, source)).crawl(agent=args.agent)
+        return
+
+    if args.query_file is not None:
+        if args.type != 'search':
+            print('--query-file requires --type search')
+            exit(1)
+
+        if args.query is not None or args.since_existing or args.partitions is not None or args.shard_count > 1:
+            print('--query-file cannot be combined with --query, --since-existing, --partitions, or sharding')
+            exit(1)
+
+        def create_query_crawler(output_file: str, query: str) -> Crawler:
+            qc = get_crawler(args.source, args.type, output_file, query)
+            qc.metrics = metrics
+            qc.cache = cache
+
+            if args.raw:
+                qc.projection = None
+
+            return qc
+
+        queries = load_queries(args.query_file)
+        c = MultiQueryCrawler(create_query_crawler, queries, args.output, concurrency=args.concurrency, save_jsonl=not args.skip_jsonl, page_handlers=page_handlers, segment_size=segment_size)
+        c.crawl(recover=args.recover, agent=args.agent)
+        return
+
+    if args.shard_count < 1 or not 0 <= args.shard_index < args.shard_count:
+        print('--shard-index must be between 0 and --shard-count - 1')
+        exit(1)
+
     c = get_crawler(args.source, args.type, args.output, args.query)
+    c.metrics = metrics
+    c.cache = cache
+    c.save_jsonl = not args.skip_jsonl
+    c.segment_size = segment_size
+    c.page_handlers.extend(page_handlers)
+
+    if args.raw:
+        c.projection = None
+
+    if args.since_existing:
+        if args.recover or args.partitions is not None:
+            print('--since-existing cannot be combined with --recover or --partitions')
+            exit(1)
+
+        max_id = c.load_high_water_mark()
+
+        if max_id is not None:
+            print(f'Crawling records newer than #{max_id}')
+            c.since(max_id)
+
+    if args.shard_count > 1:
+        if args.since_existing:
+            print('--since-existing cannot be combined with sharded crawls')
+            exit(1)
+
+        if c.page_type == 'index':
+            c.shard_index = args.shard_index
+            c.shard_count = args.shard_count
+        elif c.page_field_prefix != 'b':
+            print('Sharded by-ID crawls are only supported with b<id> cursors (e621, e926, and danbooru)')
+            exit(1)
+        elif args.max_id is None:
+            print('Sharded by-ID crawls require --max-id, so that every node plans the same ID ranges')
+            exit(1)
+        elif args.partitions is None:
+            args.partitions = args.shard_count
+
+    if args.partitions is not None:
+        if c.page_type != 'by_id' or c.page_field_prefix != 'b':
+            print('--partitions is only supported for by-ID crawls with b<id> cursors (e621, e926, and danbooru)')
+            exit(1)
+
+        if segment_size is not None:
+            print('--segment-size cannot be combined with --partitions or sharded by-ID crawls')
+            exit(1)
+
+        id_range = (args.min_id, args.max_id) if args.max_id is not None else None
+        c = PartitionedCrawler(c, partitions=args.partitions, concurrency=args.concurrency, id_range=id_range, shard_index=args.shard_index, shard_count=args.shard_count)
+    elif args.concurrency > 1:
+        c = AsyncCrawler(c, concurrency=args.concurrency)
+
     c.crawl(recover=args.recover, agent=args.agent)
 
 
@@ -0,0 +1,197 @@
+# crawl-benchmark [--posts 20000] [--latency 0.01] [--error-rate 0.01] [--rate 1000] [--scenario e621-posts ...] [--output results.json]
+# crawl-benchmark --serve [--port 8080] [--posts 20000]
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from crawl.crawler.crawler import Crawler
+from crawl.crawler.helpers import get_e621_index_crawler, get_e621_search_crawler, get_e621_tag_crawler, \
+    get_e621_tag_aliases_crawler, get_e621_implications_crawler, get_e926_index_crawler, get_gelbooru_index_crawler, \
+    get_gelbooru_search_crawler, get_gelbooru_tag_crawler, get_danbooru_index_crawler, get_danbooru_search_crawler, \
+    get_danbooru_tag_crawler, get_rule34_index_crawler, get_rule34_search_crawler, get_rule34_tag_crawler
+from crawl.crawler.mock_server import MockBooruServer, MockBooruCorpus
+from utils.rate_limiter import AdaptiveRateLimiter
+
+search_query = 'tag_0003'
+
+scenarios: Dict[str, Callable[[str], Crawler]] = {
+    'e621-posts': get_e621_index_crawler,
+    'e621-search': lambda output_file: get_e621_search_crawler(output_file, search_query),
+    'e621-tags': get_e621_tag_crawler,
+    'e621-aliases': get_e621_tag_aliases_crawler,
+    'e621-implications': get_e621_implications_crawler,
+    'e926-posts': get_e926_index_crawler,
+    'gelbooru-posts': get_gelbooru_index_crawler,
+    'gelbooru-search': lambda output_file: get_gelbooru_search_crawler(output_file, search_query),
+    'gelbooru-tags': get_gelbooru_tag_crawler,
+    'danbooru-posts': get_danbooru_index_crawler,
+    'danbooru-search': lambda output_file: get_danbooru_search_crawler(output_file, search_query),
+    'danbooru-tags': get_danbooru_tag_crawler,
+    'rule34-posts': get_rule34_index_crawler,
+    'rule34-search': lambda output_file: get_rule34_search_crawler(output_file, search_query),
+    'rule34-tags': get_rule34_tag_crawler
+}
+
+
+class SimulatedCrash(Exception):
+    pass
+
+
+def get_args():
+    parser = argparse.ArgumentParser(prog='Crawl benchmark', description='Benchmark the crawlers against a local mock image board server')
+
+    parser.add_argument('--scenario', metavar='NAME', type=str, action='append', help=f'Scenario(s) to run (default: all): {", ".join(scenarios.keys())}', required=False, default=None)
+    parser.add_argument('--posts', metavar='COUNT', type=int, help='Number of posts in the synthetic corpus', required=False, default=20000)
+    parser.add_argument('--tags', metavar='COUNT', type=int, help='Number of tags in the synthetic corpus', required=False, default=2000)
+    parser.add_argument('--seed', metavar='SEED', type=int, help='Random seed for the corpus, latency and injected errors', required=False, default=0)
+    parser.add_argument('--latency', metavar='SECONDS', type=float, help='Average server response latency', required=False, default=0.0)
+    parser.add_argument('--error-rate', metavar='SHARE', type=float, help='Share of responses replaced by a 500/502/503/429 error', required=False, default=0.0)
+    parser.add_argument('--max-rate', metavar='REQUESTS', type=float, help='Answer requests above this rate (per second) with 429', required=False, default=None)
+    parser.add_argument('--rate', metavar='REQUESTS', type=float, help='Crawler rate limit (requests per second)', required=False, default=1000)
+    parser.add_argument('--crash-after', metavar='PAGES', type=int, help='Interrupt the recovery run after this many pages', required=False, default=3)
+    parser.add_argument('--output', metavar='FILE', type=str, help='Write the results to a JSON file', required=False, default=None)
+    parser.add_argument('--verbose', default=False, action='store_true', help='Show the crawler output')
+    parser.add_argument('--serve', default=False, action='store_true', help='Only run the mock server (e.g. for manual testing)')
+    parser.add_argument('--port', metavar='PORT', type=int, help='Port of the mock server (default: random)', required=False, default=0)
+
+    return parser.parse_args()
+
+
+def create_crawler(server: MockBooruServer, name: str, output_file: str, rate: float) -> Crawler:
+    c = scenarios[name](output_file)
+    c.base_url = server.get_url(c.base_url)
+    c.rate_limiter = AdaptiveRateLimiter(calls=rate, period=1)
+    return c
+
+
+def read_ids(output_file: str) -> List[int]:
+    if not os.path.isfile(output_file):
+        return []
+
+    with open(output_file, 'rt', encoding='utf-8') as fp:
+        return [int(json.loads(line)['id']) for line in fp if line.strip() != '']
+
+
+def check_ids(expected: List[int], found: List[int]) -> dict:
+    return {
+        'expected': len(expected),
+        'found': len(found),
+        'missing': len(set(expected) - set(found)),
+        'unexpected': len(set(found) - set(expected)),
+        'duplicates': len(found) - len(set(found))
+    }
+
+
+def run_scenario(server: MockBooruServer, name: str, directory: str, rate: float, crash_after: int, verbose: bool) -> dict:
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+    # 1. uninterrupted crawl
+    output_file = os.path.join(directory, f'{name}.jsonl')
+    c = create_crawler(server, name, output_file, rate)
+    expected = server.get_expected_ids(c.base_url)
+
+    started_at = time.time()
+
+    with output:
+        c.crawl(agent='crawl-benchmark/1.0')
+
+    elapsed = max(time.time() - started_at, 0.001)
+    metrics = c.metrics.to_dict()
+
+    # 2. crawl, crash, and resume with --recover
+    recovery_file = os.path.join(directory, f'{name}.recovery.jsonl')
+    c = create_crawler(server, name, recovery_file, rate)
+    pages = [0]
+
+    def crash(records: List[dict]):
+        pages[0] += 1
+
+        if pages[0] == crash_after:
+            raise SimulatedCrash()
+
+    c.page_handlers.append(crash)
+
+    with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO()):
+        try:
+            c.crawl(agent='crawl-benchmark/1.0')
+        except SimulatedCrash:
+            pass
+
+        create_crawler(server, name, recovery_file, rate).crawl(agent='crawl-benchmark/1.0', recover=True)
+
+    return {
+        'scenario': name,
+        'seconds': round(elapsed, 3),
+        'requests': metrics['requests'],
+        'pages': metrics['pages'],
+        'records': metrics['records'],
+        'pages_per_second': round(metrics['pages'] / elapsed, 1),
+        'records_per_second': round(metrics['records'] / elapsed, 1),
+        'retries': metrics['retries'],
+        'crawl': check_ids(expected, read_ids(output_file)),
+        'recovery': check_ids(expected, read_ids(recovery_file))
+    }
+
+
+def is_complete(check: dict) -> bool:
+    return check['missing'] == 0 and check['unexpected'] == 0 and check['duplicates'] == 0
+
+
+def format_check(check: dict) -> str:
+    if is_complete(check):
+        return 'ok'
+
+    return f'{check["missing"]} missing, {check["unexpected"]} unexpected, {check["duplicates"]} duplicate(s)'
+
+
+def main():
+    args = get_args()
+
+    corpus = MockBooruCorpus(post_count=args.posts, tag_count=args.tags, seed=args.seed)
+    server = MockBooruServer(corpus, latency=args.latency, error_rate=args.error_rate, max_rate=args.max_rate, seed=args.seed, port=args.port)
+
+    if args.serve:
+        print(f'Serving {args.posts} posts and {args.tags} tags on http://127.0.0.1:{server.port}/ (e.g. http://127.0.0.1:{server.port}/e621.net/posts.json?limit=320)')
+        server.serve_forever()
+        return
+
+    names = args.scenario or list(scenarios.keys())
+
+    for name in names:
+        if name not in scenarios:
+            print(f'Unknown scenario: {name}')
+            exit(1)
+
+    server.start()
+    results = []
+
+    try:
+        with tempfile.TemporaryDirectory(prefix='crawl-benchmark-') as directory:
+            for name in names:
+                result = run_scenario(server, name, directory, args.rate, args.crash_after, args.verbose)
+                results.append(result)
+
+                print(
+                    f'{name:20s} {result["pages"]:6d} pages {result["records"]:8d} records {result["seconds"]:8.2f}s '
+                    f'{result["pages_per_second"]:8.1f} pages/s {result["records_per_second"]:10.1f} records/s  '
+                    f'crawl: {format_check(result["crawl"])}; recovery: {format_check(result["recovery"])}'
+                )
+    finally:
+        server.stop()
+
+    if args.output is not None:
+        with open(args.output, 'w') as fp:
+            json.dump({'args': vars(args), 'server_requests': server.request_count, 'server_errors': server.error_count, 'results': results}, fp, indent=2)
+
+    if not all([is_complete(result['crawl']) and is_complete(result['recovery']) for result in results]):
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+# index --input some.jsonl [--input more.jsonl] [--id-field id] [--rebuild]
+
+import argparse
+import os
+
+from utils.jsonl_index import update_index, get_index_filename
+from utils.jsonl_segments import expand_inputs
+
+
+def get_args():
+    parser = argparse.ArgumentParser(prog='Index', description='Create or update the sidecar index (FILE.idx) of JSONL files')
+
+    parser.add_argument('-i', '--input', metavar='FILE', type=str, action='append', help='JSONL file(s) to index (segmented outputs: all of their segments)', required=True)
+    parser.add_argument('--id-field', metavar='FIELD', type=str, help='Record ID field (falls back to "source_id")', required=False, default='id')
+    parser.add_argument('--rebuild', default=False, action='store_true', help='Discard existing indexes instead of updating them')
+
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+
+    for input_file in expand_inputs(args.input):
+        if not os.path.isfile(input_file):
+            print(f'{input_file} does not exist')
+            exit(1)
+
+        if args.rebuild and os.path.exists(get_index_filename(input_file)):
+            os.remove(get_index_filename(input_file))
+
+        count = update_index(input_file, args.id_field)
+        print(f'Indexed {count} record(s) in {get_index_filename(input_file)}')
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ from database.entities.tag import TagProtoEntity, TagVersion
 from database.tag_normalizer.util import load_normalizer_from_database
 from database.utils.db_utils import connect_to_db
 from database.utils.enums import Category, Source, to_source, to_category
+from database.utils.tag_writer import open_tag_writer, get_tag_upsert
 from utils.load_yaml import load_yaml
 
 
@@ -32,6 +33,8 @@ def main():
 
     category_weights = load_yaml(args.category_weights).get('categories', {})
     tag_normalizer = load_normalizer_from_database(db, category_naming_order=category_weights)
+    tag_writer = open_tag_writer(db)
+    added_tags = []
 
     for tag_name in args.tag:
         proto_tag = TagProtoEntity(
@@ -79,9 +82,14 @@ def main():
             if tag_normalizer.get(v2_tag_short) == tag_normalizer.get(v2_tag):
                 tag.preferred_name = v2_tag_short
 
-        db['tags'].replace_one({'source': tag.source, 'source_id': tag.source_id}, vars(tag), upsert=True)
+        tag_writer.add(tag, get_tag_upsert(tag))
+        added_tags.append(tag)
 
-        print(f'Added tag \'{tag.preferred_name}\'')
+    tag_writer.close()
+
+    for tag in added_tags:
+        if tag not in tag_writer.failed_labels:
+            print(f'Added tag \'{tag.preferred_name}\'')
 
 
 if __name__ == "__main__":
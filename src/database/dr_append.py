@@ -2,16 +2,22 @@ import argparse
 import json
 
 from database.importer.importer import Importer
+from database.importer.readers import is_csv_file
 from database.tag_normalizer.util import load_normalizer_from_database
 from database.translator.helpers import get_post_translator
 from database.utils.db_utils import connect_to_db
+from utils.jsonl_segments import expand_inputs
 
 
 def get_args():
     parser = argparse.ArgumentParser(prog='Append', description='Add posts from e621, gelbooru, rule34, and danbooru')
 
-    parser.add_argument('-p', '--posts', type=str, action='append', help='Post JSONL file(s) to import', required=True)
+    parser.add_argument('-p', '--posts', type=str, action='append', help='Post JSONL file(s) or e621 CSV dump(s) (posts-*.csv.gz) to import', required=True)
     parser.add_argument('-s', '--source', type=str, help='Data source [e926, e621, gelbooru, danbooru, rule34]', required=True, choices=['e926', 'e621', 'gelbooru', 'danbooru', 'rule34'])
+    parser.add_argument('--batch-size', type=int, help='Number of posts written to the database at once', required=False, default=1000)
+    parser.add_argument('--pending-batches', type=int, help='Number of post batches written concurrently', required=False, default=4)
+    parser.add_argument('--workers', type=int, help='Number of processes importing each post JSONL file', required=False, default=1)
+    parser.add_argument('--preload-md5s', action='store_true', help='Load the MD5s of all posts before appending, instead of looking them up per batch', required=False, default=False)
 
     return parser.parse_args()
 
@@ -25,11 +31,23 @@ def main():
     tag_normalizer = load_normalizer_from_database(db)
 
     # process posts
-    post_translator = get_post_translator(args.source, tag_normalizer, deep_tag_search=True)
-    post_importer = Importer(db, 'posts', post_translator, tag_normalizer, skip_if_md5_match=True)
+    # CSV dumps and JSONL crawls have different layouts, and need their own translator
+    post_importers = {}
 
-    for post_file in args.posts:
-        post_importer.import_jsonl(post_file)
+    for post_file in expand_inputs(args.posts):
+        from_csv = is_csv_file(post_file)
+
+        if from_csv not in post_importers:
+            post_translator = get_post_translator(args.source, tag_normalizer, deep_tag_search=True, from_csv=from_csv)
+            post_importers[from_csv] = Importer(db, 'posts', post_translator, tag_normalizer, skip_if_md5_match=True, batch_size=args.batch_size, max_pending=args.pending_batches)
+
+            if args.preload_md5s:
+                post_importers[from_csv].preload_md5s()
+
+        if from_csv:
+            post_importers[from_csv].import_csv(post_file)
+        else:
+            post_importers[from_csv].import_jsonl(post_file, workers=args.workers)
 
     print(json.dumps(tag_normalizer.deep_search_misses))
 
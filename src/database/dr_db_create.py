@@ -22,6 +22,7 @@ def reset_database(db: Database, client: MongoClient):
     posts.create_index(['tags'])
     posts.create_index(['origin_md5'])
     posts.create_index(['image_ratio'])
+    posts.create_index(['source', 'timestamp'])
 
     tags = db.create_collection('tags')
     tags.create_index(['source_id', 'source'], unique=True)
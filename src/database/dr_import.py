@@ -1,5 +1,5 @@
 # import \
-#   --input posts.json \
+#   --posts posts.json \
 #   --tags tags.json \
 #   --source e621 \
 #   --prefilter prefilter.yaml \
@@ -12,18 +12,19 @@
 
 import argparse
 import json
-from typing import Optional, TextIO
-
-from pymongo.errors import DuplicateKeyError
+from typing import Optional, TextIO, Iterator
 
 from database.dr_db_create import reset_database
 from database.importer.alias_importer import AliasImporter
 from database.translator.translator import TagTranslator
 from database.entities.tag import TagProtoEntity
 from database.importer.importer import Importer
+from database.importer.readers import is_csv_file, read_csv
 from database.tag_normalizer.tag_normalizer import TagNormalizer
 from database.translator.helpers import get_post_translator, get_tag_translator, get_alias_translator
 from database.utils.db_utils import connect_to_db
+from database.utils.tag_writer import open_tag_writer, get_tag_upsert
+from utils.jsonl_segments import expand_inputs
 from utils.load_yaml import load_yaml
 from utils.progress import Progress
 
@@ -31,10 +32,10 @@ from utils.progress import Progress
 def get_args():
     parser = argparse.ArgumentParser(prog='Import', description='Import post and tag metadata from e621, gelbooru, and danbooru')
 
-    parser.add_argument('-p', '--posts', metavar='FILE', type=str, action='append', help='Post JSONL file(s) to import', required=True)
-    parser.add_argument('-t', '--tags', metavar='FILE', type=str, help='Tag JSONL file(s)', required=True, action='append')
+    parser.add_argument('-p', '--posts', metavar='FILE', type=str, action='append', help='Post JSONL file(s) or e621 CSV dump(s) (posts-*.csv.gz) to import', required=True)
+    parser.add_argument('-t', '--tags', metavar='FILE', type=str, help='Tag JSONL file(s) or e621 CSV dump(s) (tags-*.csv.gz)', required=True, action='append')
     parser.add_argument('-s', '--source', metavar='SOURCE', type=str, help='Data source [e926, e621, gelbooru, danbooru, rule34]', required=True, choices=['e926', 'e621', 'gelbooru', 'danbooru', 'rule34'])
-    parser.add_argument('-a', '--aliases', metavar='FILE', type=str, help='Tag alias JSONL file(s)', required=False, default=None)
+    parser.add_argument('-a', '--aliases', metavar='FILE', type=str, help='Tag alias JSONL file or e621 CSV dump (tag_aliases-*.csv.gz)', required=False, default=None)
     parser.add_argument('--tag-version', metavar='VERSION', type=str, help='Preferred tag format version [v0, v1, v2]', required=False, default='v2', choices=['v0', 'v1', 'v2'])
     parser.add_argument('--prefilter', metavar='FILE', type=str, help='Prefilter YAML file', required=False, default='../examples/tag_normalizer/prefilter.yaml')
     parser.add_argument('--rewrites', metavar='FILE', type=str, help='Rewritten tags YAML file', required=False, default='../examples/tag_normalizer/rewrites.yaml')
@@ -42,6 +43,9 @@ def get_args():
     parser.add_argument('--category-weights', metavar='FILE', type=str, help='Category weights YAML file', required=False, default='../examples/tag_normalizer/category_weights.yaml')
     parser.add_argument('--symbols', metavar='FILE', type=str, help='Symbols YAML file', required=False, default='../examples/tag_normalizer/symbols.yaml')
     parser.add_argument('--skip-save-tags', help='Do not save tags to the database', default=False, action='store_true')
+    parser.add_argument('--batch-size', metavar='COUNT', type=int, help='Number of posts written to the database at once', required=False, default=1000)
+    parser.add_argument('--pending-batches', metavar='COUNT', type=int, help='Number of post batches written concurrently', required=False, default=4)
+    parser.add_argument('--workers', metavar='COUNT', type=int, help='Number of processes importing each post JSONL file', required=False, default=1)
     parser.add_argument('--remove-old', help='Remove all data from the database before importing', default=False, action='store_true')
 
     return parser.parse_args()
@@ -58,6 +62,15 @@ def stream_tag(tp: TextIO, tag_translator: TagTranslator) -> Optional[TagProtoEn
     return tag_translator.translate(data)
 
 
+def stream_csv_tag(rows: Iterator[dict], tag_translator: TagTranslator) -> Optional[TagProtoEntity]:
+    row = next(rows, None)
+
+    if row is None:
+        return None
+
+    return tag_translator.translate(row)
+
+
 def main():
     args = get_args()
 
@@ -81,7 +94,7 @@ def main():
     aliases = None
 
     if args.aliases is not None:
-        alias_translator = get_alias_translator(args.source)
+        alias_translator = get_alias_translator(args.source, from_csv=is_csv_file(args.aliases))
         alias_importer = AliasImporter(translator=alias_translator)
         aliases = {}
 
@@ -92,36 +105,48 @@ def main():
             aliases[alias.tag_name].append(alias.alias_name)
 
     # process tags
-    tag_translator = get_tag_translator(args.source, aliases=aliases)
     tag_normalizer = TagNormalizer(prefilter=prefilter, symbols=symbols, aspect_ratios=aspect_ratios, rewrites=rewrites, category_naming_order=category_weights)
 
     for tag_file in args.tags:
-        tp = open(tag_file, 'rt')
-        tag_normalizer.load(lambda: stream_tag(tp, tag_translator))
+        if is_csv_file(tag_file):
+            rows = read_csv(tag_file)
+            csv_tag_translator = get_tag_translator(args.source, aliases=aliases, from_csv=True)
+            tag_normalizer.load(lambda: stream_csv_tag(rows, csv_tag_translator))
+        else:
+            tp = open(tag_file, 'rt', encoding='utf-8')
+            tag_translator = get_tag_translator(args.source, aliases=aliases)
+            tag_normalizer.load(lambda: stream_tag(tp, tag_translator))
 
     tag_normalizer.normalize(args.tag_version)
 
     if not args.skip_save_tags:
         save_tags_progress = Progress(title='Saving tags', units='tags')
-        save_tag_errors = 0
-
-        for tag in tag_normalizer.get_tags():
-            save_tags_progress.update()
+        tag_writer = open_tag_writer(db, args.batch_size, args.pending_batches)
 
-            try:
-                db['tags'].replace_one({'source': tag.source, 'source_id': tag.source_id}, vars(tag), upsert=True)
-            except DuplicateKeyError as e:
-                save_tag_errors += 1
-                print(f'Database level duplicate key error on tag "{tag.origin_name}" (#{tag.source_id}) -- tag not saved: {str(e)}')
+        try:
+            for tag in tag_normalizer.get_tags():
+                save_tags_progress.update()
+                tag_writer.add(tag, get_tag_upsert(tag))
+        finally:
+            tag_writer.close()
 
-        save_tags_progress.succeed(f'{save_tags_progress.count} tags saved, {save_tag_errors} errors')
+        save_tags_progress.succeed(f'{tag_writer.write_count} tags saved, {tag_writer.error_count} errors')
 
     # process posts
-    post_translator = get_post_translator(args.source, tag_normalizer)
-    post_importer = Importer(db, 'posts', post_translator, tag_normalizer)
+    # CSV dumps and JSONL crawls have different layouts, and need their own translator
+    post_importers = {}
+
+    for post_file in expand_inputs(args.posts):
+        from_csv = is_csv_file(post_file)
+
+        if from_csv not in post_importers:
+            post_translator = get_post_translator(args.source, tag_normalizer, from_csv=from_csv)
+            post_importers[from_csv] = Importer(db, 'posts', post_translator, tag_normalizer, batch_size=args.batch_size, max_pending=args.pending_batches)
 
-    for post_file in args.posts:
-        post_importer.import_jsonl(post_file)
+        if from_csv:
+            post_importers[from_csv].import_csv(post_file)
+        else:
+            post_importers[from_csv].import_jsonl(post_file, workers=args.workers)
 
 
 if __name__ == "__main__":
@@ -6,11 +6,10 @@ from typing import Generator
 from bson import json_util
 import json
 
-import ndjson
-
 from database.entities.post import PostEntity
 from database.selector.selector import Selector
 from database.utils.db_utils import connect_to_db
+from utils.jsonl_index import IndexedJsonlWriter
 from utils.progress import Progress
 
 def get_args():
@@ -50,17 +49,16 @@ def get_file_parts(path: str, file_subtitle) -> (str, str, str):
 def save_results_to_jsonl(filename: str, results: Generator[PostEntity, None, None], progress: Progress):
     os.makedirs(os.path.dirname(filename), exist_ok=True)
 
-    with open(filename, 'w') as fp:
-        writer = ndjson.writer(fp)
-        i = 0
+    writer = IndexedJsonlWriter(filename, id_field='source_id', append=False)
+
+    for post in results:
+        progress.update()
 
-        for post in results:
-            progress.update()
+        cleaned = json.loads(json_util.dumps(vars(post)))
 
-            cleaned = json.loads(json_util.dumps(vars(post)))
+        writer.writerow(cleaned)
 
-            writer.writerow(cleaned)
-            i += 1
+    writer.close()
 
 
 def main():
@@ -1,7 +1,7 @@
-import json
 from typing import List
 
 from database.entities.tag import AliasEntity
+from database.importer.readers import is_csv_file, read_csv, read_jsonl
 from database.translator.translator import AliasTranslator
 
 
@@ -12,8 +12,16 @@ class AliasImporter:
     def load(self, filename) -> List[AliasEntity]:
         aliases = []
 
-        with open(filename, 'rt') as ap:
-            for line in ap:
-                aliases.append(self.translator.translate(json.loads(line)))
+        if is_csv_file(filename):
+            records = read_csv(filename)
+        else:
+            records = read_jsonl(filename)
+
+        for record in records:
+            alias = self.translator.translate(record)
+
+            # e.g. inactive aliases in a CSV dump
+            if alias is not None:
+                aliases.append(alias)
 
         return aliases
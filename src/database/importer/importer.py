@@ -1,33 +1,116 @@
 import json
-import pymongo.errors
+import multiprocessing
+import threading
+from functools import partial
+from typing import List, Tuple, Any, Optional, Dict
 
+from pymongo import ReplaceOne, UpdateOne
 from pymongo.database import Database
 
+from database.entities.post import PostEntity
+from database.importer.readers import read_csv, get_line_ranges
 from database.tag_normalizer.tag_normalizer import TagNormalizer
 from database.translator.translator import PostTranslator
+from database.utils.bulk_writer import BulkWriter, Describe
+from database.utils.content_hash import get_content_hash, get_changed_fields
+from database.utils.db_utils import connect_to_db
+from utils.jsonl_index import load_index
 from utils.progress import Progress
 
 
 class Importer:
-    def __init__(self, db: Database, collection: str, translator: PostTranslator, tag_normalizer: TagNormalizer, skip_if_md5_match: bool = False):
+    def __init__(self, db: Database, collection: str, translator: PostTranslator, tag_normalizer: TagNormalizer, skip_if_md5_match: bool = False, batch_size: int = 1000, max_pending: int = 4):
         self.translator = translator
         self.db = db
         self.collection = collection
         self.tag_normalizer = tag_normalizer
         self.skip_if_md5_match = skip_if_md5_match
 
-    def import_jsonl(self, input_file: str):
-        progress = Progress(title='Importing posts', units='posts')
-        collection = self.db[self.collection]
+        # posts are written in unordered bulk writes of `batch_size`, with up to `max_pending` of them in flight
+        self.batch_size = batch_size
+        self.max_pending = max_pending
 
-        cur_line = 0
-        mongo_errors = 0
+        # MD5s known to be in the database, or written by this importer (the database may not know them yet while
+        # their batch is in flight); with `preload_md5s`, this holds all MD5s in the collection
+        self.known_md5s = set()
+        self.md5s_preloaded = False
+
+        # `import_records` may be called from several crawler threads at once
+        self.md5_lock = threading.Lock()
+
+    def open_writer(self, describe: Describe) -> 'PostWriter':
+        return PostWriter(self.db[self.collection], batch_size=self.batch_size, max_pending=self.max_pending, describe=describe)
+
+    def close_writer(self, writer: 'PostWriter'):
+        try:
+            self.write_pending(writer)
+        finally:
+            writer.close()
+
+    def preload_md5s(self):
+        """
+        Load the MD5s of all posts in the collection at once, instead of looking them up per batch
+        """
+        progress = Progress(title='Loading post MD5s', units='posts')
+
+        # only needs the `origin_md5` index
+        for post in self.db[self.collection].find({'origin_md5': {'$ne': None}}, {'origin_md5': 1, '_id': 0}):
+            progress.update()
+            self.known_md5s.add(post['origin_md5'])
+
+        self.md5s_preloaded = True
+        progress.succeed(f'{len(self.known_md5s)} MD5s loaded')
+
+    def import_jsonl(self, input_file: str, workers: int = 1):
+        """
+        Import a JSONL file of posts; with `workers` > 1, ranges of the file are imported by that many processes
+        """
+        index = load_index(input_file)
+
+        # the sidecar index (if any) knows the number of posts without reading the file
+        if index is not None:
+            progress = Progress(title=f'Importing {len(index)} posts', units='posts')
+            index.close()
+        else:
+            progress = Progress(title='Importing posts', units='posts')
+
+        if workers > 1:
+            (cur_line, mongo_errors, json_errors) = self.import_jsonl_parallel(input_file, workers, progress)
+        else:
+            writer = self.open_writer(lambda line: f'Could not import record on line #{line} of {input_file}')
+
+            try:
+                (cur_line, json_errors) = self.import_jsonl_range(writer, input_file, 0, None, 1, progress)
+            finally:
+                self.close_writer(writer)
+
+            mongo_errors = writer.error_count
+
+        total_errors = json_errors + mongo_errors
+        progress.succeed(f'{cur_line - total_errors} posts imported, {total_errors} errors')
+        return cur_line, mongo_errors, json_errors
+
+    def import_jsonl_range(self, writer: BulkWriter, input_file: str, start: int, end: Optional[int], first_line: int, progress: Optional[Progress] = None) -> Tuple[int, int]:
+        """
+        Import the lines between the byte offsets `start` and `end` (exclusive; None for the end of the file), which
+        must be line boundaries. Returns the number of lines and JSON errors.
+        """
+        cur_line = first_line - 1
         json_errors = 0
 
-        with open(input_file, 'rt') as fp:
+        with open(input_file, 'rb') as fp:
+            fp.seek(start)
+            offset = start
+
             for line in fp:
+                if end is not None and offset >= end:
+                    break
+
+                offset += len(line)
                 cur_line += 1
-                progress.update(cur_line)
+
+                if progress is not None:
+                    progress.update(cur_line)
 
                 try:
                     data = json.loads(line)
@@ -36,34 +119,222 @@ class Importer:
                     print(f'Invalid JSON found on line #{cur_line} of {input_file}: {e}')
                     continue
 
-                record = self.translator.translate(data)
+                self.import_data(writer, cur_line, data)
 
-                if record is None:
-                    continue
+        return cur_line - first_line + 1, json_errors
 
-                record.tags.extend(self.tag_normalizer.get_pseudo_tags(record))
+    def import_jsonl_parallel(self, input_file: str, workers: int, progress: Progress) -> Tuple[int, int, int]:
+        global _worker_importer
 
-                # remove duplicates
-                record.tags = list(set(record.tags))
+        # several ranges per worker, so that a slow range does not leave the other workers idle at the end
+        ranges = get_line_ranges(input_file, workers * 8)
 
-                if self.skip_if_md5_match and record.origin_md5 is not None:
-                    existing_record = collection.find_one({
-                        'origin_md5': record.origin_md5
-                    })
+        cur_line = 0
+        mongo_errors = 0
+        json_errors = 0
 
-                    if existing_record is not None:
-                        continue
+        # forked workers share the normalized tag maps with this process (copy-on-write) instead of loading
+        # them again; each worker opens its own database connection, as MongoClient is not fork-safe
+        _worker_importer = self
 
-                try:
-                    collection.replace_one({
-                        'source': record.source,
-                        'source_id': record.source_id
-                    }, vars(record), upsert=True)
-                except pymongo.errors.PyMongoError as e:
-                    mongo_errors += 1
-                    print(f'Could not import record on line #{cur_line} of {input_file}: {e}')
-                    continue
+        if self.translator.deep_tag_search:
+            self.tag_normalizer.get_deep_search_index()
+
+        try:
+            with multiprocessing.get_context('fork').Pool(workers, initializer=init_import_worker) as pool:
+                for (lines, range_mongo_errors, range_json_errors, misses) in pool.imap_unordered(partial(import_jsonl_worker, input_file), ranges):
+                    cur_line += lines
+                    mongo_errors += range_mongo_errors
+                    json_errors += range_json_errors
+                    progress.update(cur_line)
+
+                    for (tag_name, count) in misses.items():
+                        self.tag_normalizer.deep_search_misses[tag_name] = self.tag_normalizer.deep_search_misses.get(tag_name, 0) + count
+        finally:
+            _worker_importer = None
 
-        total_errors = json_errors + mongo_errors
-        progress.succeed(f'{cur_line - total_errors} posts imported, {total_errors} errors')
         return cur_line, mongo_errors, json_errors
+
+    def import_csv(self, input_file: str):
+        """
+        Import a (gzipped) CSV dump, e.g. e621's `posts-YYYY-MM-DD.csv.gz`; requires a CSV translator
+        """
+        progress = Progress(title='Importing posts', units='posts')
+        writer = self.open_writer(lambda row: f'Could not import row #{row} of {input_file}')
+
+        cur_row = 0
+        csv_errors = 0
+
+        try:
+            for data in read_csv(input_file):
+                cur_row += 1
+                progress.update(cur_row)
+
+                try:
+                    self.import_data(writer, cur_row, data)
+                except (KeyError, ValueError, ZeroDivisionError) as e:
+                    csv_errors += 1
+                    print(f'Invalid post found in row #{cur_row} of {input_file}: {e}')
+        finally:
+            self.close_writer(writer)
+
+        mongo_errors = writer.error_count
+        total_errors = csv_errors + mongo_errors
+        progress.succeed(f'{cur_row - total_errors} posts imported, {total_errors} errors')
+        return cur_row, mongo_errors, csv_errors
+
+    def import_records(self, records: List[dict]) -> Tuple[int, int]:
+        """
+        Import already decoded post records, e.g. a page of posts straight from the crawler
+        """
+        writer = self.open_writer(lambda record_id: f'Could not import record #{record_id}')
+
+        try:
+            for data in records:
+                self.import_data(writer, data.get('id'), data)
+        finally:
+            self.close_writer(writer)
+
+        return len(records) - writer.error_count, writer.error_count
+
+    def import_data(self, writer: 'PostWriter', label: Any, data: dict):
+        record = self.translator.translate(data)
+
+        if record is None:
+            return
+
+        record.tags.extend(self.tag_normalizer.get_pseudo_tags(record))
+
+        # remove duplicates; sorted, so that the content hash does not depend on the order
+        record.tags = sorted(set(record.tags))
+
+        writer.pending_records.append((label, record))
+
+        if len(writer.pending_records) >= self.batch_size:
+            self.write_pending(writer)
+
+    def write_pending(self, writer: 'PostWriter'):
+        records = writer.pending_records
+        writer.pending_records = []
+
+        if self.skip_if_md5_match:
+            records = self.filter_known_md5s(writer, records)
+
+        self.write_records(writer, records)
+
+    def filter_known_md5s(self, writer: BulkWriter, records: List[Tuple[Any, PostEntity]]) -> List[Tuple[Any, PostEntity]]:
+        """
+        Posts whose MD5 is not in the database yet, with one `$in` lookup per batch (none if the MD5s were preloaded)
+        """
+        with self.md5_lock:
+            if not self.md5s_preloaded:
+                md5s = list(set([record.origin_md5 for (_, record) in records if record.origin_md5 is not None]))
+
+                if len(md5s) > 0:
+                    self.known_md5s.update([post['origin_md5'] for post in writer.collection.find({'origin_md5': {'$in': md5s}}, {'origin_md5': 1, '_id': 0})])
+
+            new_records = []
+
+            for (label, record) in records:
+                if record.origin_md5 is not None:
+                    # also skips later duplicates within the batch
+                    if record.origin_md5 in self.known_md5s:
+                        continue
+
+                    self.known_md5s.add(record.origin_md5)
+
+                new_records.append((label, record))
+
+        return new_records
+
+    def write_records(self, writer: BulkWriter, records: List[Tuple[Any, PostEntity]]):
+        """
+        Insert new posts, and only `$set` the changed fields of posts that are already in the database; posts with an
+        unchanged content hash only get a new timestamp (which the refresh crawl relies on)
+        """
+        if len(records) == 0:
+            return
+
+        documents = {}
+
+        for (label, record) in records:
+            document = vars(record)
+            document['content_hash'] = get_content_hash(document)
+            documents[(record.source, record.source_id)] = (label, document)
+
+        hashes = self.find_posts(writer, list(documents.keys()), {'source': 1, 'source_id': 1, 'content_hash': 1, '_id': 0})
+        changed_keys = []
+
+        for (key, (label, document)) in documents.items():
+            if key not in hashes:
+                writer.add(label, ReplaceOne({'source': key[0], 'source_id': key[1]}, document, upsert=True))
+            elif hashes[key].get('content_hash') == document['content_hash']:
+                writer.add(label, UpdateOne({'source': key[0], 'source_id': key[1]}, {'$set': {'timestamp': document['timestamp']}}))
+            else:
+                changed_keys.append(key)
+
+        # full documents are only read for the posts that changed
+        existing_documents = self.find_posts(writer, changed_keys) if len(changed_keys) > 0 else {}
+
+        for key in changed_keys:
+            (label, document) = documents[key]
+
+            if key not in existing_documents:
+                writer.add(label, ReplaceOne({'source': key[0], 'source_id': key[1]}, document, upsert=True))
+                continue
+
+            (changed, removed) = get_changed_fields(document, existing_documents[key])
+            update = {'$set': changed}
+
+            if len(removed) > 0:
+                update['$unset'] = {field: '' for field in removed}
+
+            writer.add(label, UpdateOne({'source': key[0], 'source_id': key[1]}, update))
+
+    @staticmethod
+    def find_posts(writer: BulkWriter, keys: List[Tuple[str, str]], projection: Optional[dict] = None) -> Dict[Tuple[str, str], dict]:
+        # served by the unique (source_id, source) index
+        cursor = writer.collection.find({
+            'source_id': {'$in': list(set([source_id for (_, source_id) in keys]))},
+            'source': {'$in': list(set([source for (source, _) in keys]))}
+        }, projection)
+
+        return {(post['source'], post['source_id']): post for post in cursor}
+
+
+class PostWriter(BulkWriter):
+    """
+    Bulk writer of one import, which also holds its translated posts until their batch has been checked against
+    the database
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending_records: List[Tuple[Any, PostEntity]] = []
+
+
+# the importer of a worker process, see `Importer.import_jsonl_parallel`
+_worker_importer: Optional[Importer] = None
+
+
+def init_import_worker():
+    (db, _) = connect_to_db(db_name=_worker_importer.db.name)
+    _worker_importer.db = db
+
+    # deep search misses are reported per range, and added up by the parent
+    _worker_importer.tag_normalizer.deep_search_misses.clear()
+
+
+def import_jsonl_worker(input_file: str, line_range: Tuple[int, int, int]) -> Tuple[int, int, int, Dict[str, int]]:
+    (start, end, first_line) = line_range
+    importer = _worker_importer
+    writer = importer.open_writer(lambda line: f'Could not import record on line #{line} of {input_file}')
+
+    try:
+        (lines, json_errors) = importer.import_jsonl_range(writer, input_file, start, end, first_line)
+    finally:
+        importer.close_writer(writer)
+
+    misses = dict(importer.tag_normalizer.deep_search_misses)
+    importer.tag_normalizer.deep_search_misses.clear()
+
+    return lines, writer.error_count, json_errors, misses
@@ -0,0 +1,82 @@
+import csv
+import gzip
+import json
+import os
+import sys
+from typing import Iterator, TextIO, List, Tuple
+
+
+# e621 db_export dumps (https://e621.net/db_export/) are CSV files with a header row, usually gzipped
+def is_csv_file(filename: str) -> bool:
+    return filename.endswith('.csv') or filename.endswith('.csv.gz')
+
+
+def open_text(filename: str) -> TextIO:
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rt', encoding='utf-8', newline='')
+
+    return open(filename, 'rt', encoding='utf-8', newline='')
+
+
+def read_csv(filename: str) -> Iterator[dict]:
+    """
+    Stream the rows of a (gzipped) CSV file as dicts, keyed by the header row
+    """
+    # post descriptions can be much longer than the default field limit of 128 KB
+    csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+
+    with open_text(filename) as fp:
+        for row in csv.DictReader(fp):
+            yield row
+
+
+def read_jsonl(filename: str) -> Iterator[dict]:
+    with open(filename, 'rt', encoding='utf-8') as fp:
+        for line in fp:
+            if line.strip() != '':
+                yield json.loads(line)
+
+
+def get_line_ranges(filename: str, count: int, chunk_size: int = 16 * 1024 * 1024) -> List[Tuple[int, int, int]]:
+    """
+    Split a file into about `count` byte ranges that start and end at line boundaries. Returns the start and end
+    (exclusive) of each range, and the (one-based) number of its first line.
+    """
+    size = os.path.getsize(filename)
+    targets = [size * part // count for part in range(1, count)]
+    boundaries = [0]
+    line_numbers = [1]
+
+    # one pass over the file; counting newlines is much faster than parsing the lines
+    with open(filename, 'rb') as fp:
+        offset = 0
+        lines = 0
+
+        while len(targets) > 0:
+            chunk = fp.read(chunk_size)
+
+            if len(chunk) == 0:
+                break
+
+            while len(targets) > 0 and targets[0] < offset + len(chunk):
+                newline = chunk.find(b'\n', max(0, targets[0] - offset))
+
+                if newline < 0:
+                    # the line continues in the next chunk; look for its end there
+                    targets[0] = offset + len(chunk)
+                    break
+
+                boundary = offset + newline + 1
+                boundaries.append(boundary)
+                line_numbers.append(lines + chunk.count(b'\n', 0, newline + 1) + 1)
+
+                # ranges that would be empty are skipped
+                while len(targets) > 0 and targets[0] < boundary:
+                    targets.pop(0)
+
+            lines += chunk.count(b'\n')
+            offset += len(chunk)
+
+    boundaries.append(size)
+
+    return [(start, end, first_line) for (start, end, first_line) in zip(boundaries[:-1], boundaries[1:], line_numbers) if end > start]
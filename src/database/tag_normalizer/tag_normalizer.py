@@ -37,6 +37,10 @@ class TagNormalizer:
 
     deep_search_misses: Dict[str, int] = {}
 
+    # reference name or alias => TagEntity, built on the first deep search and reset when tags are added or removed
+    deep_search_index: Optional[Dict[str, TagEntity]] = None
+    deep_search_index_size: int = 0
+
     def __init__(self, prefilter: Dict[str, bool] = None, symbols: List[str] = None, aspect_ratios: List[str] = None, rewrites: Dict[str, dict] = None, category_naming_order: Dict[Category, int] = None):
         if prefilter is None:
             prefilter = {}
@@ -131,6 +135,7 @@ class TagNormalizer:
     # only use when reconstructing tag normalizer from the database
     def add_database_tag(self, tag: TagEntity, version: TagVersion):
         self.id_map[self.get_unique_tag_id(tag)] = tag
+        self.deep_search_index = None
         self.original_map[tag.reference_name] = tag
 
         self.ref_map[tag.preferred_name] = TagRef(
@@ -211,6 +216,7 @@ class TagNormalizer:
 
         self.id_map[tag_id] = t
         self.original_map[tag.reference_name] = t
+        self.deep_search_index = None
         return t
 
     def to_v2_tag(self, proto_tag: Union[TagProtoEntity, TagEntity], short: bool = False) -> str:
@@ -302,6 +308,7 @@ class TagNormalizer:
                             preserved_tag = old_tag if tag.post_count <= old_tag.post_count else tag
 
                             self.id_map.pop(self.get_unique_tag_id(removed_tag))
+                            self.deep_search_index = None
 
                             for ref in [removed_tag.v1_name, removed_tag.v2_name, removed_tag.v2_short, removed_tag.origin_name]:
                                 if ref in self.ref_map and self.ref_map[ref].tag == removed_tag:
@@ -427,14 +434,31 @@ class TagNormalizer:
     def get_by_original_name(self, tag_name: str) -> Optional[TagEntity]:
         return self.original_map.get(tag_name, None)
 
-    def get_by_deep_search(self, tag_name: str) -> Optional[TagEntity]:
+    def build_deep_search_index(self) -> Dict[str, TagEntity]:
+        index = {}
+
+        # the first tag with a matching reference name or alias wins, like in a scan of `id_map`
         for tag in self.id_map.values():
-            if tag.reference_name == tag_name:
-                return tag
+            index.setdefault(tag.reference_name, tag)
+
+            for alias in tag.aliases or []:
+                index.setdefault(alias, tag)
+
+        return index
 
-            if tag.aliases is not None:
-                if tag_name in tag.aliases:
-                    return tag
+    def get_deep_search_index(self) -> Dict[str, TagEntity]:
+        # `id_map` is shared between normalizers, which do not reset each other's index
+        if self.deep_search_index is None or self.deep_search_index_size != len(self.id_map):
+            self.deep_search_index = self.build_deep_search_index()
+            self.deep_search_index_size = len(self.id_map)
+
+        return self.deep_search_index
+
+    def get_by_deep_search(self, tag_name: str) -> Optional[TagEntity]:
+        tag = self.get_deep_search_index().get(tag_name)
+
+        if tag is not None:
+            return tag
 
         print(f'Warning: could not locate relevant tag for "{tag_name}" -- ignored')
         self.deep_search_misses[tag_name] = self.deep_search_misses.get(tag_name, 0) + 1
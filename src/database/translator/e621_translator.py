@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
 import json
 
@@ -98,3 +98,90 @@ class E621AliasTranslator(AliasTranslator):
             tag_name=data['consequent_name'],
             alias_name=data['antecedent_name']
         )
+
+
+def get_e621_file_url(md5: str, ext: str, kind: Optional[str] = None) -> str:
+    directory = 'data' if kind is None else f'data/{kind}'
+    return f'https://static1.e621.net/{directory}/{md5[0:2]}/{md5[2:4]}/{md5}.{ext}'
+
+
+def parse_e621_csv_date(value: str) -> datetime:
+    # e.g. `2023-01-31 12:34:56.789123`, in UTC; older rows have no fractional seconds
+    date_format = '%Y-%m-%d %H:%M:%S.%f' if '.' in value else '%Y-%m-%d %H:%M:%S'
+    return datetime.strptime(value, date_format).replace(tzinfo=timezone.utc)
+
+
+def fit_size(width: int, height: int, max_width: int, max_height: int):
+    scale = min(1.0, max_width / width, max_height / height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+# Translators for the daily database exports (`db_export/posts-*.csv.gz` etc.). The dumps have the same data as the
+# API, but flattened into CSV columns: all values are strings, tags are one space-separated `tag_string`, sources are
+# newline-separated, booleans are `t`/`f`, and the image URLs are left out (they are derived from the MD5).
+class E621CsvPostTranslator(PostTranslator):
+    def translate(self, data: dict) -> Optional[PostEntity]:
+        md5 = data['md5']
+        ext = data['file_ext']
+
+        if data.get('is_deleted') == 't' or md5 == '':
+            return None
+
+        width = int(data['image_width'])
+        height = int(data['image_height'])
+
+        p = PostEntity()
+
+        p.source = Source.E621
+        p.source_id = str(data['id'])
+
+        p.rating = data['rating']
+
+        p.tags = self.normalize_tags([tag for tag in data['tag_string'].split(' ') if tag != ''])
+
+        p.description = data['description']
+
+        p.origin_urls = [source for source in data['source'].splitlines() if source.strip() != '']
+        p.origin_md5 = md5
+        p.origin_format = ext
+        p.origin_size = int(data['file_size'])
+
+        p.image_url = get_e621_file_url(md5, ext)
+        p.image_width = width
+        p.image_height = height
+        p.image_ratio = round(p.image_width / p.image_height, 2)
+
+        # previews fit into 150x150; samples are 850 pixels wide, and only exist for larger images (and videos)
+        p.small_url = get_e621_file_url(md5, 'jpg', 'preview')
+        (p.small_width, p.small_height) = fit_size(width, height, 150, 150)
+
+        if width > 850 or ext in ['webm', 'mp4']:
+            p.medium_url = get_e621_file_url(md5, 'jpg', 'sample')
+            (p.medium_width, p.medium_height) = fit_size(width, height, 850, height)
+        else:
+            p.medium_url = p.image_url
+            (p.medium_width, p.medium_height) = (width, height)
+
+        p.score = int(data['score'])
+        p.favorites_count = int(data['fav_count'])
+        p.comment_count = int(data['comment_count'])
+        # view count not available
+
+        p.created_at = parse_e621_csv_date(data['created_at'])
+        p.timestamp = datetime.now()
+
+        return p
+
+
+class E621CsvTagTranslator(E621TagTranslator):
+    def translate(self, data: dict) -> Optional[TagProtoEntity]:
+        return super().translate({**data, 'category': int(data['category']), 'post_count': int(data['post_count'])})
+
+
+class E621CsvAliasTranslator(E621AliasTranslator):
+    def translate(self, data: dict) -> Optional[AliasEntity]:
+        # the dump also lists pending, retired and deleted aliases
+        if data.get('status', 'active') != 'active':
+            return None
+
+        return super().translate(data)
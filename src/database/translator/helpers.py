@@ -5,11 +5,17 @@ from database.translator.gelbooru_translator import GelbooruPostTranslator
 from database.translator.rule34_translator import Rule34PostTranslator
 from database.utils.enums import Source
 from database.tag_normalizer.tag_normalizer import TagNormalizer
-from database.translator.e621_translator import E621PostTranslator, E621TagTranslator, E621AliasTranslator
+from database.translator.e621_translator import E621PostTranslator, E621TagTranslator, E621AliasTranslator, E621CsvPostTranslator, E621CsvTagTranslator, E621CsvAliasTranslator
 from database.translator.translator import PostTranslator, TagTranslator, AliasTranslator
 
 
-def get_post_translator(source: Source, tag_normalizer: TagNormalizer, deep_tag_search: bool = False) -> PostTranslator:
+def get_post_translator(source: Source, tag_normalizer: TagNormalizer, deep_tag_search: bool = False, from_csv: bool = False) -> PostTranslator:
+    if from_csv:
+        if source == Source.E621:
+            return E621CsvPostTranslator(tag_normalizer, deep_tag_search=deep_tag_search)
+
+        raise NotImplementedError(f'Unsupported CSV post translator source (\'{source}\')')
+
     if source == Source.E621:
         return E621PostTranslator(tag_normalizer, deep_tag_search=deep_tag_search)
     elif source == Source.RULE34:
@@ -22,15 +28,21 @@ def get_post_translator(source: Source, tag_normalizer: TagNormalizer, deep_tag_
     raise NotImplementedError(f'Unsupported post translator source (\'{source}\')')
 
 
-def get_tag_translator(source: Source, aliases: Optional[Dict[str, List[str]]]) -> TagTranslator:
+def get_tag_translator(source: Source, aliases: Optional[Dict[str, List[str]]], from_csv: bool = False) -> TagTranslator:
     if source == Source.E621:
+        if from_csv:
+            return E621CsvTagTranslator(aliases=aliases)
+
         return E621TagTranslator(aliases=aliases)
 
     raise NotImplementedError(f'Unsupported tag translator source (\'{source}\')')
 
 
-def get_alias_translator(source: Source) -> AliasTranslator:
+def get_alias_translator(source: Source, from_csv: bool = False) -> AliasTranslator:
     if source == Source.E621:
+        if from_csv:
+            return E621CsvAliasTranslator()
+
         return E621AliasTranslator()
 
     raise NotImplementedError(f'Unsupported alias translator source (\'{source}\')')
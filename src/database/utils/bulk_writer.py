@@ -0,0 +1,94 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Deque, List, Tuple, Optional, Set
+
+import pymongo.errors
+from pymongo.collection import Collection
+
+# label of an operation (e.g. a line number) -> error message prefix, e.g. `Could not import record on line #12`
+Describe = Callable[[Any], str]
+
+
+class BulkWriter:
+    """
+    Sends write operations (`ReplaceOne`, `UpdateOne`, ...) as unordered `bulk_write` batches of `batch_size`,
+    with up to `max_pending` batches in flight. A failed operation does not stop the others; its error is
+    reported with the label it was added with. With `skip_codes`, only errors with those codes (e.g. 11000,
+    duplicate key) are reported and skipped, and any other error is raised.
+    """
+    def __init__(self, collection: Collection, batch_size: int = 1000, max_pending: int = 4, describe: Optional[Describe] = None, skip_codes: Optional[Set[int]] = None):
+        self.collection = collection
+        self.batch_size = max(1, batch_size)
+        self.max_pending = max(1, max_pending)
+        self.describe = describe or (lambda label: f'Could not write record {label}')
+        self.skip_codes = skip_codes
+
+        self.batch: List[Tuple[Any, Any]] = []
+        self.pending: Deque[Tuple[List[Tuple[Any, Any]], Future]] = deque()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_pending)
+
+        self.write_count = 0
+        self.error_count = 0
+
+        # labels of the operations that failed
+        self.failed_labels: List[Any] = []
+
+    def add(self, label: Any, operation):
+        self.batch.append((label, operation))
+
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.batch) == 0:
+            return
+
+        # keep at most `max_pending` batches in flight
+        while len(self.pending) >= self.max_pending:
+            self.complete(*self.pending.popleft())
+
+        batch = self.batch
+        self.batch = []
+        self.pending.append((batch, self.executor.submit(self.collection.bulk_write, [operation for (_, operation) in batch], ordered=False)))
+
+    def wait(self):
+        """
+        Send the current batch and wait for all batches to complete
+        """
+        self.flush()
+
+        while len(self.pending) > 0:
+            self.complete(*self.pending.popleft())
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def complete(self, batch: List[Tuple[Any, Any]], future: Future):
+        try:
+            future.result()
+            self.write_count += len(batch)
+        except pymongo.errors.BulkWriteError as e:
+            write_errors = e.details.get('writeErrors', [])
+
+            if self.skip_codes is not None and any([error.get('code') not in self.skip_codes for error in write_errors]):
+                raise
+
+            # `index` is the position of the failed operation within its batch
+            for error in write_errors:
+                self.error_count += 1
+                self.failed_labels.append(batch[error["index"]][0])
+                print(f'{self.describe(batch[error["index"]][0])}: {error.get("errmsg")}')
+
+            self.write_count += len(batch) - len(write_errors)
+        except pymongo.errors.PyMongoError as e:
+            if self.skip_codes is not None:
+                raise
+
+            # the whole batch failed, e.g. the connection was lost
+            self.error_count += len(batch)
+            self.failed_labels.extend([label for (label, _) in batch])
+
+            print(f'{self.describe(batch[0][0])} (and {len(batch) - 1} more in the same batch): {e}')
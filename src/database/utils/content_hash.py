@@ -0,0 +1,38 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Any, List, Tuple
+
+# fields that do not count as a change of a post: `timestamp` is set on every import
+IGNORED_FIELDS = ['_id', 'timestamp', 'content_hash']
+
+
+def get_content_hash(document: dict) -> str:
+    content = {key: value for (key, value) in document.items() if key not in IGNORED_FIELDS}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def normalize_value(value: Any) -> Any:
+    # MongoDB returns datetimes as naive UTC, in milliseconds
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+    return value
+
+
+def get_changed_fields(document: dict, existing: dict) -> Tuple[dict, List[str]]:
+    """
+    Fields of `document` that differ from the `existing` database document, and fields that are only in `existing`
+    """
+    changed = {
+        key: value
+        for (key, value) in document.items()
+        if key not in existing or normalize_value(value) != normalize_value(existing[key])
+    }
+
+    removed = [key for key in existing if key != '_id' and key not in document]
+
+    return changed, removed
@@ -0,0 +1,24 @@
+from pymongo import ReplaceOne
+from pymongo.database import Database
+
+from database.entities.tag import TagEntity
+from database.utils.bulk_writer import BulkWriter
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def get_tag_upsert(tag: TagEntity) -> ReplaceOne:
+    return ReplaceOne({'source': tag.source, 'source_id': tag.source_id}, vars(tag), upsert=True)
+
+
+def open_tag_writer(db: Database, batch_size: int = 1000, max_pending: int = 4) -> BulkWriter:
+    """
+    Bulk writer for tag upserts; tags that fail on a duplicate key are reported and skipped, other errors are raised
+    """
+    return BulkWriter(
+        db['tags'],
+        batch_size=batch_size,
+        max_pending=max_pending,
+        describe=lambda tag: f'Database level duplicate key error on tag "{tag.origin_name}" (#{tag.source_id}) -- tag not saved',
+        skip_codes={DUPLICATE_KEY_ERROR}
+    )
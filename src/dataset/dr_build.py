@@ -10,6 +10,7 @@ import s3fs
 from database.entities.post import PostEntity
 from dataset.utils.format import format_posts_for_dataset
 from dataset.utils.split import split_posts
+from utils.jsonl_segments import expand_inputs
 from utils.progress import Progress
 
 
@@ -47,7 +48,7 @@ def main():
     args = get_args()
 
     print("Splitting posts...")
-    split_filenames = split_posts(args.samples, args.limit, args.num_proc)
+    split_filenames = split_posts(expand_inputs(args.samples), args.limit, args.num_proc)
 
     # generate dataset
     print('Generating the dataset & downloading images...')
@@ -1,5 +1,4 @@
 import argparse
-import ndjson
 import random
 import json
 import os
@@ -10,6 +9,7 @@ from database.utils.db_utils import connect_to_db
 from database.utils.enums import numeric_categories
 from dataset.utils.balance import balance_selections
 from dataset.utils.prune import prune_and_filter_tags
+from utils.jsonl_index import IndexedJsonlWriter
 from utils.progress import Progress
 from utils.load_yaml import load_yaml
 from dataset.utils.selection_source import SelectionSource
@@ -128,13 +128,12 @@ def main():
     random.shuffle(posts)
 
     os.makedirs(os.path.dirname(args.output), exist_ok=True)
-    fp = open(args.output, 'w')
-    writer = ndjson.writer(fp)
+    writer = IndexedJsonlWriter(args.output, id_field='source_id', append=False)
 
     for post in posts:
         writer.writerow(vars(post))
 
-    fp.close()
+    writer.close()
 
     print('Done!')
     print(f'{len(posts)} samples with {len(tag_counts)} tags stored in {args.output}')
@@ -1,24 +1,35 @@
-from datetime import timedelta
 from typing import Optional
+from urllib.parse import urlparse
 
 import requests
 from requests.adapters import HTTPAdapter, Retry
-from call_throttle import throttle
 
 from database.entities.post import PostEntity
+from utils.rate_limiter import get_rate_limiter
 
 global_session = requests.Session()
-global_retries = Retry(total=10, backoff_factor=0.1)
+# 429 and 503 responses are left to the adaptive rate limiter
+global_retries = Retry(total=10, backoff_factor=0.1, respect_retry_after_header=False)
 
 global_session.mount('http://', HTTPAdapter(max_retries=global_retries))
 global_session.mount('https://', HTTPAdapter(max_retries=global_retries))
 
+global_max_rejections = 10
+
 
-@throttle(calls=12, period=timedelta(seconds=1))
 def global_fetch(url, agent: str) -> Optional[bytes]:
-    r = requests.get(url, headers={
-        'user-agent': agent
-    }, allow_redirects=True)
+    # max 12 requests/s per site (unless a crawler set up its budget first); slows down when the site starts rejecting requests
+    rate_limiter = get_rate_limiter(urlparse(url).netloc, calls=12, period=1)
+
+    for attempt in range(global_max_rejections):
+        rate_limiter.acquire()
+
+        r = global_session.get(url, headers={
+            'user-agent': agent
+        }, allow_redirects=True)
+
+        if not rate_limiter.feedback(r.status_code, r.headers):
+            break
 
     r.raise_for_status()  # Raise an exception for non-200 status codes
     return r.content
@@ -30,7 +30,7 @@ def format_posts_for_dataset(shards):
             if limit is not None and count >= limit:
                 return
 
-            with open(sample_file, 'rt') as ap:
+            with open(sample_file, 'rt', encoding='utf-8') as ap:
                 for line in ap:
                     if limit is not None and count >= limit:
                         return
@@ -4,6 +4,7 @@ import os
 from typing import List
 
 from database.entities.post import PostEntity
+from utils.jsonl_segments import expand_inputs
 
 class SelectionSource:
     def __init__(self, filename_with_ratio: str, skip_load = False):
@@ -30,12 +31,13 @@ class SelectionSource:
         posts = []
         selector_name = os.path.splitext(os.path.basename(filename))[0]
 
-        with open(filename, 'r') as fp:
-            for line in fp:
-                p = PostEntity(json.loads(line))
-                p.selector = selector_name
+        for fn in expand_inputs([filename]):
+            with open(fn, 'r', encoding='utf-8') as fp:
+                for line in fp:
+                    p = PostEntity(json.loads(line))
+                    p.selector = selector_name
 
-                posts.append(p)
+                    posts.append(p)
 
         return posts
 
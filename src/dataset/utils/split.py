@@ -1,28 +1,56 @@
 from typing import List, Optional
 import os
 
+from utils.jsonl_index import load_index
+
 
 def split_posts(samples: List[str], limit: Optional[int], shards: int) -> List[str]:
     count = 0
     base_dir = os.path.dirname(samples[0])
 
     shard_filenames = [os.path.join(base_dir, f'.tmp.shard_{i}.jsonl') for i in range(shards)]
-    shard_fp = [open(fn, 'wt') for fn in shard_filenames]
+    shard_fp = [open(fn, 'wb') for fn in shard_filenames]
 
     for sample_file in samples:
         if limit is not None and count >= limit:
+            break
+
+        index = load_index(sample_file)
+
+        if index is not None:
+            # indexed files are split into contiguous byte ranges, without reading them line by line
+            take = len(index) if limit is None else min(len(index), limit - count)
+
+            with open(sample_file, 'rb') as ap:
+                for shard in range(shards):
+                    (start, end) = index.get_byte_range(take * shard // shards, take * (shard + 1) // shards)
+                    ap.seek(start)
+                    copy_bytes(ap, shard_fp[shard], end - start)
+
+            index.close()
+            count += take
             continue
 
-        with open(sample_file, 'rt') as ap:
+        with open(sample_file, 'rb') as ap:
             for line in ap:
-                shard_fp[count % shards].write(line)
-
                 if limit is not None and count >= limit:
-                    continue
+                    break
 
+                shard_fp[count % shards].write(line)
                 count += 1
 
     for fp in shard_fp:
         fp.close()
 
     return shard_filenames
+
+
+def copy_bytes(src, dst, size: int, chunk_size: int = 1024 * 1024):
+    while size > 0:
+        chunk = src.read(min(chunk_size, size))
+
+        if len(chunk) == 0:
+            break
+
+        dst.write(chunk)
+        size -= len(chunk)
@@ -0,0 +1,284 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from typing import List
+
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, AutoReconnect, PyMongoError
+
+from crawl.crawler.mock_server import MockBooruCorpus
+from database.importer.importer import Importer
+from database.importer.readers import get_line_ranges
+from database.tag_normalizer.tag_normalizer import TagNormalizer
+from database.translator.helpers import get_post_translator
+from database.utils.bulk_writer import BulkWriter
+from database.utils.enums import Source
+
+
+class FakeCollection:
+    """
+    Records bulk writes and keeps the written posts; documents with a `fail` field, or posts with a source ID in
+    `fail_ids`, fail with `error_code` (by default like a duplicate key)
+    """
+    def __init__(self, fail_batches: int = 0, md5s: List[str] = None, fail_ids: List[str] = None, error_code: int = 11000):
+        self.batches = []
+        self.error_code = error_code
+        self.fail_batches = fail_batches
+        self.fail_ids = fail_ids or []
+        self.md5s = md5s or []
+        self.documents = {}
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def bulk_write(self, operations, ordered=True):
+        assert not ordered
+
+        with self.lock:
+            self.batches.append(operations)
+
+            if len(self.batches) <= self.fail_batches:
+                raise AutoReconnect('connection lost')
+
+        errors = [
+            {'index': index, 'code': self.error_code, 'errmsg': 'E11000 duplicate key error' if self.error_code == 11000 else 'Document failed validation'}
+            for (index, operation) in enumerate(operations)
+            if self.is_failing(operation)
+        ]
+
+        with self.lock:
+            for operation in operations:
+                if self.is_failing(operation):
+                    continue
+
+                key = (operation._filter.get('source'), operation._filter.get('source_id'))
+
+                if isinstance(operation, ReplaceOne):
+                    self.documents[key] = dict(operation._doc)
+                else:
+                    self.documents[key].update(operation._doc.get('$set', {}))
+
+                    for field in operation._doc.get('$unset', {}):
+                        del self.documents[key][field]
+
+        if len(errors) > 0:
+            raise BulkWriteError({'writeErrors': errors, 'nInserted': 0, 'nUpserted': len(operations) - len(errors)})
+
+    def is_failing(self, operation) -> bool:
+        return operation._doc.get('fail') or operation._filter.get('source_id') in self.fail_ids
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+
+        if 'origin_md5' in query:
+            if '$in' in query['origin_md5']:
+                return [{'origin_md5': md5} for md5 in self.md5s if md5 in query['origin_md5']['$in']]
+
+            return [{'origin_md5': md5} for md5 in self.md5s]
+
+        posts = [
+            dict(document) for ((source, source_id), document) in self.documents.items()
+            if source in query['source']['$in'] and source_id in query['source_id']['$in']
+        ]
+
+        if projection is not None:
+            posts = [{field: post[field] for field in projection if projection[field] and field in post} for post in posts]
+
+        return posts
+
+
+class BulkWriterTestCase(unittest.TestCase):
+    def test_batches_and_errors(self):
+        collection = FakeCollection()
+        writer = BulkWriter(collection, batch_size=4, max_pending=2, describe=lambda line: f'Could not import line #{line}')
+        output = io.StringIO()
+
+        with contextlib.redirect_stdout(output):
+            for line in range(1, 11):
+                writer.add(line, ReplaceOne({'id': line}, {'id': line, 'fail': line in [3, 9]}, upsert=True))
+
+            writer.close()
+
+        self.assertEqual([len(batch) for batch in collection.batches], [4, 4, 2])
+        self.assertEqual((writer.write_count, writer.error_count), (8, 2))
+        self.assertEqual(writer.failed_labels, [3, 9])
+        self.assertEqual(output.getvalue().splitlines(), ['Could not import line #3: E11000 duplicate key error', 'Could not import line #9: E11000 duplicate key error'])
+
+    def test_failed_batch(self):
+        collection = FakeCollection(fail_batches=1)
+        writer = BulkWriter(collection, batch_size=3)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            for index in range(5):
+                writer.add(index, ReplaceOne({'id': index}, {'id': index}))
+
+            writer.close()
+
+        self.assertEqual((writer.write_count, writer.error_count), (2, 3))
+        self.assertEqual(writer.failed_labels, [0, 1, 2])
+
+    def test_skip_codes(self):
+        # duplicate keys are reported and skipped
+        writer = BulkWriter(FakeCollection(), batch_size=4, skip_codes={11000})
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            for index in range(6):
+                writer.add(index, ReplaceOne({'id': index}, {'id': index, 'fail': index == 2}))
+
+            writer.close()
+
+        self.assertEqual(writer.failed_labels, [2])
+
+        # any other error is raised
+        for collection in [FakeCollection(error_code=121), FakeCollection(fail_batches=1)]:
+            writer = BulkWriter(collection, batch_size=4, skip_codes={11000})
+
+            with self.assertRaises(PyMongoError):
+                for index in range(6):
+                    writer.add(index, ReplaceOne({'id': index}, {'id': index, 'fail': index == 2}))
+
+                writer.close()
+
+    def test_import_jsonl(self):
+        corpus = MockBooruCorpus(post_count=25)
+        collection = FakeCollection()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fn = os.path.join(tmp_dir, 'posts.jsonl')
+
+            with open(fn, 'wt') as fp:
+                for post in corpus.posts:
+                    fp.write(json.dumps(corpus.get_post_record(post, 'e621')) + '\n')
+
+                fp.write('{"broken\n')
+
+            importer = Importer({'posts': collection}, 'posts', get_post_translator(Source.E621, TagNormalizer()), TagNormalizer(), batch_size=10)
+
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                (lines, mongo_errors, json_errors) = importer.import_jsonl(fn)
+
+        self.assertEqual((lines, mongo_errors, json_errors), (26, 0, 1))
+        self.assertEqual([len(batch) for batch in collection.batches], [10, 10, 5])
+        self.assertEqual(collection.batches[0][0]._filter, {'source': Source.E621, 'source_id': str(corpus.posts[0].id)})
+
+    def test_import_jsonl_ranges(self):
+        corpus = MockBooruCorpus(post_count=40)
+        collection = FakeCollection()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fn = os.path.join(tmp_dir, 'posts.jsonl')
+
+            with open(fn, 'wt') as fp:
+                for post in corpus.posts:
+                    fp.write(json.dumps(corpus.get_post_record(post, 'e621')) + '\n')
+
+            # small chunks, so that lines cross chunk borders
+            ranges = get_line_ranges(fn, 6, chunk_size=100)
+            importer = Importer({'posts': collection}, 'posts', get_post_translator(Source.E621, TagNormalizer()), TagNormalizer())
+            lines = 0
+
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                for (start, end, first_line) in ranges:
+                    writer = importer.open_writer(lambda line: f'Could not import line #{line}')
+                    (range_lines, json_errors) = importer.import_jsonl_range(writer, fn, start, end, first_line)
+                    importer.close_writer(writer)
+
+                    self.assertEqual(json_errors, 0)
+                    lines += range_lines
+
+        self.assertEqual(len(ranges), 6)
+        self.assertEqual([first_line for (_, _, first_line) in ranges], sorted(set(first_line for (_, _, first_line) in ranges)))
+        self.assertEqual(lines, 40)
+
+        source_ids = [operation._filter['source_id'] for batch in collection.batches for operation in batch]
+        self.assertEqual(source_ids, [str(post.id) for post in corpus.posts])
+
+    def test_skip_if_md5_match(self):
+        corpus = MockBooruCorpus(post_count=30)
+        records = [corpus.get_post_record(post, 'e621') for post in corpus.posts]
+
+        # the last post is a re-upload of the first one
+        records[-1]['file']['md5'] = records[0]['file']['md5']
+
+        existing_md5s = [records[1]['file']['md5'], records[5]['file']['md5']]
+        expected_ids = [str(record['id']) for record in records[:-1] if record['file']['md5'] not in existing_md5s]
+
+        for preload in [False, True]:
+            collection = FakeCollection(md5s=existing_md5s)
+            importer = Importer({'posts': collection}, 'posts', get_post_translator(Source.E621, TagNormalizer()), TagNormalizer(), skip_if_md5_match=True, batch_size=8)
+
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                if preload:
+                    importer.preload_md5s()
+
+                importer.import_records(records)
+
+            source_ids = [operation._filter['source_id'] for batch in collection.batches for operation in batch]
+            self.assertEqual(source_ids, expected_ids)
+
+            # one lookup per batch, or a single one when preloaded
+            self.assertEqual(len([query for query in collection.queries if 'origin_md5' in query]), 1 if preload else 4)
+
+    def test_skip_unchanged_posts(self):
+        corpus = MockBooruCorpus(post_count=20)
+        records = [corpus.get_post_record(post, 'e621') for post in corpus.posts]
+        collection = FakeCollection()
+        importer = Importer({'posts': collection}, 'posts', get_post_translator(Source.E621, TagNormalizer()), TagNormalizer())
+
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            importer.import_records(records)
+
+            records[3]['score']['total'] += 10
+            collection.batches = []
+            importer.import_records(records)
+
+        operations = [operation for batch in collection.batches for operation in batch]
+        self.assertTrue(all([isinstance(operation, UpdateOne) for operation in operations]))
+
+        changes = {operation._filter['source_id']: frozenset(operation._doc['$set'].keys()) for operation in operations}
+        self.assertEqual(changes.pop(str(records[3]['id'])), {'score', 'content_hash', 'timestamp'})
+        self.assertEqual(set(changes.values()), {frozenset(['timestamp'])})
+        self.assertEqual(collection.documents[(Source.E621, str(records[3]['id']))]['score'], records[3]['score']['total'])
+
+    def test_concurrent_import_records(self):
+        corpus = MockBooruCorpus(post_count=400)
+        records = [corpus.get_post_record(post, 'e621') for post in corpus.posts]
+
+        # every failing post belongs to the first half, so errors show up in the wrong call if batches get mixed up
+        halves = [records[:200], records[200:]]
+        collection = FakeCollection(fail_ids=[str(record['id']) for record in halves[0][::10]])
+        translator = get_post_translator(Source.E621, TagNormalizer())
+        importer = Importer({'posts': collection}, 'posts', translator, TagNormalizer(), batch_size=7)
+
+        # both calls translate their posts in lockstep
+        barrier = threading.Barrier(2, timeout=10)
+        translate = translator.translate
+
+        def translate_in_lockstep(data: dict):
+            barrier.wait()
+            return translate(data)
+
+        translator.translate = translate_in_lockstep
+        results = [None, None]
+
+        def run(index: int):
+            results[index] = importer.import_records(halves[index])
+
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            threads = [threading.Thread(target=run, args=(index,)) for index in range(2)]
+
+            for thread in threads:
+                thread.start()
+
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(results, [(180, 20), (200, 0)])
+        self.assertEqual(len(collection.documents), 380)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import json
+import os
+import tempfile
+import unittest
+
+from crawl.crawler.metrics import CrawlMetrics
+
+
+class CrawlMetricsTestCase(unittest.TestCase):
+    def test_counters(self):
+        metrics = CrawlMetrics()
+
+        metrics.record_request(0.2, 1000, 200)
+        metrics.record_request(3.0, 500, 429)
+        metrics.record_retry()
+        metrics.record_throttle(1.5)
+        metrics.record_page(320, 0.01, 0.5)
+
+        data = metrics.to_dict()
+
+        self.assertEqual(data['requests'], 2)
+        self.assertEqual(data['response_bytes'], 1500)
+        self.assertEqual(data['status_codes'], {'200': 1, '429': 1})
+        self.assertEqual(data['retries'], 1)
+        self.assertEqual(data['throttle_seconds'], 1.5)
+        self.assertEqual(data['records'], 320)
+        self.assertEqual(data['max_request_seconds'], 3.0)
+
+    def test_prometheus_histogram(self):
+        metrics = CrawlMetrics()
+        metrics.record_request(0.2, 1000, 200)
+        metrics.record_request(3.0, 500, 200)
+
+        text = metrics.to_prometheus()
+
+        self.assertIn('dr_crawl_request_seconds_bucket{le="0.1"} 0', text)
+        self.assertIn('dr_crawl_request_seconds_bucket{le="0.25"} 1', text)
+        self.assertIn('dr_crawl_request_seconds_bucket{le="5.0"} 2', text)
+        self.assertIn('dr_crawl_request_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn('dr_crawl_responses_total{code="200"} 2', text)
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output_file = os.path.join(directory, 'posts.jsonl')
+            metrics = CrawlMetrics(output_file)
+            metrics.record_page(10, 0.0, 0.0)
+            metrics.save(force=True)
+
+            with open(output_file + '.metrics.json', 'r') as fp:
+                self.assertEqual(json.load(fp)['records'], 10)
+
+            self.assertTrue(os.path.isfile(output_file + '.prom'))
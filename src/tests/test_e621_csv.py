@@ -0,0 +1,90 @@
+import csv
+import gzip
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+
+from database.importer.alias_importer import AliasImporter
+from database.importer.readers import read_csv, is_csv_file
+from database.tag_normalizer.tag_normalizer import TagNormalizer
+from database.translator.helpers import get_post_translator, get_tag_translator, get_alias_translator
+from database.utils.enums import Source, Category
+
+post_columns = ['id', 'uploader_id', 'created_at', 'md5', 'source', 'rating', 'image_width', 'image_height', 'tag_string', 'locked_tags', 'fav_count', 'file_ext', 'parent_id', 'change_seq', 'approver_id', 'file_size', 'comment_count', 'description', 'duration', 'updated_at', 'is_deleted', 'is_pending', 'is_flagged', 'score', 'up_score', 'down_score', 'is_rating_locked', 'is_status_locked', 'is_note_locked']
+
+
+def write_csv(filename: str, columns, rows):
+    with gzip.open(filename, 'wt', encoding='utf-8', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+def get_post_row(post_id: int, **values) -> list:
+    row = {
+        'id': str(post_id), 'uploader_id': '1', 'created_at': '2023-01-31 12:34:56.789123', 'md5': 'd41d8cd98f00b204e9800998ecf8427e',
+        'source': 'https://example.com/a\nhttps://example.com/b', 'rating': 's', 'image_width': '1700', 'image_height': '1000',
+        'tag_string': 'tag_a tag_b', 'locked_tags': '', 'fav_count': '12', 'file_ext': 'png', 'parent_id': '', 'change_seq': '1',
+        'approver_id': '', 'file_size': '12345', 'comment_count': '3', 'description': 'Multi-line,\n"quoted" text', 'duration': '',
+        'updated_at': '', 'is_deleted': 'f', 'is_pending': 'f', 'is_flagged': 'f', 'score': '-2', 'up_score': '1', 'down_score': '-3',
+        'is_rating_locked': 'f', 'is_status_locked': 'f', 'is_note_locked': 'f', **values
+    }
+
+    return [row[column] for column in post_columns]
+
+
+class E621CsvTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_is_csv_file(self):
+        self.assertTrue(is_csv_file('posts-2023-01-31.csv.gz'))
+        self.assertTrue(is_csv_file('tags.csv'))
+        self.assertFalse(is_csv_file('posts.jsonl'))
+
+    def test_posts(self):
+        filename = os.path.join(self.dir.name, 'posts-2023-01-31.csv.gz')
+        write_csv(filename, post_columns, [get_post_row(1), get_post_row(2, is_deleted='t'), get_post_row(3, image_width='500', image_height='250', file_ext='jpg', created_at='2007-02-10 04:35:29')])
+
+        tag_normalizer = TagNormalizer()
+        translator = get_post_translator(Source.E621, tag_normalizer, from_csv=True)
+        posts = [translator.translate(row) for row in read_csv(filename)]
+
+        # deleted posts are skipped
+        self.assertIsNone(posts[1])
+
+        p = posts[0]
+        self.assertEqual(p.source_id, '1')
+        self.assertEqual(p.origin_urls, ['https://example.com/a', 'https://example.com/b'])
+        self.assertEqual(p.description, 'Multi-line,\n"quoted" text')
+        self.assertEqual(p.image_url, 'https://static1.e621.net/data/d4/1d/d41d8cd98f00b204e9800998ecf8427e.png')
+        self.assertEqual((p.medium_url, p.medium_width, p.medium_height), ('https://static1.e621.net/data/sample/d4/1d/d41d8cd98f00b204e9800998ecf8427e.jpg', 850, 500))
+        self.assertEqual((p.small_url, p.small_width, p.small_height), ('https://static1.e621.net/data/preview/d4/1d/d41d8cd98f00b204e9800998ecf8427e.jpg', 150, 88))
+        self.assertEqual((p.score, p.favorites_count, p.comment_count, p.origin_size), (-2, 12, 3, 12345))
+        self.assertEqual(p.created_at, datetime(2023, 1, 31, 12, 34, 56, 789123, tzinfo=timezone.utc))
+
+        # small images have no sample
+        p = posts[2]
+        self.assertEqual((p.medium_url, p.medium_width, p.medium_height), (p.image_url, 500, 250))
+        self.assertEqual(p.created_at, datetime(2007, 2, 10, 4, 35, 29, tzinfo=timezone.utc))
+
+    def test_tags_and_aliases(self):
+        tag_file = os.path.join(self.dir.name, 'tags.csv.gz')
+        alias_file = os.path.join(self.dir.name, 'tag_aliases.csv.gz')
+
+        write_csv(tag_file, ['id', 'name', 'category', 'post_count'], [['1', 'tag_a', '1', '42']])
+        write_csv(alias_file, ['id', 'antecedent_name', 'consequent_name', 'created_at', 'status'], [['1', 'alias_a', 'tag_a', '', 'active'], ['2', 'alias_b', 'tag_a', '', 'deleted']])
+
+        aliases = AliasImporter(get_alias_translator(Source.E621, from_csv=True)).load(alias_file)
+        self.assertEqual([(alias.tag_name, alias.alias_name) for alias in aliases], [('tag_a', 'alias_a')])
+
+        tag = get_tag_translator(Source.E621, {'tag_a': ['alias_a']}, from_csv=True).translate(next(read_csv(tag_file)))
+        self.assertEqual((tag.origin_name, tag.category, tag.post_count, tag.aliases), ('tag_a', Category.ARTIST, 42, ['alias_a']))
+
+
+if __name__ == '__main__':
+    unittest.main()
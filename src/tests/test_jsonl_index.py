@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+import unittest
+
+from dataset.utils.split import split_posts
+from utils.jsonl_index import IndexedJsonlWriter, JsonlIndex, load_index, update_index, count_records
+
+
+class JsonlIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, 'posts.jsonl')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, ids: list, append: bool = True):
+        writer = IndexedJsonlWriter(self.filename, append=append)
+
+        for record_id in ids:
+            writer.writerow({'id': record_id, 'md5': f'{record_id:032x}'})
+
+        writer.close()
+
+    def test_writer_index(self):
+        self.write([3, 2, 1])
+        index = load_index(self.filename)
+
+        self.assertEqual(index.get_ids(), [3, 2, 1])
+        self.assertEqual(index[1].md5, bytes.fromhex(f'{2:032x}'))
+        self.assertEqual(json.loads(list(index.read_lines(1, 2))[0])['id'], 2)
+        index.close()
+
+    def test_update_after_unindexed_append(self):
+        self.write([5, 4])
+
+        with open(self.filename, 'a') as fp:
+            fp.write(json.dumps({'source_id': '3'}) + '\n')
+
+        self.assertIsNone(load_index(self.filename))
+        self.assertEqual(update_index(self.filename), 3)
+        self.assertEqual(JsonlIndex(self.filename).get_ids(), [5, 4, 3])
+
+        # appending with the writer catches up first
+        self.write([2])
+        self.assertEqual(count_records(self.filename), 4)
+
+    def test_update_after_truncation(self):
+        self.write([5, 4, 3])
+
+        with open(self.filename, 'r+b') as fp:
+            fp.truncate(JsonlIndex(self.filename)[2].offset + 5)
+
+        self.assertEqual(update_index(self.filename), 2)
+
+    def test_rewrite_discards_index(self):
+        self.write([5, 4, 3])
+        self.write([9], append=False)
+
+        self.assertEqual(load_index(self.filename).get_ids(), [9])
+
+    def test_split_indexed(self):
+        self.write(list(range(10)))
+        shards = split_posts([self.filename], limit=7, shards=3)
+        ids = []
+
+        for fn in shards:
+            with open(fn, 'rt') as fp:
+                ids.append([json.loads(line)['id'] for line in fp])
+
+        self.assertEqual(ids, [[0, 1], [2, 3], [4, 5, 6]])
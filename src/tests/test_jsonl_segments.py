@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+import unittest
+
+from utils.jsonl_index import load_index
+from utils.jsonl_segments import SegmentedJsonlWriter, expand_inputs, load_manifest, get_jsonl_size, truncate_jsonl
+
+
+class JsonlSegmentsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'posts.jsonl')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, ids, segment_size: int = 40, finish: bool = True, page_size: int = 2) -> SegmentedJsonlWriter:
+        writer = SegmentedJsonlWriter(self.filename, segment_size=segment_size)
+
+        for (index, record_id) in enumerate(ids):
+            writer.writerow({'id': record_id})
+
+            if index % page_size == page_size - 1:
+                writer.rotate_if_full()
+
+        writer.close(finish=finish)
+        return writer
+
+    def read_ids(self, filenames) -> list:
+        ids = []
+
+        for fn in filenames:
+            with open(fn, 'rt') as fp:
+                ids.extend([json.loads(line)['id'] for line in fp])
+
+        return ids
+
+    def test_rotation(self):
+        # {"id": 1}\n is 10 bytes; segments end after the first page that reaches 40 bytes
+        self.write(list(range(10)))
+
+        segments = expand_inputs([self.filename])
+
+        self.assertEqual([os.path.basename(fn) for fn in segments], ['posts-00001.jsonl', 'posts-00002.jsonl', 'posts-00003.jsonl'])
+        self.assertEqual(self.read_ids(segments), list(range(10)))
+        self.assertTrue(all([segment['finished'] for segment in load_manifest(self.filename)['segments']]))
+        self.assertEqual(get_jsonl_size(self.filename), 100)
+
+        index = load_index(segments[1])
+        self.assertEqual(index.get_ids(), [4, 5, 6, 7])
+        index.close()
+
+    def test_continue_unfinished(self):
+        self.write([1, 2, 3, 4, 5, 6], finish=False)
+
+        self.assertEqual(len(expand_inputs([self.filename], finished_only=True)), 1)
+
+        # the unfinished segment is continued, finished ones are left alone
+        self.write([7, 8])
+
+        self.assertEqual(self.read_ids(expand_inputs([self.filename])), [1, 2, 3, 4, 5, 6, 7, 8])
+        self.assertEqual(len(expand_inputs([self.filename], finished_only=True)), 2)
+
+    def test_truncate(self):
+        self.write(list(range(10)))
+        truncate_jsonl(self.filename, 50)
+
+        segments = load_manifest(self.filename)['segments']
+
+        self.assertEqual(len(segments), 2)
+        self.assertFalse(segments[1]['finished'])
+        self.assertEqual(self.read_ids(expand_inputs([self.filename])), [0, 1, 2, 3, 4])
+        self.assertFalse(os.path.exists(os.path.join(self.dir.name, 'posts-00003.jsonl')))
+
+        # the index of the cut segment catches up when it is continued
+        self.write([5])
+
+        index = load_index(expand_inputs([self.filename])[1])
+        self.assertEqual(index.get_ids(), [4, 5])
+        index.close()
+
+    def test_plain_files(self):
+        self.assertEqual(expand_inputs(['a.jsonl', 'b.jsonl']), ['a.jsonl', 'b.jsonl'])
+        self.assertIsNone(get_jsonl_size(self.filename))
+
+
+if __name__ == '__main__':
+    unittest.main()
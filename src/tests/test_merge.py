@@ -0,0 +1,63 @@
+import json
+import os
+import tempfile
+import unittest
+
+from crawl.crawler.merge import merge_jsonl
+from database.importer.readers import read_jsonl
+
+
+class MergeTestCase(unittest.TestCase):
+    def write_jsonl(self, filename: str, records: list):
+        with open(filename, 'wt') as fp:
+            for record in records:
+                fp.write(json.dumps(record) + '\n')
+
+    def read_jsonl(self, filename: str) -> list:
+        with open(filename, 'rt') as fp:
+            return [json.loads(line) for line in fp]
+
+    def test_merge_deduplicates_and_orders(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            first = os.path.join(tmp_dir, 'shard-0.jsonl')
+            second = os.path.join(tmp_dir, 'shard-1.jsonl')
+            output = os.path.join(tmp_dir, 'merged.jsonl')
+
+            self.write_jsonl(first, [{'id': i, 'shard': 0} for i in range(10, 0, -1)])
+            self.write_jsonl(second, [{'id': i, 'shard': 1} for i in range(15, 5, -1)])
+
+            (records, duplicates) = merge_jsonl([first, second], output, run_size=3)
+            merged = self.read_jsonl(output)
+
+            self.assertEqual(records, 15)
+            self.assertEqual(duplicates, 5)
+            self.assertEqual([record['id'] for record in merged], list(range(15, 0, -1)))
+
+            # the first input wins
+            self.assertTrue(all(record['shard'] == 0 for record in merged if record['id'] <= 10))
+
+    def test_merge_ascending(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = os.path.join(tmp_dir, 'crawl.jsonl')
+            output = os.path.join(tmp_dir, 'merged.jsonl')
+
+            self.write_jsonl(source, [{'id': 3}, {'id': 1}, {'id': 2}, {'id': 1}])
+
+            self.assertEqual(merge_jsonl([source], output, descending=False), (3, 1))
+            self.assertEqual([record['id'] for record in self.read_jsonl(output)], [1, 2, 3])
+
+    def test_merge_raw_utf8(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = os.path.join(tmp_dir, 'crawl.jsonl')
+            output = os.path.join(tmp_dir, 'merged.jsonl')
+
+            # --raw output keeps the response bytes, so non-ASCII text is not escaped
+            with open(source, 'wb') as fp:
+                fp.write('{"id":2,"tags":"café"}\n{"id":1,"tags":"ü 東方"}\n'.encode('utf-8'))
+
+            self.assertEqual(merge_jsonl([source], output), (2, 0))
+
+            with open(output, 'rb') as fp:
+                self.assertEqual(fp.read(), '{"id":2,"tags":"café"}\n{"id":1,"tags":"ü 東方"}\n'.encode('utf-8'))
+
+            self.assertEqual([record['tags'] for record in read_jsonl(output)], ['café', 'ü 東方'])
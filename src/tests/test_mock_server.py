@@ -0,0 +1,455 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from pymongo import ReplaceOne
+
+from crawl.crawler.async_crawler import AsyncCrawler
+from crawl.crawler.bundle_crawler import BundleCrawler
+from crawl.crawler.helpers import get_crawler, get_e621_index_crawler, get_e621_search_crawler, get_danbooru_search_crawler, get_gelbooru_search_crawler, get_gelbooru_tag_crawler, get_gelbooru_index_crawler
+from crawl.crawler.mock_server import MockBooruServer, MockBooruCorpus
+from crawl.crawler.multi_query_crawler import MultiQueryCrawler
+from crawl.crawler.partitioned_crawler import PartitionedCrawler, plan_partitions
+from crawl.crawler.refresh_crawler import RefreshCrawler
+from crawl.crawler.response_cache import ResponseCache
+from crawl.dr_crawl import get_page_handlers
+from database.tag_normalizer.tag_normalizer import TagNormalizer
+from database.utils.enums import Source
+from tests.test_bulk_writer import FakeCollection
+from utils.jsonl_index import load_index
+from utils.jsonl_segments import expand_inputs
+from utils.rate_limiter import AdaptiveRateLimiter
+
+
+class MockServerTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = MockBooruServer(MockBooruCorpus(post_count=1000, tag_count=300)).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def crawl(self, create_crawler, wrap=None) -> tuple:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            c = create_crawler(os.path.join(tmp_dir, 'crawl.jsonl'))
+            c.base_url = self.server.get_url(c.base_url)
+            c.rate_limiter = AdaptiveRateLimiter(calls=1000, period=1)
+
+            # e.g. an AsyncCrawler running the crawler
+            runner = wrap(c) if wrap is not None else c
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                runner.crawl(agent='test/1.0')
+
+            with open(c.output_file, 'rt') as fp:
+                found = [json.loads(line)['id'] for line in fp]
+
+            return found, self.server.get_expected_ids(c.base_url)
+
+    def test_by_id_crawl(self):
+        (found, expected) = self.crawl(get_e621_index_crawler)
+
+        self.assertEqual(len(expected), 1000)
+        self.assertEqual(found, expected)
+
+    def test_tag_cursor_search_crawl(self):
+        (found, expected) = self.crawl(lambda output_file: get_gelbooru_search_crawler(output_file, 'tag_0001 -tag_0002'))
+
+        self.assertGreater(len(expected), 100)
+        self.assertEqual(found, expected)
+
+    def test_index_crawl(self):
+        (found, expected) = self.crawl(get_gelbooru_tag_crawler)
+
+        self.assertEqual(found, list(range(300, 0, -1)))
+        self.assertEqual(found, expected)
+
+    def test_async_index_crawl(self):
+        # pages are fetched 4 at a time, but written in page order
+        (found, expected) = self.crawl(get_gelbooru_tag_crawler, lambda c: AsyncCrawler(c, concurrency=4))
+
+        self.assertEqual(found, list(range(300, 0, -1)))
+        self.assertEqual(found, expected)
+
+    def test_async_by_id_crawl(self):
+        # the next page is prefetched as soon as its cursor is known
+        (found, expected) = self.crawl(get_e621_index_crawler, lambda c: AsyncCrawler(c, concurrency=4))
+
+        self.assertEqual(len(expected), 1000)
+        self.assertEqual(found, expected)
+
+    def test_sharded_index_crawl(self):
+        found = []
+
+        for shard_index in range(2):
+            def create_crawler(output_file: str):
+                c = get_gelbooru_tag_crawler(output_file)
+                c.shard_index = shard_index
+                c.shard_count = 2
+                return c
+
+            (shard_found, expected) = self.crawl(create_crawler)
+
+            self.assertGreater(len(shard_found), 0)
+            found.append(shard_found)
+
+        # the shards crawl disjoint pages, which together cover the whole index
+        self.assertEqual(set(found[0]) & set(found[1]), set())
+        self.assertEqual(sorted(found[0] + found[1], reverse=True), expected)
+
+    def test_recover_after_crash(self):
+        self.check_recover_after_crash(lambda c: c)
+
+    def test_async_recover_after_crash(self):
+        self.check_recover_after_crash(lambda c: AsyncCrawler(c, concurrency=4))
+
+    def check_recover_after_crash(self, wrap):
+        def crash(records):
+            raise RuntimeError('crash')
+
+        # one output file, and segments of a few pages each
+        for segment_size in [None, 5 * 320 * 400]:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                output_file = os.path.join(tmp_dir, 'crawl.jsonl')
+
+                for recover in [False, True]:
+                    c = get_e621_index_crawler(output_file)
+                    c.base_url = self.server.get_url(c.base_url)
+                    c.rate_limiter = AdaptiveRateLimiter(calls=1000, period=1)
+                    c.segment_size = segment_size
+
+                    # the first run writes a page, then crashes before saving its position
+                    if not recover:
+                        c.page_handlers.append(lambda records: c.cur_index == 1 and crash(records))
+
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        try:
+                            wrap(c).crawl(agent='test/1.0', recover=recover)
+                            self.assertTrue(recover)
+                        except RuntimeError:
+                            self.assertFalse(recover)
+
+                found = []
+
+                for fn in expand_inputs([output_file]):
+                    with open(fn, 'rt') as fp:
+                        ids = [json.loads(line)['id'] for line in fp]
+
+                    index = load_index(fn)
+                    self.assertEqual(index.get_ids(), ids)
+                    index.close()
+
+                    found.extend(ids)
+
+                self.assertEqual(found, self.server.get_expected_ids(c.base_url))
+                self.assertEqual(len(expand_inputs([output_file])), 1 if segment_size is None else 2)
+
+    def test_partitioned_crawl(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, 'crawl.jsonl')
+            records = []
+            crashes = []
+
+            def create_crawler():
+                c = get_e621_index_crawler(output_file)
+                c.base_url = self.server.get_url(c.base_url)
+                c.rate_limiter = AdaptiveRateLimiter(calls=1000, period=1)
+                c.page_handlers.append(records.extend)
+                return c
+
+            c = create_crawler()
+            expected = self.server.get_expected_ids(c.base_url)
+
+            p = PartitionedCrawler(c, partitions=2)
+            self.assertEqual(p.find_id_range('test/1.0'), (min(expected), max(expected)))
+
+            # the first run fails on the second page of the lower partition
+            middle = plan_partitions(min(expected), max(expected), 2)[1][1]
+            lower_pages = []
+
+            def crash(page):
+                if page[0]['id'] < middle:
+                    lower_pages.append(page)
+
+                    if len(lower_pages) == 2 and len(crashes) == 0:
+                        crashes.append(page)
+                        raise RuntimeError('crash')
+
+            c.page_handlers.append(crash)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                with self.assertRaises(RuntimeError):
+                    p.crawl(agent='test/1.0')
+
+            self.assertTrue(os.path.isfile(p.get_plan_filename()))
+
+            # the second run only continues the unfinished partition, from its recovery file
+            records.clear()
+            p = PartitionedCrawler(create_crawler(), partitions=2)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                p.crawl(agent='test/1.0', recover=True)
+
+            self.assertEqual(sorted([record['id'] for record in records], reverse=True), [record_id for record_id in expected if record_id < middle][320:])
+            self.assertFalse(os.path.isfile(p.get_plan_filename()))
+
+            with open(output_file, 'rb') as fp:
+                lines = fp.readlines()
+
+            # merged highest partition first, with the index offsets shifted to the merged file
+            self.assertEqual([json.loads(line)['id'] for line in lines], expected)
+
+            index = load_index(output_file)
+            self.assertEqual(index.get_ids(), expected)
+            self.assertEqual([json.loads(line)['id'] for line in index.read_lines()], expected)
+            index.close()
+
+    def test_partitioned_search_crawl(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            c = get_e621_search_crawler(os.path.join(tmp_dir, 'crawl.jsonl'), 'tag_0005')
+            c.base_url = self.server.get_url(c.base_url)
+            c.rate_limiter = AdaptiveRateLimiter(calls=1000, period=1)
+
+            expected = self.server.get_expected_ids(c.base_url)
+            urls = []
+            fetch_url = c.fetch_url
+
+            def record_url(url: str, agent: str, page_index: int):
+                urls.append(url)
+                return fetch_url(url, agent, page_index)
+
+            c.fetch_url = record_url
+            p = PartitionedCrawler(c, partitions=3)
+
+            # the ID range is the one of the search, not of the whole site
+            self.assertGreater(len(expected), 10)
+            self.assertLess(len(expected), 1000)
+            self.assertEqual(p.find_id_range('test/1.0'), (min(expected), max(expected)))
+            self.assertTrue(all(['tags=tag_0005' in url for url in urls]))
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                p.crawl(agent='test/1.0')
+
+            with open(c.output_file, 'rt') as fp:
+                self.assertEqual([json.loads(line)['id'] for line in fp], expected)
+
+    def test_multi_query_crawl(self):
+        queries = ['tag_0001', 'tag_0002', 'tag_0001 tag_0002']
+        records = []
+
+        def create_crawler(output_file: str, query: str):
+            c = get_e621_search_crawler(output_file, query)
+            c.base_url = self.server.get_url(c.base_url)
+            c.rate_limiter = AdaptiveRateLimiter(calls=1000, period=1)
+            return c
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, 'crawl.jsonl')
+            c = MultiQueryCrawler(create_crawler, queries, output_file, concurrency=3, page_handlers=[records.extend])
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                c.crawl(agent='test/1.0')
+
+            with open(output_file, 'rt') as fp:
+                found = [json.loads(line)['id'] for line in fp]
+
+            index = load_index(output_file)
+            self.assertEqual(index.get_ids(), found)
+            index.close()
+
+        expected = set()
+
+        for query in queries:
+            expected.update(self.server.get_expected_ids(create_crawler('', query).base_url))
+
+        # the queries overlap, but every post is written and handled once
+        self.assertGreater(c.duplicate_count, 0)
+        self.assertEqual(sorted(found), sorted(expected))
+        self.assertEqual(sorted([record['id'] for record in records]), sorted(expected))
+
+    def test_since_high_water_mark(self):
+        # the same seed creates the same oldest posts, so the larger corpus is the smaller one plus 700 newer posts
+        servers = [MockBooruServer(MockBooruCorpus(post_count=count, tag_count=300)).start() for count in [1000, 1700]]
+
+        def crawl(server: MockBooruServer, create_crawler, output_file: str, since: bool = False, crash_on_page: int = None):
+            c = create_crawler(output_file)
+            c.base_url = server.get_url(c.base_url)
+            c.rate_limiter = AdaptiveRateLimiter(calls=1000, period=1)
+
+            if since:
+                c.since(c.load_high_water_mark())
+
+            if crash_on_page is not None:
+                def crash(records):
+                    if c.cur_index == crash_on_page:
+                        raise RuntimeError('crash')
+
+                c.page_handlers.append(crash)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                try:
+                    c.crawl(agent='test/1.0')
+                except RuntimeError:
+                    pass
+
+            with open(output_file, 'rt') as fp:
+                return c, [json.loads(line)['id'] for line in fp]
+
+        def read_high_water_mark(output_file: str) -> int:
+            with open(output_file + '.hwm', 'r') as fp:
+                return json.load(fp)['max_id']
+
+        try:
+            old_ids = [post.id for post in servers[0].corpus.posts]
+            new_ids = [post.id for post in servers[1].corpus.posts[:700]]
+
+            # b<id> crawls walk upwards from a<max_id>; the maximum comes from the sidecar, or from the output itself
+            for keep_sidecar in [True, False]:
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    output_file = os.path.join(tmp_dir, 'crawl.jsonl')
+
+                    (_, found) = crawl(servers[0], get_e621_index_crawler, output_file)
+                    self.assertEqual(found, old_ids)
+                    self.assertEqual(read_high_water_mark(output_file), max(old_ids))
+
+                    if not keep_sidecar:
+                        os.remove(output_file + '.hwm')
+
+                    (c, found) = crawl(servers[1], get_e621_index_crawler, output_file, since=True)
+
+                    self.assertEqual(c.page_field_prefix, 'a')
+                    self.assertEqual(found[:1000], old_ids)
+                    self.assertEqual(sorted(found[1000:], reverse=True), new_ids)
+                    self.assertEqual(read_high_water_mark(output_file), max(new_ids))
+
+            # the sidecar follows an upward walk page by page, so an interrupted walk does not start over
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                output_file = os.path.join(tmp_dir, 'crawl.jsonl')
+
+                crawl(servers[0], get_e621_index_crawler, output_file)
+                (_, found) = crawl(servers[1], get_e621_index_crawler, output_file, since=True, crash_on_page=1)
+
+                # the first page of the walk holds the 320 posts right above the old maximum
+                self.assertEqual(read_high_water_mark(output_file), sorted(new_ids)[319])
+
+            # id:< crawls walk downwards from the top, and stop below the old maximum (min_id)
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                output_file = os.path.join(tmp_dir, 'crawl.jsonl')
+
+                (_, found) = crawl(servers[0], get_gelbooru_index_crawler, output_file)
+                self.assertEqual(found, old_ids)
+
+                (c, found) = crawl(servers[1], get_gelbooru_index_crawler, output_file, since=True)
+
+                self.assertEqual(c.min_id, max(old_ids) + 1)
+                self.assertTrue(c.exhausted)
+                self.assertEqual(found, old_ids + new_ids)
+        finally:
+            for server in servers:
+                server.stop()
+
+    def test_cached_crawl(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ResponseCache(os.path.join(tmp_dir, 'cache'))
+            outputs = []
+            metrics = []
+
+            for run in range(2):
+                c = get_e621_index_crawler(os.path.join(tmp_dir, f'crawl-{run}.jsonl'))
+                c.base_url = self.server.get_url(c.base_url)
+                c.rate_limiter = AdaptiveRateLimiter(calls=1000, period=1)
+                c.cache = cache
+
+                with contextlib.redirect_stdout(io.StringIO()):
+                    c.crawl(agent='test/1.0')
+
+                with open(c.output_file, 'rt') as fp:
+                    outputs.append(fp.read())
+
+                metrics.append(c.metrics.to_dict())
+
+        # the second run revalidates every page with If-None-Match, and reuses the cached bodies
+        self.assertEqual(metrics[0]['cache_hits'], 0)
+        self.assertEqual(metrics[1]['cache_hits'], metrics[0]['requests'])
+        self.assertEqual(metrics[1]['status_codes'], {'304': metrics[0]['requests']})
+        self.assertEqual(outputs[1], outputs[0])
+        self.assertEqual(len(outputs[0].splitlines()), 1000)
+
+    def test_import_while_crawling(self):
+        collection = FakeCollection()
+        args = argparse.Namespace(import_posts=True, type='posts', source='e621')
+
+        # the --import page handler, with an in-memory posts collection instead of MongoDB
+        with mock.patch('crawl.dr_crawl.connect_to_db', return_value=({'posts': collection}, None)), \
+                mock.patch('crawl.dr_crawl.load_normalizer_from_database', return_value=TagNormalizer()):
+            page_handlers = get_page_handlers(args)
+
+        def create_crawler(output_file: str):
+            c = get_e621_index_crawler(output_file)
+            c.page_handlers.extend(page_handlers)
+            return c
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            (found, expected) = self.crawl(create_crawler)
+
+        self.assertEqual(found, expected)
+        self.assertEqual(sorted(collection.documents.keys()), sorted([(Source.E621, str(post_id)) for post_id in expected]))
+        self.assertTrue(all([isinstance(operation, ReplaceOne) for batch in collection.batches for operation in batch]))
+
+    def test_refresh_crawl(self):
+        # every third post, plus a few that don't exist (anymore)
+        ids = [str(post.id) for post in self.server.corpus.posts[::3]] + ['1000001', '1000002']
+        records = []
+
+        for create_crawler in [get_e621_search_crawler, get_danbooru_search_crawler]:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                c = create_crawler(os.path.join(tmp_dir, 'refresh.jsonl'), '')
+                c.base_url = self.server.get_url(c.base_url)
+                c.rate_limiter = AdaptiveRateLimiter(calls=1000, period=1)
+                c.page_handlers.append(records.extend)
+
+                missing_ids = []
+                refresh = RefreshCrawler(c, ids, concurrency=2, missing_handler=missing_ids.extend)
+
+                with contextlib.redirect_stdout(io.StringIO()):
+                    refresh.crawl(agent='test/1.0')
+
+                self.assertEqual(sorted([str(record['id']) for record in records]), sorted(ids[:-2]))
+                self.assertEqual(refresh.missing_count, 2)
+                self.assertEqual(missing_ids, ['1000001', '1000002'])
+                self.assertEqual(c.metrics.to_dict()['requests'], 4)
+
+                records.clear()
+
+    def test_rewritten_url(self):
+        url = self.server.get_url('https://e621.net/posts.json?limit=320')
+
+        self.assertEqual(url, f'http://127.0.0.1:{self.server.port}/e621.net/posts.json?limit=320')
+
+    def test_bundle_crawl(self):
+        limiter = AdaptiveRateLimiter(calls=1000, period=1)
+
+        def create_crawler(crawl_type: str, output_file: str):
+            try:
+                c = get_crawler('gelbooru', crawl_type, output_file, None)
+            except NotImplementedError:
+                return None
+
+            c.base_url = self.server.get_url(c.base_url)
+            c.rate_limiter = limiter
+            return c
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with contextlib.redirect_stdout(io.StringIO()):
+                BundleCrawler(create_crawler, tmp_dir).crawl(agent='test/1.0')
+
+            self.assertEqual(sorted([fn for fn in os.listdir(tmp_dir) if fn.endswith('.jsonl')]), ['posts.jsonl', 'tags.jsonl'])
+
+            with open(os.path.join(tmp_dir, 'posts.jsonl'), 'rt') as fp:
+                self.assertEqual(len(fp.readlines()), 1000)
@@ -0,0 +1,31 @@
+import os
+import tempfile
+import unittest
+
+from crawl.crawler.multi_query_crawler import SeenIdSet, load_queries
+
+
+class MultiQueryCrawlerTestCase(unittest.TestCase):
+    def test_seen_id_set(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'seen.sqlite')
+            seen = SeenIdSet(filename)
+
+            self.assertEqual(seen.filter_unseen(['1', '2', '2', '3']), ['1', '2', '3'])
+            seen.add(['1', '2'])
+            self.assertEqual(seen.filter_unseen(['1', '2', '3']), ['3'])
+            seen.close()
+
+            # persisted on disk
+            seen = SeenIdSet(filename)
+            self.assertEqual(seen.filter_unseen([str(i) for i in range(1000)]), [str(i) for i in range(1000) if i > 2 or i == 0])
+            seen.close()
+
+    def test_load_queries(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'queries.txt')
+
+            with open(filename, 'w') as fp:
+                fp.write('# artists\nartist_a rating:s\n\n  species_b  \n')
+
+            self.assertEqual(load_queries(filename), ['artist_a rating:s', 'species_b'])
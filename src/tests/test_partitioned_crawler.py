@@ -0,0 +1,22 @@
+import unittest
+
+from crawl.crawler.partitioned_crawler import plan_partitions
+
+
+class PartitionPlanTestCase(unittest.TestCase):
+    def test_ranges_cover_id_space(self):
+        partitions = plan_partitions(1, 1000, 7)
+
+        self.assertEqual(len(partitions), 7)
+        self.assertEqual(partitions[0][1], 1001)
+        self.assertEqual(partitions[-1][0], 1)
+
+        for (upper, lower) in zip(partitions, partitions[1:]):
+            self.assertEqual(upper[0], lower[1])
+
+    def test_highest_range_first(self):
+        partitions = plan_partitions(0, 99, 4)
+        self.assertEqual(partitions, [(75, 100), (50, 75), (25, 50), (0, 25)])
+
+    def test_more_partitions_than_ids(self):
+        self.assertEqual(plan_partitions(10, 12, 8), [(12, 13), (11, 12), (10, 11)])
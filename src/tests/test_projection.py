@@ -0,0 +1,42 @@
+import unittest
+
+from crawl.crawler.mock_server import MockBooruCorpus
+from crawl.crawler.projection import project, e621_post_projection, danbooru_post_projection, gelbooru_post_projection, rule34_post_projection
+from database.tag_normalizer.tag_normalizer import TagNormalizer
+from database.translator.helpers import get_post_translator
+from database.utils.enums import Source
+
+
+class ProjectionTestCase(unittest.TestCase):
+    def test_project(self):
+        record = {'id': 1, 'score': {'up': 3, 'down': -1, 'total': 2}, 'tags': {'general': ['a']}, 'flags': {'deleted': False}}
+        projection = {'id': None, 'score': {'total': None}, 'tags': None, 'file': {'url': None}}
+
+        self.assertEqual(project(record, projection), {'id': 1, 'score': {'total': 2}, 'tags': {'general': ['a']}})
+
+        # fields that are null instead of objects are kept as they are
+        self.assertEqual(project({'id': 2, 'file': None}, projection), {'id': 2, 'file': None})
+
+    def test_translated_posts_are_unchanged(self):
+        corpus = MockBooruCorpus(post_count=50)
+        tag_normalizer = TagNormalizer()
+
+        for (source, style, projection) in [
+            (Source.E621, 'e621', e621_post_projection),
+            (Source.DANBOORU, 'danbooru', danbooru_post_projection),
+            (Source.GELBOORU, 'gelbooru', gelbooru_post_projection),
+            (Source.RULE34, 'gelbooru', rule34_post_projection)
+        ]:
+            translator = get_post_translator(source, tag_normalizer)
+
+            for post in corpus.posts:
+                record = corpus.get_post_record(post, style)
+                full_post = vars(translator.translate(record))
+                projected_post = vars(translator.translate(project(record, projection)))
+
+                del full_post['timestamp'], projected_post['timestamp']
+                self.assertEqual(full_post, projected_post, f'{source}: {post.id}')
+
+
+if __name__ == '__main__':
+    unittest.main()
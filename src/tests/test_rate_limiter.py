@@ -0,0 +1,104 @@
+import contextlib
+import io
+import threading
+import time
+import unittest
+
+from utils.rate_limiter import TokenBucket, AdaptiveRateLimiter, PriorityRateLimiter, get_rate_limiter, get_retry_after, get_site_key
+
+
+class RateLimiterTestCase(unittest.TestCase):
+    def test_burst(self):
+        bucket = TokenBucket(calls=3, period=3)
+
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertGreater(bucket.reserve(), 0.9)
+
+    def test_debt_accumulates(self):
+        bucket = TokenBucket(calls=1, period=1)
+        bucket.reserve()
+
+        first = bucket.reserve()
+        second = bucket.reserve()
+
+        self.assertAlmostEqual(second - first, 1.0, places=1)
+
+    def test_shared_by_key(self):
+        self.assertIs(get_rate_limiter('example.com', 9, 3), get_rate_limiter('example.com', 9, 3))
+        self.assertIsNot(get_rate_limiter('example.com', 9, 3), get_rate_limiter('example.org', 9, 3))
+
+    def test_shared_by_site(self):
+        self.assertEqual(get_site_key('static1.e621.net'), 'e621.net')
+        self.assertEqual(get_site_key('cdn.donmai.us:443'), 'donmai.us')
+        self.assertEqual(get_site_key('127.0.0.1:8080'), '127.0.0.1')
+
+        # the crawler (API host) and the downloader (image host) share one budget
+        crawler_limiter = get_rate_limiter('api.example.net', 9, 3)
+        output = io.StringIO()
+
+        with contextlib.redirect_stdout(output):
+            downloader_limiter = get_rate_limiter('static1.example.net', 12, 1)
+            get_rate_limiter('static2.example.net', 12, 1)
+
+        self.assertIs(downloader_limiter, crawler_limiter)
+        self.assertEqual((downloader_limiter.calls, downloader_limiter.period), (9, 3))
+
+        # other limits are reported once
+        self.assertEqual(len(output.getvalue().splitlines()), 1)
+
+    def test_multiplicative_decrease(self):
+        limiter = AdaptiveRateLimiter(calls=9, period=3)
+
+        self.assertTrue(limiter.feedback(429, {}))
+        self.assertAlmostEqual(limiter.rate, 1.5)
+        self.assertTrue(limiter.feedback(503, {}))
+        self.assertAlmostEqual(limiter.rate, 0.75)
+
+    def test_additive_increase_up_to_ceiling(self):
+        limiter = AdaptiveRateLimiter(calls=9, period=3, increase=0.5)
+        limiter.feedback(429, {'Retry-After': '0'})
+
+        self.assertFalse(limiter.feedback(200, {}))
+        self.assertAlmostEqual(limiter.rate, 2.0)
+
+        for _ in range(10):
+            limiter.feedback(200, {})
+
+        self.assertAlmostEqual(limiter.rate, 3.0)
+
+    def test_retry_after_pauses(self):
+        limiter = AdaptiveRateLimiter(calls=9, period=3)
+        limiter.feedback(429, {'Retry-After': '5'})
+
+        self.assertGreater(limiter.reserve(), 4.5)
+
+    def test_retry_after_headers(self):
+        self.assertEqual(get_retry_after({'Retry-After': '12'}), 12.0)
+        self.assertEqual(get_retry_after({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '3'}), 3.0)
+        self.assertIsNone(get_retry_after({'X-RateLimit-Remaining': '5', 'X-RateLimit-Reset': '3'}))
+        self.assertIsNone(get_retry_after({}))
+        self.assertGreater(get_retry_after({'Retry-After': 'Wed, 21 Oct 2099 07:28:00 GMT'}), 0)
+
+    def test_priority(self):
+        shared = PriorityRateLimiter(TokenBucket(calls=1, period=0.1))
+        high = shared.get_limiter(0)
+        low = shared.get_limiter(1)
+        finished = []
+
+        def acquire_high():
+            for _ in range(5):
+                high.acquire()
+
+            finished.append('high')
+
+        thread = threading.Thread(target=acquire_high)
+        thread.start()
+        time.sleep(0.02)
+
+        low.acquire()
+        finished.append('low')
+        thread.join()
+
+        self.assertEqual(finished, ['high', 'low'])
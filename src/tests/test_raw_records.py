@@ -0,0 +1,37 @@
+import json
+import unittest
+
+from crawl.crawler.raw_records import extract_records
+
+
+class RawRecordsTestCase(unittest.TestCase):
+    def test_wrapped_records(self):
+        body = '{"@attributes": {"limit": 2}, "post": [{"id":2,"tags":"a b"} , {"id":1,"name":"caf\\u00e9 ü"}]}'.encode('utf-8')
+        records = extract_records(body, 'post')
+
+        self.assertEqual([record['id'] for record in records], [2, 1])
+        self.assertEqual(records.raw, [b'{"id":2,"tags":"a b"}', '{"id":1,"name":"caf\\u00e9 ü"}'.encode('utf-8')])
+
+    def test_list_records(self):
+        records = extract_records(b' [ {"id": 5}, {"id": 4} ] ', None)
+
+        self.assertEqual(records.raw, [b'{"id": 5}', b'{"id": 4}'])
+
+    def test_missing_and_empty(self):
+        self.assertEqual(extract_records(b'{"@attributes": {}}', 'post'), [])
+        self.assertEqual(extract_records(b'{"posts": []}', 'posts'), [])
+        self.assertEqual(extract_records(b'[]', None), [])
+
+    def test_multiline_records(self):
+        records = extract_records(json.dumps({'posts': [{'id': 1, 'tags': ['a']}]}, indent=2).encode('utf-8'), 'posts')
+
+        self.assertEqual(records.raw, [b'{"id": 1, "tags": ["a"]}'])
+
+    def test_filter(self):
+        records = extract_records(b'[{"id":3},{"id":2},{"id":1}]', None).filter(lambda record: record['id'] >= 2)
+
+        self.assertEqual(records.raw, [b'{"id":3}', b'{"id":2}'])
+
+    def test_unexpected_shape(self):
+        with self.assertRaises(ValueError):
+            extract_records(b'{"tags": []}', None)
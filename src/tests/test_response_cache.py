@@ -0,0 +1,30 @@
+import tempfile
+import unittest
+
+from crawl.crawler.response_cache import ResponseCache
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(directory)
+            url = 'https://e621.net/posts.json?limit=320&page=b100'
+
+            self.assertIsNone(cache.load(url))
+
+            cache.save(url, b'{"posts": []}', {'etag': 'W/"abc"', 'last-modified': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+            cached = cache.load(url)
+
+            self.assertEqual(cached.body, b'{"posts": []}')
+            self.assertEqual(cached.get_conditional_headers(), {
+                'if-none-match': 'W/"abc"',
+                'if-modified-since': 'Wed, 21 Oct 2015 07:28:00 GMT'
+            })
+
+    def test_keyed_by_url(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(directory)
+            cache.save('https://e621.net/tags.json?page=1', b'[1]', {})
+
+            self.assertIsNone(cache.load('https://e621.net/tags.json?page=2'))
+            self.assertEqual(cache.load('https://e621.net/tags.json?page=1').get_conditional_headers(), {})
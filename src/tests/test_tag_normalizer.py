@@ -0,0 +1,49 @@
+import contextlib
+import io
+import unittest
+
+from database.entities.tag import TagProtoEntity, TagVersion
+from database.tag_normalizer.tag_normalizer import TagNormalizer
+from database.utils.enums import Source, Category
+
+
+def add_tag(normalizer: TagNormalizer, source_id: str, name: str, aliases: list):
+    proto_tag = TagProtoEntity(source=Source.E621, source_id=source_id, origin_name=name, reference_name=name, category=Category.GENERAL, post_count=1, aliases=aliases)
+    return normalizer.add_tag(normalizer.to_v2_tag(proto_tag), proto_tag, TagVersion.V2)
+
+
+class TagNormalizerTestCase(unittest.TestCase):
+    # the tag maps are shared by all TagNormalizer instances, so give each test fresh ones and put the old ones back afterwards
+    shared_maps = ['ref_map', 'id_map', 'original_map', 'deep_search_misses']
+
+    def setUp(self):
+        self.saved_maps = {name: getattr(TagNormalizer, name) for name in self.shared_maps}
+
+        for name in self.shared_maps:
+            setattr(TagNormalizer, name, {})
+
+    def tearDown(self):
+        for name, value in self.saved_maps.items():
+            setattr(TagNormalizer, name, value)
+
+    def test_deep_search(self):
+        normalizer = TagNormalizer(category_naming_order={Category.GENERAL.value: 0})
+        tag = add_tag(normalizer, 'deep-search-1', 'deep_search_tag', ['deep_search_alias'])
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertIs(normalizer.get_by_deep_search('deep_search_tag'), tag)
+            self.assertIs(normalizer.get_by_deep_search('deep_search_alias'), tag)
+            self.assertIsNone(normalizer.get_by_deep_search('deep_search_other'))
+
+            # tags added later are found as well
+            other_tag = add_tag(normalizer, 'deep-search-2', 'deep_search_other_tag', ['deep_search_other', 'deep_search_alias'])
+            self.assertIs(normalizer.get_by_deep_search('deep_search_other'), other_tag)
+
+            # the first tag with a matching alias wins
+            self.assertIs(normalizer.get_by_deep_search('deep_search_alias'), tag)
+
+        self.assertEqual(normalizer.deep_search_misses.get('deep_search_other'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,336 @@
+import json
+import mmap
+import os
+import re
+import struct
+from typing import Optional, List, Iterator, NamedTuple, Tuple
+
+# Sidecar index for JSONL files (`<file>.jsonl.idx`): an 8-byte header followed by one fixed-size entry per
+# record, in file order. An entry holds the record ID, the byte offset and length (including the newline) of
+# its line, and the MD5 of the image it describes (zeroes if the record has none), so that counts, slices and
+# ID/MD5 lookups don't need to parse the JSONL file itself.
+index_header = struct.Struct('<4sHH')
+index_entry = struct.Struct('<qQI16s')
+index_magic = b'DRIX'
+index_version = 1
+
+no_id = -1
+no_md5 = bytes(16)
+
+
+class IndexEntry(NamedTuple):
+    id: int
+    offset: int
+    length: int
+    md5: bytes
+
+
+def get_index_filename(filename: str) -> str:
+    return filename + '.idx'
+
+
+def get_record_id(record: dict, id_field: str = 'id') -> int:
+    value = record.get(id_field, record.get('source_id'))
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return no_id
+
+
+def get_record_md5(record: dict) -> bytes:
+    # crawled e621 posts keep it in `file.md5`, rule34 in `hash`, database posts in `origin_md5`
+    file = record.get('file')
+    value = record.get('md5', record.get('hash', record.get('origin_md5', file.get('md5') if isinstance(file, dict) else None)))
+
+    if isinstance(value, str) and re.match(r'^[0-9a-fA-F]{32}$', value):
+        return bytes.fromhex(value)
+
+    return no_md5
+
+
+class JsonlIndex:
+    """
+    Read-only, memory-mapped view of the sidecar index of a JSONL file
+    """
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.index_filename = get_index_filename(filename)
+
+        with open(self.index_filename, 'rb') as fp:
+            size = os.fstat(fp.fileno()).st_size
+
+            if size < index_header.size:
+                raise ValueError(f'{self.index_filename} is not a JSONL index')
+
+            self.mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, _) = index_header.unpack_from(self.mm, 0)
+
+        if magic != index_magic or version != index_version:
+            self.mm.close()
+            raise ValueError(f'{self.index_filename} is not a JSONL index (version {index_version})')
+
+        # a partially written trailing entry is ignored
+        self.count = (size - index_header.size) // index_entry.size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> IndexEntry:
+        if i < 0:
+            i += self.count
+
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+
+        return IndexEntry(*index_entry.unpack_from(self.mm, index_header.size + i * index_entry.size))
+
+    def __iter__(self) -> Iterator[IndexEntry]:
+        end = index_header.size + self.count * index_entry.size
+
+        for entry in index_entry.iter_unpack(self.mm[index_header.size:end]):
+            yield IndexEntry(*entry)
+
+    def close(self):
+        self.mm.close()
+
+    def get_end(self) -> int:
+        """
+        Byte offset up to which the JSONL file is indexed
+        """
+        if self.count == 0:
+            return 0
+
+        last = self[-1]
+        return last.offset + last.length
+
+    def is_current(self) -> bool:
+        return os.path.isfile(self.filename) and self.get_end() == os.path.getsize(self.filename)
+
+    def get_ids(self) -> List[int]:
+        return [entry.id for entry in self]
+
+    def read_lines(self, start: int = 0, stop: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Raw lines of records `start` ... `stop - 1`, read without scanning the rest of the file
+        """
+        stop = self.count if stop is None else min(stop, self.count)
+
+        if start >= stop:
+            return
+
+        with open(self.filename, 'rb') as fp:
+            fp.seek(self[start].offset)
+
+            for i in range(start, stop):
+                entry = self[i]
+
+                if fp.tell() != entry.offset:
+                    fp.seek(entry.offset)
+
+                yield fp.read(entry.length)
+
+    def get_byte_range(self, start: int = 0, stop: Optional[int] = None) -> Tuple[int, int]:
+        """
+        First and last (exclusive) byte of records `start` ... `stop - 1`
+        """
+        stop = self.count if stop is None else min(stop, self.count)
+
+        if start >= stop:
+            return 0, 0
+
+        last = self[stop - 1]
+        return self[start].offset, last.offset + last.length
+
+
+class JsonlIndexWriter:
+    """
+    Appends entries to the sidecar index of a JSONL file
+    """
+    def __init__(self, filename: str):
+        self.fp = open(get_index_filename(filename), 'ab')
+
+        if self.fp.tell() == 0:
+            self.fp.write(index_header.pack(index_magic, index_version, 0))
+
+    def add(self, record_id: int, offset: int, length: int, md5: bytes = no_md5):
+        self.fp.write(index_entry.pack(record_id, offset, length, md5))
+
+    def add_record(self, record: dict, offset: int, length: int, id_field: str = 'id'):
+        self.add(get_record_id(record, id_field), offset, length, get_record_md5(record))
+
+    def add_index(self, index: JsonlIndex, base_offset: int):
+        """
+        Copy the entries of another index, e.g. when concatenating JSONL files
+        """
+        for entry in index:
+            self.add(entry.id, entry.offset + base_offset, entry.length, entry.md5)
+
+    def flush(self):
+        self.fp.flush()
+
+    def close(self):
+        self.fp.close()
+
+
+class IndexedJsonlWriter:
+    """
+    Writes records to a JSONL file and keeps its sidecar index up to date (a drop-in for `ndjson.writer`)
+    """
+    def __init__(self, filename: str, id_field: str = 'id', append: bool = True, save_index: bool = True):
+        self.id_field = id_field
+
+        if not append and os.path.exists(get_index_filename(filename)):
+            os.remove(get_index_filename(filename))
+
+        # catch up on records written without an index before appending
+        if append and save_index:
+            update_index(filename, id_field)
+
+        self.fp = open(filename, 'ab' if append else 'wb')
+        self.offset = self.fp.seek(0, os.SEEK_END)
+        self.index_writer = JsonlIndexWriter(filename) if save_index else None
+
+    def writerow(self, record: dict):
+        self.write_line((json.dumps(record) + '\n').encode('utf-8'), record)
+
+    def write_line(self, line: bytes, record: dict):
+        self.fp.write(line)
+
+        if self.index_writer is not None:
+            self.index_writer.add_record(record, self.offset, len(line), self.id_field)
+
+        self.offset += len(line)
+
+    def flush(self):
+        self.fp.flush()
+
+        if self.index_writer is not None:
+            self.index_writer.flush()
+
+    def sync(self):
+        """
+        Flush the file and its index to disk, e.g. before recording a position in the file
+        """
+        self.flush()
+        os.fsync(self.fp.fileno())
+
+        if self.index_writer is not None:
+            os.fsync(self.index_writer.fp.fileno())
+
+    def close(self):
+        self.fp.close()
+
+        if self.index_writer is not None:
+            self.index_writer.close()
+
+
+def load_index(filename: str) -> Optional[JsonlIndex]:
+    """
+    Index of `filename`, if there is one and it covers the whole file
+    """
+    if not os.path.isfile(get_index_filename(filename)):
+        return None
+
+    try:
+        index = JsonlIndex(filename)
+    except ValueError:
+        return None
+
+    if not index.is_current():
+        index.close()
+        return None
+
+    return index
+
+
+def update_index(filename: str, id_field: str = 'id') -> int:
+    """
+    Bring the index of `filename` up to date and return the number of records. Entries beyond the end of the file
+    (e.g. after a crash or truncation) are dropped; lines that are not indexed yet are parsed and added.
+    """
+    index_filename = get_index_filename(filename)
+    file_size = os.path.getsize(filename) if os.path.isfile(filename) else 0
+    count = 0
+    end = 0
+
+    try:
+        index = JsonlIndex(filename) if os.path.isfile(index_filename) else None
+    except ValueError:
+        index = None
+
+    if index is not None:
+        # entries are in file order; keep the ones that still point to complete lines
+        count = len(index)
+
+        while count > 0 and index[count - 1].offset + index[count - 1].length > file_size:
+            count -= 1
+
+        end = index[count - 1].offset + index[count - 1].length if count > 0 else 0
+
+        # the file was replaced rather than appended to
+        if count > 0 and not is_line_at(filename, index[count - 1].offset, end):
+            (count, end) = (0, 0)
+
+        index.close()
+
+        with open(index_filename, 'r+b') as fp:
+            fp.truncate(index_header.size + count * index_entry.size)
+    elif os.path.isfile(index_filename):
+        os.remove(index_filename)
+
+    writer = JsonlIndexWriter(filename)
+
+    if end < file_size:
+        with open(filename, 'rb') as fp:
+            fp.seek(end)
+            offset = end
+
+            for line in fp:
+                # an incomplete last line (e.g. after a crash) is not indexed
+                if not line.endswith(b'\n'):
+                    break
+
+                if line.strip() != b'':
+                    try:
+                        writer.add_record(json.loads(line), offset, len(line), id_field)
+                    except ValueError:
+                        writer.add(no_id, offset, len(line))
+
+                    count += 1
+
+                offset += len(line)
+
+    writer.close()
+    return count
+
+
+def is_line_at(filename: str, offset: int, end: int) -> bool:
+    with open(filename, 'rb') as fp:
+        fp.seek(offset)
+        first = fp.read(1)
+        fp.seek(end - 1)
+
+        return first == b'{' and fp.read(1) == b'\n'
+
+
+def count_records(filename: str) -> int:
+    """
+    Number of records in a JSONL file; uses the index if it is current, otherwise counts lines without parsing them
+    """
+    index = load_index(filename)
+
+    if index is not None:
+        count = len(index)
+        index.close()
+        return count
+
+    count = 0
+
+    with open(filename, 'rb') as fp:
+        for line in fp:
+            if line.strip() != b'':
+                count += 1
+
+    return count
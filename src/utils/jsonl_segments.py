@@ -0,0 +1,216 @@
+import json
+import os
+from typing import List, Optional, Union
+
+from utils.jsonl_index import IndexedJsonlWriter, get_index_filename
+
+# Segmented JSONL output: instead of one growing file, records go to numbered segment files next to it
+# (`posts.jsonl` -> `posts-00001.jsonl`, `posts-00002.jsonl`, ...), listed in a manifest (`posts.jsonl.manifest.json`).
+# A segment is marked as finished once it is full (or the crawl is complete) and never changes afterwards, so later
+# steps can start on finished segments while a crawl is still writing the next one.
+
+
+def get_manifest_filename(filename: str) -> str:
+    return filename + '.manifest.json'
+
+
+def get_segment_filename(filename: str, number: int) -> str:
+    (base, extension) = os.path.splitext(filename)
+    return f'{base}-{number:05d}{extension}'
+
+
+def load_manifest(filename: str) -> Optional[dict]:
+    fn = get_manifest_filename(filename)
+
+    if not os.path.isfile(fn):
+        return None
+
+    with open(fn, 'r') as fp:
+        return json.load(fp)
+
+
+def save_manifest(filename: str, manifest: dict):
+    fn = get_manifest_filename(filename)
+    tmp_filename = fn + '.tmp'
+
+    with open(tmp_filename, 'w') as fp:
+        json.dump(manifest, fp, indent=2)
+
+    os.replace(tmp_filename, fn)
+
+
+def get_segment_path(filename: str, segment: dict) -> str:
+    # segment names are relative to the manifest, so that the output can be moved around
+    return os.path.join(os.path.dirname(filename), segment['file'])
+
+
+def expand_inputs(filenames: List[str], finished_only: bool = False) -> List[str]:
+    """
+    Replace segmented outputs in `filenames` by their segment files, in order; other files are returned as-is
+    """
+    expanded = []
+
+    for filename in filenames:
+        manifest = load_manifest(filename)
+
+        if manifest is None:
+            expanded.append(filename)
+            continue
+
+        for segment in manifest['segments']:
+            if segment['finished'] or not finished_only:
+                expanded.append(get_segment_path(filename, segment))
+
+    return expanded
+
+
+def get_jsonl_size(filename: str) -> Optional[int]:
+    """
+    Size of a JSONL file, or the total size of all segments of a segmented output; None if neither exists
+    """
+    manifest = load_manifest(filename)
+
+    if manifest is not None:
+        paths = [get_segment_path(filename, segment) for segment in manifest['segments']]
+        return sum([os.path.getsize(path) for path in paths if os.path.isfile(path)])
+
+    return os.path.getsize(filename) if os.path.isfile(filename) else None
+
+
+def truncate_jsonl(filename: str, size: int):
+    """
+    Cut a JSONL file -- or a segmented output, counting across its segments -- back to `size` bytes
+    """
+    manifest = load_manifest(filename)
+
+    if manifest is None:
+        with open(filename, 'r+b') as fp:
+            fp.truncate(size)
+
+        return
+
+    segments = []
+    start = 0
+
+    for segment in manifest['segments']:
+        path = get_segment_path(filename, segment)
+        segment_size = os.path.getsize(path) if os.path.isfile(path) else 0
+
+        if start >= size:
+            # segments past the cut are dropped entirely
+            for fn in [path, get_index_filename(path)]:
+                if os.path.exists(fn):
+                    os.remove(fn)
+
+            continue
+
+        if start + segment_size > size:
+            with open(path, 'r+b') as fp:
+                fp.truncate(size - start)
+
+            segment['finished'] = False
+
+        segments.append(segment)
+        start += segment_size
+
+    manifest['segments'] = segments
+    save_manifest(filename, manifest)
+
+
+class SegmentedJsonlWriter:
+    """
+    Writes records to numbered segment files of about `segment_size` bytes each (same interface as
+    `IndexedJsonlWriter`). Segments are only rotated in `rotate_if_full`, so the caller decides where a
+    segment may end, e.g. after a page of records.
+    """
+    def __init__(self, filename: str, id_field: str = 'id', segment_size: int = 1024 ** 3, save_index: bool = True):
+        if os.path.isfile(filename):
+            raise ValueError(f'{filename} already exists as a single file and cannot be continued in segments')
+
+        self.filename = filename
+        self.id_field = id_field
+        self.segment_size = segment_size
+        self.save_index = save_index
+        self.manifest = load_manifest(filename) or {'segments': []}
+        self.writer = None
+
+        # an unfinished last segment (e.g. after a crash) is continued; finished segments are never reopened
+        if len(self.manifest['segments']) > 0 and not self.manifest['segments'][-1]['finished']:
+            self.open_segment()
+        else:
+            self.add_segment()
+
+    def add_segment(self):
+        number = len(self.manifest['segments']) + 1
+        self.manifest['segments'].append({'file': os.path.basename(get_segment_filename(self.filename, number)), 'finished': False})
+        save_manifest(self.filename, self.manifest)
+        self.open_segment()
+
+    def open_segment(self):
+        paths = [get_segment_path(self.filename, segment) for segment in self.manifest['segments']]
+
+        # offsets are counted across all segments, like in a single file
+        self.base_offset = sum([os.path.getsize(path) for path in paths[:-1] if os.path.isfile(path)])
+        self.writer = IndexedJsonlWriter(paths[-1], self.id_field, save_index=self.save_index)
+
+    @property
+    def offset(self) -> int:
+        return self.base_offset + self.writer.offset
+
+    def writerow(self, record: dict):
+        self.writer.writerow(record)
+
+    def write_line(self, line: bytes, record: dict):
+        self.writer.write_line(line, record)
+
+    def rotate_if_full(self):
+        if self.writer.offset < self.segment_size:
+            return
+
+        self.finish_segment()
+        self.add_segment()
+
+    def finish_segment(self):
+        self.writer.sync()
+        self.writer.close()
+
+        self.manifest['segments'][-1]['finished'] = True
+        save_manifest(self.filename, self.manifest)
+
+    def flush(self):
+        self.writer.flush()
+
+    def sync(self):
+        self.writer.sync()
+
+    def close(self, finish: bool = True):
+        """
+        Close the current segment; with `finish=False` (e.g. after an error) it stays open for the next writer
+        """
+        # empty segments are not kept
+        if self.writer.offset == 0:
+            self.writer.close()
+
+            path = get_segment_path(self.filename, self.manifest['segments'][-1])
+
+            for fn in [path, get_index_filename(path)]:
+                if os.path.exists(fn):
+                    os.remove(fn)
+
+            self.manifest['segments'].pop()
+            save_manifest(self.filename, self.manifest)
+        elif finish:
+            self.finish_segment()
+        else:
+            self.writer.sync()
+            self.writer.close()
+
+
+def open_jsonl_writer(filename: str, id_field: str = 'id', segment_size: Optional[int] = None, save_index: bool = True) -> Union[IndexedJsonlWriter, SegmentedJsonlWriter]:
+    """
+    Appending writer for `filename`; writes segments if `segment_size` is set
+    """
+    if segment_size is not None:
+        return SegmentedJsonlWriter(filename, id_field, segment_size=segment_size, save_index=save_index)
+
+    return IndexedJsonlWriter(filename, id_field, save_index=save_index)
@@ -14,9 +14,10 @@ class Progress:
         self.bar.start()
 
     def update(self, completed: int = None, message: str = None):
-        self.count += 1
+        previous = self.count
+        self.count = completed if completed is not None else self.count + 1
 
-        if self.count % 100 == 0:
+        if self.count // 100 != previous // 100:
             now = time.time()
             delta = now - self.start
             rate = round(self.count / delta, 2)
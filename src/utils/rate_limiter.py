@@ -0,0 +1,235 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Allows bursts of up to `calls` requests and refills
+    at a rate of `calls` tokens per `period` seconds.
+    """
+    def __init__(self, calls: int, period: float):
+        self.calls = calls
+        self.period = period
+        self.rate = calls / period
+        self.tokens = float(calls)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(float(self.calls), self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self) -> float:
+        # take a token, possibly going into debt; returns the number of seconds the caller must wait
+        with self.lock:
+            self.refill()
+            self.tokens -= 1
+
+            if self.tokens >= 0:
+                return 0.0
+
+            return -self.tokens / self.rate
+
+    def try_acquire(self) -> bool:
+        # take a token only if one is available right now
+        with self.lock:
+            self.refill()
+
+            if self.tokens < 1:
+                return False
+
+            self.tokens -= 1
+            return True
+
+    def acquire(self) -> float:
+        wait = self.reserve()
+
+        if wait > 0:
+            time.sleep(wait)
+
+        return wait
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    """
+    Token bucket that adapts its rate to the server (AIMD): every successful response raises the rate by
+    `increase` calls/s up to the configured ceiling, every 429/503 response multiplies it by `decrease`.
+    `Retry-After` and exhausted rate limit headers pause all callers until the server is ready again.
+    """
+    def __init__(self, calls: int, period: float, increase: float = 0.1, decrease: float = 0.5, min_rate: float = 0.1):
+        super().__init__(calls=calls, period=period)
+        self.max_rate = self.rate
+        self.increase = increase
+        self.decrease = decrease
+        self.min_rate = min(min_rate, self.max_rate)
+        self.paused_until = 0.0
+
+    def reserve(self) -> float:
+        wait = super().reserve()
+
+        with self.lock:
+            return max(wait, self.paused_until - time.monotonic())
+
+    def feedback(self, status_code: int, headers: Optional[Mapping[str, str]] = None) -> bool:
+        """
+        Adjust the rate after a response; returns True if the request was rejected and should be retried.
+        """
+        headers = headers or {}
+        pause = get_retry_after(headers)
+        rejected = status_code in [429, 503]
+
+        with self.lock:
+            self.refill()
+
+            if rejected:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.tokens = min(self.tokens, 0.0)
+
+                if pause is None:
+                    pause = 1 / self.rate
+            elif pause is None:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+            if pause is not None:
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+
+        return rejected
+
+
+class PriorityRateLimiter:
+    """
+    Shares one rate limiter between callers with different priorities (0 is the highest). A caller only
+    reserves a request slot while no caller with a higher priority is waiting for one, so lower priorities
+    get the slots that the higher priorities leave unused (e.g. while their requests are in flight).
+    """
+    def __init__(self, limiter: AdaptiveRateLimiter):
+        self.limiter = limiter
+        self.condition = threading.Condition()
+        self.waiting: Dict[int, int] = {}
+
+    def get_limiter(self, priority: int) -> 'PrioritizedRateLimiter':
+        return PrioritizedRateLimiter(self, priority)
+
+    def acquire(self, priority: int) -> float:
+        started_at = time.monotonic()
+
+        with self.condition:
+            self.waiting[priority] = self.waiting.get(priority, 0) + 1
+
+            while any([count > 0 for (other, count) in self.waiting.items() if other < priority]):
+                self.condition.wait()
+
+        try:
+            wait = self.limiter.reserve()
+
+            if wait > 0:
+                time.sleep(wait)
+        finally:
+            with self.condition:
+                self.waiting[priority] -= 1
+                self.condition.notify_all()
+
+        return time.monotonic() - started_at
+
+
+class PrioritizedRateLimiter:
+    """
+    A caller's view of a `PriorityRateLimiter`; can be used in place of an `AdaptiveRateLimiter`
+    """
+    def __init__(self, parent: PriorityRateLimiter, priority: int):
+        self.parent = parent
+        self.priority = priority
+
+    @property
+    def rate(self) -> float:
+        return self.parent.limiter.rate
+
+    def acquire(self) -> float:
+        return self.parent.acquire(self.priority)
+
+    def feedback(self, status_code: int, headers: Optional[Mapping[str, str]] = None) -> bool:
+        return self.parent.limiter.feedback(status_code, headers)
+
+
+def get_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """
+    Number of seconds the server asks us to wait, based on `Retry-After` or exhausted rate limit headers.
+    """
+    headers = {key.lower(): value for (key, value) in headers.items()}
+    retry_after = headers.get('retry-after')
+
+    if retry_after is not None:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+
+    for prefix in ['x-ratelimit-', 'ratelimit-']:
+        remaining = headers.get(prefix + 'remaining')
+        reset = headers.get(prefix + 'reset')
+
+        if remaining is None or reset is None:
+            continue
+
+        try:
+            if float(remaining) > 0:
+                return None
+
+            reset = float(reset)
+        except ValueError:
+            continue
+
+        # either a UNIX timestamp or a number of seconds
+        return max(0.0, reset - time.time() if reset > 1000000000 else reset)
+
+    return None
+
+
+rate_limiters: Dict[str, AdaptiveRateLimiter] = {}
+rate_limiters_lock = threading.Lock()
+
+# sites whose limits have been requested with other values, reported once
+rate_limiter_conflicts = set()
+
+
+def get_site_key(host: str) -> str:
+    """
+    Request budget key of a host: its site domain, so that e.g. the API (`e621.net`) and the image
+    servers (`static1.e621.net`) of a site share one budget
+    """
+    hostname = host.rsplit(':', 1)[0] if host.count(':') == 1 else host
+    labels = hostname.lower().split('.')
+
+    # IP addresses and local names are kept as they are
+    if len(labels) <= 2 or all([label.isdigit() for label in labels]):
+        return hostname.lower()
+
+    return '.'.join(labels[-2:])
+
+
+def get_rate_limiter(host: str, calls: int, period: float) -> AdaptiveRateLimiter:
+    """
+    Rate limiter shared by all callers that talk to the same site. The first caller sets the limits;
+    later callers with other limits get the existing limiter, and a warning.
+    """
+    key = get_site_key(host)
+
+    with rate_limiters_lock:
+        if key not in rate_limiters:
+            rate_limiters[key] = AdaptiveRateLimiter(calls=calls, period=period)
+
+        limiter = rate_limiters[key]
+
+        if (limiter.calls, limiter.period) != (calls, period) and key not in rate_limiter_conflicts:
+            rate_limiter_conflicts.add(key)
+            print(f'Warning: {host} shares the request budget of {key} ({limiter.calls} calls per {limiter.period}s) -- ignoring {calls} calls per {period}s')
+
+        return limiter